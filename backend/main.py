@@ -15,76 +15,84 @@ from routes.phc_operations import phc_bp
 from routes.lab_operations import lab_bp
 from routes.reporting import reporting_bp
 
-# Initialize Firebase immediately on startup to log any errors
-try:
-    from services.firebase_service import firebase_service
-    logger_temp = logging.getLogger('firebase_init')
-    logger_temp.info("✓ Firebase service initialized successfully on startup")
-except Exception as e:
-    logger_temp = logging.getLogger('firebase_init')
-    logger_temp.error(f"✗ Firebase initialization FAILED on startup: {str(e)}", exc_info=True)
-
-app = Flask(__name__)
-
-# Enable detailed logging
-logging.basicConfig(level=logging.DEBUG)
+# Firebase is initialized lazily, per worker process, on the first request that
+# needs it. Importing the service here only sets up caches.
+from services.firebase_service import firebase_service
+
 logger = logging.getLogger(__name__)
 
-# Enable CORS with comprehensive setup
-CORS(app, 
-     origins=["https://luit-clean-water-plum.vercel.app", 
-              "https://luit-clean-water.vercel.app", 
-              "http://localhost:3000", 
-              "http://localhost:5173",
-              "http://localhost:5000"],
-     methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-     allow_headers=["Content-Type", "Authorization", "X-Requested-With"],
-     expose_headers=["Content-Type", "X-Total-Count"],
-     supports_credentials=True,
-     max_age=3600)
-
-
-# Configuration
-app.config['ENV'] = os.getenv('FLASK_ENV', 'development')
-app.config['DEBUG'] = app.config['ENV'] == 'development'
-
-# Register blueprints
-app.register_blueprint(auth_bp, url_prefix='/api/auth')
-app.register_blueprint(water_quality_bp, url_prefix='/api/water-quality')
-app.register_blueprint(phc_bp, url_prefix='/api/phc')
-app.register_blueprint(lab_bp, url_prefix='/api/lab')
-app.register_blueprint(reporting_bp, url_prefix='/api/reporting')
-
-@app.route('/api/health', methods=['GET'])
-def health_check():
-    """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'message': 'LUIT Clean Water Backend is running'}), 200
-
-@app.route('/api/debug/firebase', methods=['GET'])
-def debug_firebase():
-    """Debug Firebase initialization"""
-    try:
-        from services.firebase_service import firebase_service
-        logger.info("Firebase service initialized successfully")
-        return jsonify({
-            'status': 'Firebase initialized',
-            'timestamp': datetime.now().isoformat()
-        }), 200
-    except Exception as e:
-        logger.error(f"Firebase initialization error: {str(e)}", exc_info=True)
-        return jsonify({
-            'error': 'Firebase initialization failed',
-            'details': str(e),
-            'traceback': traceback.format_exc()
-        }), 500
-
-@app.errorhandler(404)
-def not_found(error):
-    return jsonify({'error': 'Not found', 'message': 'The requested resource was not found'}), 404
-
-@app.errorhandler(500)
-def internal_error(error):
-    return jsonify({'error': 'Internal server error', 'message': 'An unexpected error occurred'}), 500
+
+def create_app():
+    """Create and configure the Flask application"""
+    app = Flask(__name__)
+
+    # Enable detailed logging
+    logging.basicConfig(level=logging.DEBUG)
+
+    # Enable CORS with comprehensive setup
+    CORS(app,
+         origins=["https://luit-clean-water-plum.vercel.app",
+                  "https://luit-clean-water.vercel.app",
+                  "http://localhost:3000",
+                  "http://localhost:5173",
+                  "http://localhost:5000"],
+         methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+         allow_headers=["Content-Type", "Authorization", "X-Requested-With"],
+         expose_headers=["Content-Type", "X-Total-Count"],
+         supports_credentials=True,
+         max_age=3600)
+
+    # Configuration
+    app.config['ENV'] = os.getenv('FLASK_ENV', 'development')
+    app.config['DEBUG'] = app.config['ENV'] == 'development'
+
+    # Register blueprints
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(water_quality_bp, url_prefix='/api/water-quality')
+    app.register_blueprint(phc_bp, url_prefix='/api/phc')
+    app.register_blueprint(lab_bp, url_prefix='/api/lab')
+    app.register_blueprint(reporting_bp, url_prefix='/api/reporting')
+
+    @app.route('/api/health', methods=['GET'])
+    def health_check():
+        """Health check endpoint (does not touch Firebase)"""
+        return jsonify({'status': 'healthy', 'message': 'LUIT Clean Water Backend is running'}), 200
+
+    @app.route('/api/debug/firebase', methods=['GET'])
+    def debug_firebase():
+        """Debug Firebase initialization"""
+        try:
+            backend = firebase_service.backend
+            logger.info(f"Storage backend initialized successfully: {backend.name}")
+            live_view = firebase_service.live_view
+            return jsonify({
+                'status': 'Firebase initialized',
+                'backend': backend.name,
+                'liveView': live_view.status() if live_view else None,
+                'pid': os.getpid(),
+                'timestamp': datetime.now().isoformat()
+            }), 200
+        except Exception as e:
+            logger.error(f"Firebase initialization error: {str(e)}", exc_info=True)
+            return jsonify({
+                'error': 'Firebase initialization failed',
+                'details': str(e),
+                'traceback': traceback.format_exc()
+            }), 500
+
+    @app.errorhandler(404)
+    def not_found(error):
+        return jsonify({'error': 'Not found', 'message': 'The requested resource was not found'}), 404
+
+    @app.errorhandler(500)
+    def internal_error(error):
+        return jsonify({'error': 'Internal server error', 'message': 'An unexpected error occurred'}), 500
+
+    return app
+
+
+# Module-level app for `python main.py` and WSGI servers (e.g. `gunicorn main:app`)
+app = create_app()
 
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
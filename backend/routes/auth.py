@@ -24,6 +24,8 @@ def register():
         if not all([email, password, user_type, organization_name, district]):
             return jsonify({'error': 'Missing required fields'}), 400
         
+        firebase_service.initialize_app()
+        
         # Create Firebase Auth user
         user = auth.create_user(
             email=email,
@@ -79,6 +81,7 @@ def login():
         
         # Get custom token from Firebase Auth
         try:
+            firebase_service.initialize_app()
             user = auth.get_user_by_email(email)
             custom_token = auth.create_custom_token(user.uid)
             
@@ -115,6 +118,7 @@ def verify_token():
         if not token:
             return jsonify({'error': 'No token provided'}), 401
         
+        firebase_service.initialize_app()
         decoded_token = auth.verify_id_token(token)
         return jsonify({
             'success': True,
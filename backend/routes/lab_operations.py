@@ -1,6 +1,5 @@
 from flask import Blueprint, request, jsonify
 from services.firebase_service import firebase_service
-from firebase_admin import firestore
 from datetime import datetime
 from werkzeug.utils import secure_filename
 import os
@@ -16,25 +15,13 @@ def allowed_file(filename):
 
 @lab_bp.route('/assignments', methods=['GET'])
 def get_assignments():
-    """Get assignments for lab - Uses Firestore"""
+    """Get assignments for lab - Uses storage backend"""
     try:
         district = request.args.get('district')
         
         logger.info(f"Fetching lab assignments for district: {district}")
         
-        # Query Firestore collection
-        if district:
-            assignments_ref = firebase_service.db.collection('lab_assignments').where(
-                filter=firestore.FieldFilter('district', '==', district)
-            ).stream()
-        else:
-            assignments_ref = firebase_service.db.collection('lab_assignments').stream()
-        
-        # Convert to dictionary
-        assignments = {}
-        for doc in assignments_ref:
-            data = doc.to_dict()
-            assignments[doc.id] = data
+        assignments = firebase_service.get_lab_assignments(district)
         
         logger.info(f"Found {len(assignments)} lab assignments")
         
@@ -55,17 +42,16 @@ def get_assignments():
 
 @lab_bp.route('/assignment/<assignment_id>', methods=['GET'])
 def get_assignment_details(assignment_id):
-    """Get assignment details - Uses Firestore"""
+    """Get assignment details - Uses storage backend"""
     try:
-        doc_ref = firebase_service.db.collection('lab_assignments').document(assignment_id)
-        doc = doc_ref.get()
+        assignment = firebase_service.get_lab_assignment(assignment_id)
         
-        if not doc.exists:
+        if assignment is None:
             return jsonify({'error': 'Assignment not found'}), 404
         
         return jsonify({
             'success': True,
-            'data': doc.to_dict()
+            'data': assignment
         }), 200
     
     except Exception as e:
@@ -74,7 +60,7 @@ def get_assignment_details(assignment_id):
 
 @lab_bp.route('/upload-test-result/<assignment_id>', methods=['POST'])
 def upload_test_result(assignment_id):
-    """Upload test result PDF - Uses Firestore"""
+    """Upload test result PDF - Uses storage backend"""
     try:
         if 'file' not in request.files:
             return jsonify({'error': 'No file provided'}), 400
@@ -97,8 +83,7 @@ def upload_test_result(assignment_id):
         file.save(filepath)
         
         # Update assignment in Firestore
-        doc_ref = firebase_service.db.collection('lab_assignments').document(assignment_id)
-        doc_ref.update({
+        firebase_service.update_lab_assignment(assignment_id, {
             'testResultFile': filename,
             'testNotes': test_notes,
             'testResultUploadedAt': datetime.now().isoformat(),
@@ -117,7 +102,7 @@ def upload_test_result(assignment_id):
 
 @lab_bp.route('/upload-solution/<assignment_id>', methods=['POST'])
 def upload_solution(assignment_id):
-    """Upload solution PDF - Uses Firestore"""
+    """Upload solution PDF - Uses storage backend"""
     try:
         if 'file' not in request.files:
             return jsonify({'error': 'No file provided'}), 400
@@ -140,8 +125,7 @@ def upload_solution(assignment_id):
         file.save(filepath)
         
         # Update assignment in Firestore
-        doc_ref = firebase_service.db.collection('lab_assignments').document(assignment_id)
-        doc_ref.update({
+        firebase_service.update_lab_assignment(assignment_id, {
             'solutionFile': filename,
             'solutionDescription': solution_description,
             'solutionUploadedAt': datetime.now().isoformat(),
@@ -160,24 +144,17 @@ def upload_solution(assignment_id):
 
 @lab_bp.route('/confirm-clean/<assignment_id>', methods=['POST'])
 def confirm_clean(assignment_id):
-    """Confirm area is clean after re-testing - Uses Firestore"""
+    """Confirm area is clean after re-testing - Uses storage backend"""
     try:
         data = request.get_json()
         final_notes = data.get('finalNotes')
         
-        # Update assignment in Firestore
-        doc_ref = firebase_service.db.collection('lab_assignments').document(assignment_id)
-        doc_ref.update({
+        # Update assignment and mark all associated reports as clean in one batch
+        firebase_service.update_lab_assignment(assignment_id, {
             'status': 'cleaned',
             'finalNotes': final_notes,
             'labConfirmedCleanAt': datetime.now().isoformat()
-        })
-        
-        # Mark all associated reports as clean
-        assignment = doc_ref.get().to_dict()
-        if assignment and 'reportIds' in assignment:
-            for report_id in assignment['reportIds']:
-                firebase_service.update_report_status(report_id, 'cleaned')
+        }, report_status='cleaned')
         
         return jsonify({
             'success': True,
@@ -1,21 +1,37 @@
-from flask import Blueprint, request, jsonify
-from services.firebase_service import firebase_service
+from flask import Blueprint, Response, request, jsonify
+from services.firebase_service import firebase_service, ReportStatsMissingError
 from services.pincode_service import (
     get_coordinates_from_pincode,
     get_pincode_info,
     search_by_locality,
     search_by_district,
     add_pincode,
-    batch_get_coordinates
+    batch_get_coordinates,
+    resolve_pincodes,
+    iter_resolve_pincodes,
+    reverse_geocode,
+    batch_reverse_geocode,
+    search_pincodes
 )
-from firebase_admin import firestore
 from datetime import datetime
+import json
 from werkzeug.utils import secure_filename
 
 phc_bp = Blueprint('phc', __name__)
 
 ALLOWED_EXTENSIONS = {'pdf', 'doc', 'docx', 'jpg', 'jpeg', 'png'}
 
+# Limits for reverse geocoding requests
+MAX_REVERSE_GEOCODE_K = 20
+MAX_REVERSE_GEOCODE_BATCH = 5000
+
+# Most PIN codes returned by one search
+MAX_PINCODE_SEARCH_LIMIT = 500
+
+# Most PIN codes per batch-coordinates request, and per streamed (NDJSON) request
+MAX_BATCH_PINCODES = 5000
+MAX_STREAMED_PINCODES = 200000
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -23,16 +39,10 @@ def allowed_file(filename):
 def get_active_reports_by_district(district):
     """Get active reports for PHC's district"""
     try:
-        print(f"Fetching reports for district: {district}")
-        reports = firebase_service.get_water_quality_reports(district)
-        print(f"Total reports found: {len(reports) if reports else 0}")
-        if reports:
-            print(f"Reports: {reports}")
-        
-        # Show reports with status 'reported' or 'contaminated' that are still active
-        active_reports = {k: v for k, v in reports.items() if v.get('status') in ['reported', 'contaminated'] and v.get('active') is True}
-        print(f"Active reports after filtering: {len(active_reports)}")
-        print(f"Active reports data: {active_reports}")
+        print(f"Fetching active reports for district: {district}")
+        # Reports with status 'reported' or 'contaminated' that are still active, filtered by the query
+        active_reports = firebase_service.get_active_reports(district)
+        print(f"Active reports found: {len(active_reports)}")
         
         return jsonify({
             'success': True,
@@ -82,10 +92,6 @@ def send_to_lab():
             latitude = None
             longitude = None
         
-        # Update all reports to 'contaminated' status
-        for report_id in report_ids:
-            firebase_service.update_report_status(report_id, 'contaminated')
-        
         # Create lab assignment for the PIN code area
         lab_assignment = {
             'pinCode': pin_code,
@@ -106,7 +112,8 @@ def send_to_lab():
         
         print(f"  Storing assignment with: latitude={lab_assignment.get('latitude')}, longitude={lab_assignment.get('longitude')}")
         
-        assignment_id = firebase_service.add_lab_assignment(lab_assignment)
+        # Create the assignment and move all its reports to 'contaminated' in one batch
+        assignment_id = firebase_service.add_lab_assignment(lab_assignment, report_status='contaminated')
         
         print(f"  ✅ Lab assignment created with ID: {assignment_id}\n")
         
@@ -132,17 +139,14 @@ def mark_area_clean(report_id):
         firebase_service.update_report_status(report_id, 'clean')
         
         # Update lab assignment status
-        ref = firebase_service.db.reference('lab_assignments')
-        assignments = ref.get()
-        
-        if assignments:
-            for key, assignment in assignments.items():
-                if assignment.get('reportId') == report_id:
-                    firebase_service.db.reference(f'lab_assignments/{key}').update({
-                        'status': 'resolved',
-                        'phcVerifiedClean': True,
-                        'verifiedAt': datetime.now().isoformat()
-                    })
+        assignments = firebase_service.get_lab_assignments(report_id=report_id)
+        
+        for key in assignments:
+            firebase_service.update_lab_assignment(key, {
+                'status': 'resolved',
+                'phcVerifiedClean': True,
+                'verifiedAt': datetime.now().isoformat()
+            })
         
         return jsonify({
             'success': True,
@@ -172,14 +176,37 @@ def get_previous_solutions():
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+def parse_bbox(value):
+    """Parse a Leaflet bbox string 'west,south,east,north' into (min_lat, min_lon, max_lat, max_lon)"""
+    west, south, east, north = (float(part) for part in value.split(','))
+    return max(south, -90.0), max(west, -180.0), min(north, 90.0), min(east, 180.0)
+
 @phc_bp.route('/hotspot-map', methods=['GET'])
 def get_hotspot_map():
-    """Get hotspot map data"""
+    """
+    Get hotspot map data
+    
+    With a zoom parameter (and optionally bbox=west,south,east,north), returns
+    clusters sized for that zoom level instead of one point per report.
+    """
     try:
         district = request.args.get('district')
+        zoom = request.args.get('zoom', type=int)
+        
+        if zoom is not None:
+            bbox = request.args.get('bbox')
+            clusters = firebase_service.get_report_clusters(zoom, parse_bbox(bbox) if bbox else None, district)
+            return jsonify({
+                'success': True,
+                'clustered': True,
+                'data': clusters
+            }), 200
         
-        reports = firebase_service.get_water_quality_reports(district)
-        active = firebase_service.get_active_reports()
+        # Independent queries, fetched concurrently
+        reports, active = firebase_service.gather(
+            firebase_service.aget_water_quality_reports(district),
+            firebase_service.aget_active_reports(district)
+        )
         
         hotspots = []
         if reports:
@@ -202,41 +229,39 @@ def get_hotspot_map():
     
     except Exception as e:
         return jsonify({'error': str(e)}), 400
+
+
+def format_contaminated_area(data):
+    """Shape one lab assignment into a contaminated-area alert"""
+    return {
+        'pinCode': data.get('pinCode'),
+        'localityName': data.get('localityName'),
+        'district': data.get('district'),
+        'reportCount': data.get('reportCount'),
+        'severity': data.get('severity'),
+        'status': data.get('status'),
+        'latitude': float(data.get('latitude')),  # Ensure proper numeric type
+        'longitude': float(data.get('longitude'))  # Ensure proper numeric type
+    }
+
+def format_contaminated_areas(assignments):
+    """Shape lab assignments into the contaminated-area alerts the frontend maps"""
+    contaminated = {}
+    for assignment_id, data in assignments.items():
+        # Only include if we have coordinates - REQUIRED for the map and distance alerts
+        if data.get('latitude') is not None and data.get('longitude') is not None:
+            contaminated[assignment_id] = format_contaminated_area(data)
+        else:
+            print(f"WARNING: Missing coordinates for PIN {data.get('pinCode')} - skipping from alerts")
+    return contaminated
+
 @phc_bp.route('/contaminated-areas', methods=['GET'])
 def get_contaminated_areas():
     """Get all contaminated areas (sent to lab but not yet cleaned)"""
     try:
-        # Get all lab assignments that are still pending or in progress
-        assignments = firebase_service.db.collection('lab_assignments').where(
-            filter=firestore.FieldFilter('status', 'in', ['pending_lab_visit', 'solution_uploaded', 'phc_cleaning'])
-        ).stream()
-        
-        contaminated = {}
-        for doc in assignments:
-            data = doc.to_dict()
-            
-            # Extract latitude and longitude - REQUIRED for frontend distance calculation
-            latitude = data.get('latitude')
-            longitude = data.get('longitude')
-            
-            # Debug logging
-            pin_code = data.get('pinCode')
-            print(f"DEBUG: Area PIN {pin_code} - Lat: {latitude}, Lon: {longitude}")
-            
-            # Only include if we have coordinates
-            if latitude is not None and longitude is not None:
-                contaminated[doc.id] = {
-                    'pinCode': pin_code,
-                    'localityName': data.get('localityName'),
-                    'district': data.get('district'),
-                    'reportCount': data.get('reportCount'),
-                    'severity': data.get('severity'),
-                    'status': data.get('status'),
-                    'latitude': float(latitude),  # Ensure proper numeric type
-                    'longitude': float(longitude)  # Ensure proper numeric type
-                }
-            else:
-                print(f"WARNING: Missing coordinates for PIN {pin_code} - skipping from alerts")
+        # Get all lab assignments that are still pending or in progress (served from the live view)
+        assignments = firebase_service.get_contaminated_assignments()
+        contaminated = format_contaminated_areas(assignments)
         
         print(f"Total contaminated areas with valid coordinates: {len(contaminated)}")
         
@@ -253,16 +278,74 @@ def get_contaminated_areas():
             'success': True,
             'data': {}
         }), 200
+
+@phc_bp.route('/alerts-near', methods=['GET'])
+def get_alerts_near():
+    """Get contaminated areas within a radius (km) of the user, nearest first"""
+    try:
+        latitude = request.args.get('latitude', type=float)
+        longitude = request.args.get('longitude', type=float)
+        radius = request.args.get('radius', default=2.0, type=float)  # in km
+        
+        if latitude is None or longitude is None:
+            return jsonify({'error': 'Latitude and longitude required'}), 400
+        
+        # Answered from the spatial index over open lab assignments
+        alerts = []
+        for assignment_id, data, distance in firebase_service.get_contaminated_assignments_near(latitude, longitude, radius):
+            alert = format_contaminated_area(data)
+            alert['id'] = assignment_id
+            alert['distance'] = round(distance, 2)
+            alerts.append(alert)
+        
+        return jsonify({
+            'success': True,
+            'data': alerts
+        }), 200
+    
+    except Exception as e:
+        import logging
+        logging.error(f"Error fetching nearby alerts: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+
+@phc_bp.route('/dashboard/<district>', methods=['GET'])
+def get_dashboard(district):
+    """Get everything the PHC dashboard shows for a district in one call"""
+    try:
+        # Independent collections, fetched concurrently
+        active_reports, assignments, solutions, stats = firebase_service.gather(
+            firebase_service.aget_active_reports(district),
+            firebase_service.aget_contaminated_assignments(),
+            firebase_service.aget_lab_solutions(district),
+            firebase_service.aget_report_statistics()
+        )
+        empty = {'totalReports': 0, 'activeReports': 0, 'cleanAreas': 0}
+        
+        return jsonify({
+            'success': True,
+            'activeReports': active_reports,
+            'contaminatedAreas': format_contaminated_areas(assignments),
+            'previousSolutions': solutions,
+            'statistics': stats['districts'].get(district, empty)
+        }), 200
+    
+    except ReportStatsMissingError as e:
+        print(f"❌ {str(e)}")
+        return jsonify({'error': str(e)}), 503
+    
+    except Exception as e:
+        print(f"Error in get_dashboard: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+
 @phc_bp.route('/debug/contaminated-areas', methods=['GET'])
 def debug_contaminated_areas():
     """DEBUG: Get raw data from lab_assignments collection"""
     try:
-        assignments = firebase_service.db.collection('lab_assignments').stream()
+        assignments = firebase_service.get_lab_assignments()
         
         debug_data = {}
-        for doc in assignments:
-            data = doc.to_dict()
-            debug_data[doc.id] = {
+        for assignment_id, data in assignments.items():
+            debug_data[assignment_id] = {
                 'pinCode': data.get('pinCode'),
                 'localityName': data.get('localityName'),
                 'district': data.get('district'),
@@ -322,15 +405,54 @@ def get_pincode_coordinates(pincode):
 
 @phc_bp.route('/pincode/batch-coordinates', methods=['POST'])
 def get_batch_pincode_coordinates():
-    """Get coordinates for multiple PIN codes"""
+    """
+    Get coordinates for multiple PIN codes
+    
+    ?format=columnar returns one list per field for the distinct PIN codes;
+    ?format=ndjson streams those columns in chunks, one JSON object per line,
+    followed by a line of totals.
+    """
     try:
         data = request.json
         pincodes = data.get('pincodes', [])
+        output = request.args.get('format', 'map')
         
-        if not pincodes:
+        if not pincodes or not isinstance(pincodes, list):
             return jsonify({'error': 'No PIN codes provided'}), 400
+        if output not in ('map', 'columnar', 'ndjson'):
+            return jsonify({'error': 'Format must be one of: map, columnar, ndjson'}), 400
+        
+        max_pincodes = MAX_STREAMED_PINCODES if output == 'ndjson' else MAX_BATCH_PINCODES
+        if len(pincodes) > max_pincodes:
+            hint = '' if output == 'ndjson' else '; use format=ndjson for larger batches'
+            return jsonify({'error': f'At most {max_pincodes} PIN codes per request{hint}'}), 400
         
         print(f"🔍 Converting {len(pincodes)} PIN codes")
+        
+        if output == 'ndjson':
+            def generate():
+                total_unique = total_found = 0
+                for chunk in iter_resolve_pincodes(pincodes):
+                    total_unique += len(chunk['pincode']) + len(chunk['missing'])
+                    total_found += len(chunk['pincode'])
+                    yield json.dumps(chunk) + '\n'
+                yield json.dumps({
+                    'total_requested': len(pincodes),
+                    'total_unique': total_unique,
+                    'total_found': total_found
+                }) + '\n'
+            
+            return Response(generate(), mimetype='application/x-ndjson')
+        
+        if output == 'columnar':
+            results = resolve_pincodes(pincodes)
+            return jsonify({
+                'success': True,
+                'total_requested': len(pincodes),
+                'total_found': len(results['pincode']),
+                'data': results
+            }), 200
+        
         results = batch_get_coordinates(pincodes)
         
         return jsonify({
@@ -344,15 +466,103 @@ def get_batch_pincode_coordinates():
         return jsonify({'error': str(e)}), 500
 
 
+@phc_bp.route('/pincode/reverse', methods=['GET'])
+def reverse_geocode_pincode():
+    """Get the PIN codes nearest to a latitude/longitude"""
+    try:
+        latitude = request.args.get('latitude', type=float)
+        longitude = request.args.get('longitude', type=float)
+        k = min(request.args.get('k', default=1, type=int), MAX_REVERSE_GEOCODE_K)
+        
+        if latitude is None or longitude is None:
+            return jsonify({'error': 'Latitude and longitude required'}), 400
+        
+        result = reverse_geocode(latitude, longitude, k)
+        
+        if result['success']:
+            return jsonify({
+                'success': True,
+                'data': result['results']
+            }), 200
+        else:
+            return jsonify({
+                'success': False,
+                'error': result['error']
+            }), 400
+    
+    except Exception as e:
+        print(f"❌ Error in reverse geocoding: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+@phc_bp.route('/pincode/batch-reverse', methods=['POST'])
+def batch_reverse_geocode_pincodes():
+    """Get the nearest PIN codes for many coordinates, e.g. to tag legacy reports"""
+    try:
+        data = request.json
+        points = data.get('points', [])
+        k = min(int(data.get('k', 1)), MAX_REVERSE_GEOCODE_K)
+        
+        if not points:
+            return jsonify({'error': 'No points provided'}), 400
+        if len(points) > MAX_REVERSE_GEOCODE_BATCH:
+            return jsonify({'error': f'At most {MAX_REVERSE_GEOCODE_BATCH} points per request'}), 400
+        
+        print(f"🔍 Reverse geocoding {len(points)} points")
+        results = batch_reverse_geocode(points, k)
+        
+        return jsonify({
+            'success': True,
+            'total_requested': len(points),
+            'data': results
+        }), 200
+    
+    except Exception as e:
+        print(f"❌ Error in batch reverse geocoding: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+@phc_bp.route('/pincode/search/autocomplete', methods=['GET'])
+def autocomplete_pincodes():
+    """Suggest PIN codes for a partly typed or misspelt locality or district name"""
+    try:
+        query = request.args.get('q', '').strip()
+        field = request.args.get('field', 'locality')
+        limit = min(request.args.get('limit', default=10, type=int), MAX_PINCODE_SEARCH_LIMIT)
+        
+        if not query:
+            return jsonify({'error': 'Search text (q) required'}), 400
+        
+        result = search_pincodes(query, field, limit)
+        
+        if result['success']:
+            return jsonify({
+                'success': True,
+                'query': query,
+                'field': field,
+                'data': result['results']
+            }), 200
+        else:
+            return jsonify({
+                'success': False,
+                'error': result['error']
+            }), 400
+    
+    except Exception as e:
+        print(f"❌ Error in PIN code autocomplete: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
 @phc_bp.route('/pincode/search/locality/<locality>', methods=['GET'])
 def search_pincodes_by_locality(locality):
     """Search PIN codes by locality name"""
     try:
+        limit = min(request.args.get('limit', default=MAX_PINCODE_SEARCH_LIMIT, type=int), MAX_PINCODE_SEARCH_LIMIT)
         print(f"🔍 Searching PIN codes for locality: {locality}")
         pincodes = search_by_locality(locality)
         
         if pincodes:
-            results = batch_get_coordinates(pincodes)
+            results = batch_get_coordinates(pincodes[:max(limit, 1)])
             return jsonify({
                 'success': True,
                 'locality': locality,
@@ -375,11 +585,12 @@ def search_pincodes_by_locality(locality):
 def search_pincodes_by_district(district):
     """Search PIN codes by district name"""
     try:
+        limit = min(request.args.get('limit', default=MAX_PINCODE_SEARCH_LIMIT, type=int), MAX_PINCODE_SEARCH_LIMIT)
         print(f"🔍 Searching PIN codes for district: {district}")
         pincodes = search_by_district(district)
         
         if pincodes:
-            results = batch_get_coordinates(pincodes)
+            results = batch_get_coordinates(pincodes[:max(limit, 1)])
             return jsonify({
                 'success': True,
                 'district': district,
@@ -6,8 +6,8 @@ from services.sms_service import (
     validate_sms_data,
     get_sms_instructions
 )
+from services.sms_queue import get_sms_ingester, QueueFullError, FAILED, REJECTED
 from datetime import datetime
-import math
 import logging
 import traceback
 
@@ -15,14 +15,8 @@ logger = logging.getLogger(__name__)
 
 reporting_bp = Blueprint('reporting', __name__)
 
-def haversine_distance(lat1, lon1, lat2, lon2):
-    """Calculate distance between two coordinates in km"""
-    R = 6371  # Earth radius in km
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
-    c = 2 * math.asin(math.sqrt(a))
-    return R * c
+# Seconds a gateway is asked to wait before retrying when the SMS queue is full
+SMS_QUEUE_RETRY_AFTER = 60
 
 @reporting_bp.route('/submit-report', methods=['POST'])
 def submit_report():
@@ -52,6 +46,11 @@ def submit_report():
             'verified': False
         }
         
+        # Optional device location; a geohash is stored alongside it for proximity search
+        if data.get('latitude') is not None and data.get('longitude') is not None:
+            report_data['latitude'] = data.get('latitude')
+            report_data['longitude'] = data.get('longitude')
+        
         report_id = firebase_service.add_water_quality_report(report_data)
         
         return jsonify({
@@ -78,25 +77,8 @@ def get_nearby_reports():
         if latitude is None or longitude is None:
             return jsonify({'error': 'Latitude and longitude required'}), 400
         
-        reports = firebase_service.get_water_quality_reports()
-        nearby = []
-        
-        if reports:
-            for report_id, report in reports.items():
-                try:
-                    distance = haversine_distance(
-                        latitude, longitude,
-                        float(report['latitude']), float(report['longitude'])
-                    )
-                    
-                    if distance <= radius:
-                        report['id'] = report_id
-                        report['distance'] = round(distance, 2)
-                        nearby.append(report)
-                except:
-                    pass
-        
-        nearby.sort(key=lambda x: x['distance'])
+        # Geohash range queries on the reports collection (see FirebaseService._reports_near)
+        nearby = firebase_service.get_nearby_reports(latitude, longitude, radius)
         
         return jsonify({
             'success': True,
@@ -110,14 +92,13 @@ def get_nearby_reports():
 def upvote_report(report_id):
     """Upvote a report to indicate it's still active"""
     try:
-        ref = firebase_service.db.reference(f'water_quality_reports/{report_id}')
-        report = ref.get()
+        report = firebase_service.get_water_quality_report(report_id)
         
         if not report:
             return jsonify({'error': 'Report not found'}), 404
         
         current_upvotes = report.get('upvotes', 0)
-        ref.update({'upvotes': current_upvotes + 1})
+        firebase_service.update_water_quality_report(report_id, {'upvotes': current_upvotes + 1})
         
         return jsonify({
             'success': True,
@@ -130,16 +111,19 @@ def upvote_report(report_id):
 
 @reporting_bp.route('/reported-issues', methods=['GET'])
 def get_reported_issues():
-    """Get all reported issues"""
+    """Get reported issues, newest first, one page at a time"""
     try:
         district = request.args.get('district')
+        limit = request.args.get('limit', type=int)
+        cursor = request.args.get('cursor')
         
-        reports = firebase_service.get_water_quality_reports(district)
-        issues = [{'id': k, **v} for k, v in (reports or {}).items()]
+        reports, next_cursor = firebase_service.get_water_quality_reports_page(district, limit, cursor)
+        issues = [{'id': k, **v} for k, v in reports.items()]
         
         return jsonify({
             'success': True,
-            'issues': issues
+            'issues': issues,
+            'nextCursor': next_cursor
         }), 200
     
     except Exception as e:
@@ -236,8 +220,7 @@ def parse_incoming_sms():
         
         # Save to database
         try:
-            doc_ref = firebase_service.db.collection('water_quality_reports').document()
-            doc_ref.set({
+            report_id = firebase_service.add_water_quality_report({
                 'problem': report_data.get('problem'),
                 'sourceType': report_data.get('sourceType'),
                 'pinCode': report_data.get('pinCode'),
@@ -252,12 +235,12 @@ def parse_incoming_sms():
                 'verified': False
             })
             
-            print(f"✅ SMS report saved successfully: {doc_ref.id}")
+            print(f"✅ SMS report saved successfully: {report_id}")
             
             return jsonify({
                 'success': True,
                 'message': f'Report received and saved successfully!',
-                'reportId': doc_ref.id,
+                'reportId': report_id,
                 'data': {
                     'pinCode': report_data.get('pinCode'),
                     'problem': report_data.get('problem'),
@@ -321,6 +304,7 @@ def sms_webhook():
         if 'application/x-www-form-urlencoded' in content_type:
             from_number = request.form.get('From')
             message_body = request.form.get('Body')
+            external_id = request.form.get('MessageSid')
             provider = 'twilio'
             print(f"📱 Twilio SMS from {from_number}: {message_body[:50]}...")
         
@@ -329,6 +313,7 @@ def sms_webhook():
             data = request.get_json()
             from_number = data.get('from') or data.get('phone')
             message_body = data.get('message') or data.get('body') or data.get('Message')
+            external_id = data.get('messageId') or data.get('MessageId')
             provider = data.get('provider', 'custom')
             print(f"📱 JSON SMS from {from_number}: {message_body[:50]}...")
         
@@ -346,55 +331,35 @@ def sms_webhook():
                 'error': 'No message body found'
             }), 400
         
-        # Parse and save the SMS
-        parse_result = parse_sms_report(message_body)
-        
-        if not parse_result['success']:
-            print(f"❌ Failed to parse webhook SMS: {parse_result.get('error')}")
-            # Still return 200 to prevent retries
-            return jsonify({
-                'success': False,
-                'error': parse_result.get('error'),
-                'message': 'SMS format invalid. Please check instructions.'
-            }), 200
-        
-        # Validate and save
-        validation = validate_sms_data(parse_result['data'])
-        
-        if not validation['valid']:
-            print(f"❌ Webhook SMS validation failed: {validation.get('errors')}")
-            return jsonify({
-                'success': False,
-                'errors': validation.get('errors')
-            }), 200
-        
-        report_data = validation['data']
-        report_data['reportedBy'] = f'SMS:{from_number}' if from_number else 'SMS'
-        
-        # Save to database
-        doc_ref = firebase_service.db.collection('water_quality_reports').document()
-        doc_ref.set({
-            'problem': report_data.get('problem'),
-            'sourceType': report_data.get('sourceType'),
-            'pinCode': report_data.get('pinCode'),
-            'localityName': report_data.get('localityName', 'Unknown'),
-            'district': report_data.get('district', 'Unknown'),
-            'status': 'reported',
-            'reportedAt': datetime.now().isoformat(),
-            'reportedBy': report_data.get('reportedBy'),
-            'description': report_data.get('description', ''),
-            'active': True,
-            'upvotes': 0,
-            'verified': False
-        })
-        
-        print(f"✅ Webhook SMS saved: {doc_ref.id} from {from_number}")
+        # Durably queue the SMS and reply at once; SMS ingester threads parse
+        # and save it, so bursts do not push the gateway past its timeout
+        ingester = get_sms_ingester()
+        try:
+            queue_id, report_id, duplicate = ingester.queue.enqueue(
+                message_body, sender=from_number, provider=provider, external_id=external_id
+            )
+        except QueueFullError as e:
+            print(f"⚠️ SMS queue full, asking gateway to retry: {str(e)}")
+            response = jsonify({'success': False, 'error': str(e)})
+            response.headers['Retry-After'] = str(SMS_QUEUE_RETRY_AFTER)
+            return response, 503
+        except Exception as e:
+            # Not stored, so the gateway must retry rather than get a 200
+            print(f"❌ Could not queue webhook SMS: {str(e)}")
+            response = jsonify({'success': False, 'error': 'SMS could not be queued'})
+            response.headers['Retry-After'] = str(SMS_QUEUE_RETRY_AFTER)
+            return response, 503
+        ingester.notify()
+        
+        print(f"✅ Webhook SMS queued: {queue_id} from {from_number}{' (duplicate)' if duplicate else ''}")
         
         # Return success (Twilio/AWS expect 200 OK)
         return jsonify({
             'success': True,
             'message': 'Report received successfully',
-            'reportId': doc_ref.id
+            'queued': True,
+            'queueId': queue_id,
+            'reportId': report_id
         }), 200
     
     except Exception as e:
@@ -407,6 +372,65 @@ def sms_webhook():
         }), 200
 
 
+@reporting_bp.route('/sms/queue', methods=['GET'])
+def get_sms_queue_status():
+    """SMS queue backlog, throughput and ingester state for this process"""
+    try:
+        ingester = get_sms_ingester()
+        return jsonify({
+            'success': True,
+            'queue': ingester.queue.metrics(),
+            'ingester': ingester.status()
+        }), 200
+    
+    except Exception as e:
+        print(f"❌ Error getting SMS queue status: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+@reporting_bp.route('/sms/queue/failed', methods=['GET'])
+def get_failed_sms():
+    """SMS whose report could not be saved, most recent first"""
+    try:
+        limit = min(request.args.get('limit', 100, type=int), 1000)
+        return jsonify({
+            'success': True,
+            'messages': get_sms_ingester().queue.failed(limit)
+        }), 200
+    
+    except Exception as e:
+        print(f"❌ Error listing failed SMS: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+@reporting_bp.route('/sms/queue/replay', methods=['POST'])
+def replay_sms():
+    """
+    Queue failed SMS again
+    
+    JSON body (optional): {"ids": [queue IDs], "includeRejected": true}
+    Without ids every failed message is replayed; includeRejected also
+    re-parses messages rejected as invalid, e.g. after a parser fix.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        ids = data.get('ids')
+        if ids is not None and (not isinstance(ids, list) or not all(isinstance(i, int) for i in ids)):
+            return jsonify({'error': 'ids must be a list of queue IDs'}), 400
+        statuses = (FAILED, REJECTED) if data.get('includeRejected') else (FAILED, )
+        
+        ingester = get_sms_ingester()
+        replayed = ingester.queue.replay(ids, statuses)
+        ingester.notify()
+        
+        print(f"✅ Replaying {replayed} SMS")
+        return jsonify({'success': True, 'replayed': replayed}), 200
+    
+    except Exception as e:
+        print(f"❌ Error replaying SMS: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
 @reporting_bp.route('/sms/config', methods=['GET'])
 def get_sms_config():
     """Get SMS configuration (phone number, provider info)"""
@@ -1,5 +1,6 @@
-from flask import Blueprint, request, jsonify
-from services.firebase_service import firebase_service
+from flask import Blueprint, Response, request, jsonify
+from services.firebase_service import firebase_service, TILE_LAYERS, ReportStatsMissingError
+from services.tiles import valid_tile
 from datetime import datetime
 import logging
 import traceback
@@ -10,15 +11,18 @@ water_quality_bp = Blueprint('water_quality', __name__)
 
 @water_quality_bp.route('/reports', methods=['GET'])
 def get_reports():
-    """Get water quality reports"""
+    """Get water quality reports, newest first, one page at a time"""
     try:
         district = request.args.get('district')
+        limit = request.args.get('limit', type=int)
+        cursor = request.args.get('cursor')
         
-        reports = firebase_service.get_water_quality_reports(district)
+        reports, next_cursor = firebase_service.get_water_quality_reports_page(district, limit, cursor)
         
         return jsonify({
             'success': True,
-            'data': reports
+            'data': reports,
+            'nextCursor': next_cursor
         }), 200
     
     except Exception as e:
@@ -50,16 +54,8 @@ def get_area_status():
         if latitude is None or longitude is None:
             return jsonify({'error': 'Latitude and longitude required'}), 400
         
-        reports = firebase_service.get_active_reports()
-        
-        # Simple distance check (can be improved with actual geofencing)
-        contaminated_areas = []
-        for report_id, report in reports.items():
-            if 'latitude' in report and 'longitude' in report:
-                # Check if within radius (simplified)
-                if abs(float(report['latitude']) - latitude) < radius and \
-                   abs(float(report['longitude']) - longitude) < radius:
-                    contaminated_areas.append(report)
+        # Active reports within radius km, answered from the spatial index over active reports
+        contaminated_areas = firebase_service.get_active_reports_near(latitude, longitude, radius)
         
         status = 'contaminated' if contaminated_areas else 'clean'
         
@@ -80,29 +76,22 @@ def get_statistics():
     try:
         district = request.args.get('district')
         
-        # Get all reports for the district
-        reports = firebase_service.get_water_quality_reports(district)
-        
-        total_reports = len(reports) if reports else 0
-        
-        # Active issues = reports with status 'reported' or 'contaminated' AND active=True
-        active_issues = 0
-        cleaned_areas = 0
-        
-        if reports:
-            for report in reports.values():
-                if report.get('status') in ['reported', 'contaminated'] and report.get('active') is True:
-                    active_issues += 1
-                elif report.get('status') == 'cleaned':
-                    cleaned_areas += 1
+        stats = firebase_service.get_report_statistics()
+        empty = {'totalReports': 0, 'activeReports': 0, 'cleanAreas': 0}
+        summary = stats['districts'].get(district, empty) if district else stats['all']
         
         return jsonify({
             'success': True,
-            'totalReports': total_reports,
-            'activeReports': active_issues,
-            'cleanAreas': cleaned_areas
+            'totalReports': summary['totalReports'],
+            'activeReports': summary['activeReports'],
+            'cleanAreas': summary['cleanAreas'],
+            'districts': stats['districts']
         }), 200
     
+    except ReportStatsMissingError as e:
+        logger.error(str(e))
+        return jsonify({'error': str(e)}), 503
+    
     except Exception as e:
         logger.error(f"Error fetching statistics: {str(e)}", exc_info=True)
         return jsonify({'error': str(e), 'traceback': traceback.format_exc()}), 400
@@ -112,15 +101,39 @@ def get_reported_issues_alias():
     """Get reported issues (alias to reporting endpoint)"""
     try:
         district = request.args.get('district')
+        limit = request.args.get('limit', type=int)
+        cursor = request.args.get('cursor')
         
-        reports = firebase_service.get_water_quality_reports(district)
-        issues = [{'id': k, **v} for k, v in (reports or {}).items()]
+        reports, next_cursor = firebase_service.get_water_quality_reports_page(district, limit, cursor)
+        issues = [{'id': k, **v} for k, v in reports.items()]
         
         return jsonify({
             'success': True,
-            'issues': issues
+            'issues': issues,
+            'nextCursor': next_cursor
         }), 200
     
     except Exception as e:
         logger.error(f"Error fetching reported issues: {str(e)}", exc_info=True)
         return jsonify({'error': str(e), 'traceback': traceback.format_exc()}), 400
+
+@water_quality_bp.route('/tiles/<layer>/<int:z>/<int:x>/<int:y>.geojson', methods=['GET'])
+def get_tile(layer, z, x, y):
+    """Get one z/x/y map tile of reports or active lab assignments as GeoJSON"""
+    try:
+        if layer not in TILE_LAYERS:
+            return jsonify({'error': f'Unknown layer: {layer}'}), 404
+        if not valid_tile(z, x, y):
+            return jsonify({'error': 'Invalid tile coordinates'}), 400
+        
+        body, etag = firebase_service.get_tile(layer, z, x, y)
+        
+        # Shared caches may store tiles but must revalidate; unchanged tiles get a 304
+        response = Response(body, mimetype='application/geo+json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'public, no-cache'
+        return response.make_conditional(request)
+    
+    except Exception as e:
+        logger.error(f"Error rendering tile: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e), 'traceback': traceback.format_exc()}), 400
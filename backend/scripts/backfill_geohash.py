@@ -0,0 +1,31 @@
+"""
+Store a geohash on reports and lab assignments written before geohashes were added
+
+Run from the backend directory:
+    python -m scripts.backfill_geohash
+"""
+
+import logging
+
+from services.firebase_service import firebase_service
+from services.geo import document_geohash
+
+logging.basicConfig(level=logging.INFO)
+
+COLLECTIONS = ['water_quality_reports', 'lab_assignments']
+
+
+def backfill(collection):
+    writes = []
+    for doc_id, data in firebase_service.backend.query(collection):
+        geohash = document_geohash(data)
+        if geohash and data.get('geohash') != geohash:
+            writes.append(('update', collection, doc_id, {'geohash': geohash}))
+    firebase_service.backend.commit_batch(writes)
+    return len(writes)
+
+
+if __name__ == '__main__':
+    for collection in COLLECTIONS:
+        print(f"{collection}: {backfill(collection)} documents updated")
+    firebase_service.report_cache.clear()
@@ -0,0 +1,55 @@
+"""
+Geocode reports and lab assignments stored without coordinates from their PIN code
+
+Fills latitude/longitude (plus geohash, and district/locality where they
+were missing) in batched writes, a page of documents at a time. Report
+counters are rebuilt afterwards if any report's district changed.
+
+Run from the backend directory:
+    python -m scripts.backfill_locations
+"""
+
+import logging
+
+from services.firebase_service import firebase_service
+from services.geo import document_geohash
+from services.pincode_service import location_fields
+from services.storage_backend import DOCUMENT_ID, ASCENDING, MAX_BATCH_OPERATIONS
+
+logging.basicConfig(level=logging.INFO)
+
+COLLECTIONS = ['water_quality_reports', 'lab_assignments']
+
+
+def backfill(collection):
+    """Returns (documents updated, whether any district changed)"""
+    backend = firebase_service.backend
+    updated = 0
+    district_changed = False
+    start_after = None
+    while True:
+        page = backend.query(collection, order_by=[(DOCUMENT_ID, ASCENDING)],
+                             limit=MAX_BATCH_OPERATIONS, start_after=start_after)
+        writes = []
+        for doc_id, data in page:
+            fields = location_fields(data)
+            if not fields:
+                continue
+            fields['geohash'] = document_geohash(fields)
+            district_changed = district_changed or 'district' in fields
+            writes.append(('update', collection, doc_id, fields))
+        backend.commit_batch(writes)
+        updated += len(writes)
+        if len(page) < MAX_BATCH_OPERATIONS:
+            return updated, district_changed
+        start_after = {DOCUMENT_ID: page[-1][0]}
+
+
+if __name__ == '__main__':
+    for collection in COLLECTIONS:
+        updated, district_changed = backfill(collection)
+        print(f"{collection}: {updated} documents geocoded")
+        if collection == 'water_quality_reports' and district_changed:
+            firebase_service.rebuild_report_stats()
+            print("report_stats rebuilt")
+    firebase_service.report_cache.clear()
@@ -0,0 +1,37 @@
+"""
+Compare the scalar and vectorized haversine implementations
+
+Run from the backend directory:
+    python -m scripts.benchmark_haversine
+"""
+
+import random
+import time
+
+from services.distance import haversine_distances
+from services.geo import haversine_distance
+
+SIZES = [10_000, 100_000, 1_000_000]
+
+# Points scattered over Assam, queried from Guwahati
+ORIGIN = (26.1445, 91.7362)
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    random.seed(0)
+    print(f"{'points':>10} {'scalar (s)':>12} {'vectorized (s)':>15} {'speedup':>8} {'max diff (km)':>14}")
+    for size in SIZES:
+        latitudes = [random.uniform(24.0, 28.0) for _ in range(size)]
+        longitudes = [random.uniform(89.7, 96.1) for _ in range(size)]
+        scalar, scalar_time = timed(lambda: [
+            haversine_distance(ORIGIN[0], ORIGIN[1], lat, lon) for lat, lon in zip(latitudes, longitudes)
+        ])
+        vectorized, vectorized_time = timed(lambda: haversine_distances(ORIGIN[0], ORIGIN[1], latitudes, longitudes))
+        max_diff = max(abs(a - b) for a, b in zip(scalar, vectorized))
+        print(f"{size:>10} {scalar_time:>12.4f} {vectorized_time:>15.4f} {scalar_time / vectorized_time:>7.1f}x {max_diff:>14.2e}")
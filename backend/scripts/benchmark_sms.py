@@ -0,0 +1,166 @@
+"""
+Benchmark SMS parsing on a corpus shaped like the gateway's bulk dumps
+
+The corpus mixes the compact format, the structured text produced by the
+"Generate SMS Format" button, hand-typed single-line and lower-case
+messages with Windows line endings, incomplete reports and unrelated SMS.
+Each message is also parsed by baseline_parse_sms, the parser that
+preceded the single-pass tokenizer, to time it and compare the output.
+
+Run from the backend directory:
+    python -m scripts.benchmark_sms [messages] [--write corpus.jsonl]
+"""
+
+import json
+import logging
+import random
+import re
+import sys
+import time
+from datetime import datetime
+
+from services.sms_service import format_report_to_sms, parse_sms_report, parse_sms_batch
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZE = 50_000
+
+# Fields compared between the baseline and the current parser
+COMPARED_FIELDS = ('pinCode', 'problem', 'sourceType', 'description', 'localityName')
+
+PINCODES = ['781001', '781006', '781014', '781101', '782001', '784101', '781301', '783370', '785001', '786001']
+LOCALITIES = ['Guwahati', 'Dispur', 'Rangia', 'Nagaon', 'Tezpur', 'Barpeta', 'Kokrajhar', 'Jorhat', 'Dibrugarh', '']
+PROBLEMS = ['Muddy water', 'Reddish brown water', 'Pungent smell', 'Metallic taste', 'Health symptom']
+SOURCES = ['Handpump', 'Dug well/Open well', 'Tube well/Borewell', 'Piped water supply', 'River water', 'Ponds/Reservoir']
+DESCRIPTIONS = [
+    '', 'Water smells bad since 3 days', 'Children have diarrhoea', 'Yellow colour after rain',
+    'Pani khub letera', 'Many families affected near the school', 'Oily layer on top'
+]
+UNRELATED = [
+    'Your OTP is 482913. Do not share it with anyone.',
+    'Recharge successful. Balance Rs 149.00',
+    'HELP',
+    'water problem in our village please come',
+    ''
+]
+
+
+def baseline_parse_sms(sms_text):
+    """
+    The previous parser: one regex search per field, a log line per message
+
+    Kept to time the single-pass tokenizer against it and to show which
+    messages now parse differently. Returns parse_sms_report-style results.
+    """
+    if not sms_text or not isinstance(sms_text, str):
+        return {'success': False, 'error': 'Invalid SMS text', 'data': None, 'format_detected': None}
+    sms_text = sms_text.strip()
+
+    if sms_text.startswith('WQ|'):
+        parts = sms_text.split('|')
+        if len(parts) < 4:
+            return {'success': False, 'error': 'Invalid compact format', 'data': None, 'format_detected': 'compact'}
+        logger.info(f"✅ Parsed compact SMS format for PIN {parts[1].strip()}")
+        return {'success': True, 'error': None, 'format_detected': 'compact', 'data': {
+            'pinCode': parts[1].strip(), 'problem': parts[2].strip(), 'sourceType': parts[3].strip(),
+            'description': parts[4].strip() if len(parts) > 4 else '', 'reportedAt': datetime.now().isoformat(),
+            'reportedBy': 'SMS', 'localityName': 'Unknown', 'district': 'Unknown'
+        }}
+
+    if 'PIN' not in sms_text.upper() and 'CODE' not in sms_text.upper():
+        return {'success': False, 'error': 'Unrecognized SMS format', 'data': None, 'format_detected': 'unknown'}
+
+    def field(pattern):
+        match = re.search(pattern, sms_text, re.IGNORECASE)
+        return match.group(1).strip() if match else None
+
+    data = {
+        'pinCode': field(r'PIN\s*(?:CODE)?:\s*(\d+)'),
+        'problem': field(r'ISSUE\s*(?:TYPE)?:\s*([^\n]+)') or field(r'PROBLEM:\s*([^\n]+)'),
+        'sourceType': field(r'SOURCE\s*(?:TYPE)?:\s*([^\n]+)'),
+        'description': field(r'DESCRIPTION:\s*([^\n]+)') or '',
+        'localityName': field(r'LOCATION:\s*([^\n]+)') or 'Unknown',
+        'district': 'Unknown',
+        'reportedAt': datetime.now().isoformat(),
+        'reportedBy': 'SMS'
+    }
+    for required in ('pinCode', 'problem', 'sourceType'):
+        if not data[required]:
+            return {'success': False, 'error': f'{required} not found', 'data': None, 'format_detected': 'structured'}
+    logger.info(f"✅ Parsed structured SMS format for PIN {data['pinCode']}")
+    return {'success': True, 'error': None, 'format_detected': 'structured', 'data': data}
+
+
+def build_corpus(size, seed=0):
+    """size messages in a fixed, realistic mix"""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        pincode = rng.choice(PINCODES)
+        problem = rng.choice(PROBLEMS)
+        source = rng.choice(SOURCES)
+        description = rng.choice(DESCRIPTIONS)
+        kind = rng.random()
+        if kind < 0.35:
+            corpus.append(f'WQ|{pincode}|{problem}|{source}|{description}')
+        elif kind < 0.65:
+            corpus.append(format_report_to_sms({
+                'pinCode': pincode, 'problem': problem, 'sourceType': source,
+                'localityName': rng.choice(LOCALITIES), 'description': description
+            })['sms_format'])
+        elif kind < 0.80:
+            corpus.append(f'PIN: {pincode} ISSUE: {problem} SOURCE: {source} {description}'.strip())
+        elif kind < 0.90:
+            corpus.append(f'pin code:{pincode}\r\nproblem: {problem.lower()}\r\nsource type : {source.lower()}\r\n'
+                          f'location: {rng.choice(LOCALITIES)}')
+        elif kind < 0.95:
+            corpus.append(f'PIN CODE: {pincode}\nISSUE: {problem}')
+        else:
+            corpus.append(rng.choice(UNRELATED))
+    return corpus
+
+
+def same_fields(old, new):
+    """Whether two parse results agree on success and on COMPARED_FIELDS"""
+    if old['success'] != new['success']:
+        return False
+    return not old['success'] or all(old['data'][field] == new['data'][field] for field in COMPARED_FIELDS)
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    output = None
+    if '--write' in args:
+        output = args[args.index('--write') + 1]
+        del args[args.index('--write'):args.index('--write') + 2]
+    size = int(args[0]) if args else DEFAULT_SIZE
+
+    corpus = build_corpus(size)
+    if output:
+        with open(output, 'w') as f:
+            for message in corpus:
+                f.write(json.dumps({'sms_text': message}) + '\n')
+        print(f"Wrote {size} messages to {output}")
+
+    baseline, baseline_time = timed(lambda: [baseline_parse_sms(message) for message in corpus])
+    single, single_time = timed(lambda: [parse_sms_report(message) for message in corpus])
+    batch, batch_time = timed(lambda: parse_sms_batch(corpus))
+    parsed = sum(1 for result in batch if result['success'])
+    mismatches = sum(
+        1 for a, b in zip(single, batch)
+        if a['success'] != b['success'] or (a['data'] or {}).get('pinCode') != (b['data'] or {}).get('pinCode')
+    )
+
+    changed = sum(1 for old, new in zip(baseline, batch) if not same_fields(old, new))
+
+    print(f"{size} messages, {parsed} parsed, {mismatches} mismatches between the two paths")
+    print(f"{changed} messages parsed differently from the baseline parser")
+    print(f"{'baseline':>18}: {baseline_time:.3f} s ({size / baseline_time:,.0f} msg/s)")
+    print(f"{'parse_sms_report':>18}: {single_time:.3f} s ({size / single_time:,.0f} msg/s)")
+    print(f"{'parse_sms_batch':>18}: {batch_time:.3f} s ({size / batch_time:,.0f} msg/s)")
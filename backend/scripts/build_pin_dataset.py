@@ -0,0 +1,66 @@
+"""
+Build the compact PIN code dataset read by services/pincode_service.py
+
+Takes a CSV with one row per post office (e.g. the India Post all-India
+PIN code directory) and keeps the first row with valid coordinates for
+each PIN. Recognised columns: pincode, latitude, longitude, district /
+districtname, locality / officename. Without a CSV, the built-in
+PIN_CODE_DATABASE entries are written.
+
+Run from the backend directory:
+    python -m scripts.build_pin_dataset [pincodes.csv] [output.bin]
+"""
+
+import csv
+import os
+import sys
+
+from services.geo import coordinates
+from services.pin_dataset import write_dataset
+from services.pincode_service import PIN_CODE_DATABASE, PIN_DATASET_PATH
+
+COLUMN_NAMES = {
+    'pincode': ('pincode', 'pin', 'pin_code'),
+    'latitude': ('latitude', 'lat'),
+    'longitude': ('longitude', 'lon', 'lng'),
+    'district': ('district', 'districtname'),
+    'locality': ('locality', 'officename', 'office_name')
+}
+
+
+def read_csv(path):
+    entries = {}
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        header = {name.strip().lower(): name for name in reader.fieldnames}
+        columns = {}
+        for field, names in COLUMN_NAMES.items():
+            match = next((header[name] for name in names if name in header), None)
+            if match is None:
+                raise ValueError(f'{path} has no {field} column')
+            columns[field] = match
+        for row in reader:
+            pincode = row[columns['pincode']].strip()
+            if not (pincode.isdigit() and len(pincode) == 6) or pincode in entries:
+                continue
+            data = {
+                'latitude': row[columns['latitude']],
+                'longitude': row[columns['longitude']],
+                'district': row[columns['district']].strip().title(),
+                'locality': row[columns['locality']].strip()
+            }
+            location = coordinates(data)
+            if location is None:
+                continue
+            data['latitude'], data['longitude'] = location
+            entries[pincode] = data
+    return entries
+
+
+if __name__ == '__main__':
+    source = sys.argv[1] if len(sys.argv) > 1 else None
+    output = sys.argv[2] if len(sys.argv) > 2 else PIN_DATASET_PATH
+    entries = read_csv(source) if source else dict(PIN_CODE_DATABASE)
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    write_dataset(output, entries)
+    print(f"Wrote {len(entries)} PIN codes to {output} ({os.path.getsize(output)} bytes)")
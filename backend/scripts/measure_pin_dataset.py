@@ -0,0 +1,83 @@
+"""
+Measure load time and per-worker resident memory of the PIN dataset
+
+Compares importing a module holding a dict of dicts (the PIN_CODE_DATABASE
+layout) against opening the memory-mapped compact file, for a synthetic
+national-size dataset. Each variant runs in a fresh process so the numbers
+do not mix; the module is byte-compiled beforehand, as it would be when deployed.
+
+Run from the backend directory:
+    python -m scripts.measure_pin_dataset
+"""
+
+import importlib
+import os
+import py_compile
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from services.pin_dataset import PinDataset, write_dataset
+
+SIZE = 19_000
+LOOKUPS = 10_000
+
+
+def rss_kb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def synthetic_entries():
+    random.seed(0)
+    districts = [f'District {i}' for i in range(750)]
+    return {
+        f'{110000 + i * 42:06d}': {
+            'latitude': random.uniform(8, 35),
+            'longitude': random.uniform(68, 97),
+            'locality': f'Post Office {i}',
+            'district': random.choice(districts)
+        }
+        for i in range(SIZE)
+    }
+
+
+def measure(kind, directory):
+    """Runs in a child process: load one variant, do random lookups, report timings and RSS"""
+    before = rss_kb()
+    start = time.perf_counter()
+    if kind == 'dict':
+        sys.path.insert(0, directory)
+        lookup = importlib.import_module('pin_database_literal').PIN_CODE_DATABASE.get
+    else:
+        dataset = PinDataset(os.path.join(directory, 'pincodes.bin'))
+        lookup = dataset.get
+    loaded = time.perf_counter() - start
+    pins = [f'{110000 + random.randrange(SIZE) * 42:06d}' for _ in range(LOOKUPS)]
+    start = time.perf_counter()
+    for pin in pins:
+        lookup(pin)
+    per_lookup = (time.perf_counter() - start) / LOOKUPS
+    print(f"{kind:>6}: load {loaded * 1000:8.1f} ms, lookup {per_lookup * 1e6:6.2f} us, "
+          f"RSS +{(rss_kb() - before) / 1024:6.1f} MB")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3:
+        measure(sys.argv[1], sys.argv[2])
+        sys.exit(0)
+    with tempfile.TemporaryDirectory() as directory:
+        entries = synthetic_entries()
+        path = os.path.join(directory, 'pincodes.bin')
+        write_dataset(path, entries)
+        with open(os.path.join(directory, 'pin_database_literal.py'), 'w') as f:
+            f.write(f'PIN_CODE_DATABASE = {entries!r}\n')
+        py_compile.compile(os.path.join(directory, 'pin_database_literal.py'))
+        print(f"{SIZE} PIN codes, compact file {os.path.getsize(path) / 1024:.0f} KB")
+        for kind in ('dict', 'mmap'):
+            subprocess.run([sys.executable, '-m', 'scripts.measure_pin_dataset', kind, directory], check=True)
@@ -0,0 +1,18 @@
+"""
+Recompute the report_stats counters from the water_quality_reports collection
+
+Run from the backend directory:
+    python -m scripts.rebuild_report_stats
+"""
+
+import logging
+
+from services.firebase_service import firebase_service
+
+logging.basicConfig(level=logging.INFO)
+
+
+if __name__ == '__main__':
+    totals = firebase_service.rebuild_report_stats()
+    for district, counters in sorted(totals.items()):
+        print(f"{district}: {counters}")
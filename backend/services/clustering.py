@@ -0,0 +1,136 @@
+"""
+Multi-resolution geohash aggregates for clustering map markers
+"""
+
+import threading
+
+from services.geo import (
+    coordinates,
+    encode_geohash,
+    geohash_bounds,
+    cell_count,
+    covering_cells
+)
+
+# Coarsest and finest geohash precision kept in the aggregate
+MIN_PRECISION = 1
+MAX_PRECISION = 8
+
+# Severity labels used by reports and lab assignments, ranked mildest first
+SEVERITY_RANKS = {'low': 1, 'mild': 1, 'medium': 2, 'high': 3, 'severe': 3}
+SEVERITY_LABELS = {1: 'low', 2: 'medium', 3: 'high'}
+
+
+def precision_for_zoom(zoom):
+    """
+    Geohash precision whose cells are roughly 64 px wide at a web-map zoom level
+
+    A 256 px tile spans 360 / 2**zoom degrees of longitude; a precision-p cell
+    spans 360 / 2**ceil(5p / 2).
+    """
+    return max(MIN_PRECISION, min(MAX_PRECISION, round((zoom + 2) * 2 / 5)))
+
+
+class ClusterAggregate:
+    """
+    Per-cell marker counts at every geohash precision, per district and overall
+
+    Each cell holds the number of documents, how many are active, the
+    coordinate sums for the centroid and a count per severity rank, so a
+    document can be added or removed without rescanning the cell. Kept
+    current with apply(changes, reset), the watch callback signature.
+    """
+
+    def __init__(self, is_active):
+        self.is_active = is_active
+        self._levels = {}
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def apply(self, changes, reset):
+        with self._lock:
+            if reset:
+                self._levels = {}
+                self._entries = {}
+            for change_type, doc_id, data in changes:
+                self._remove(doc_id)
+                if change_type != 'removed':
+                    self._add(doc_id, data)
+
+    def _add(self, doc_id, data):
+        location = coordinates(data)
+        if location is None:
+            return
+        entry = (
+            encode_geohash(location[0], location[1], MAX_PRECISION),
+            data.get('district'),
+            location,
+            1 if self.is_active(data) else 0,
+            SEVERITY_RANKS.get(str(data.get('severity')).lower(), 0)
+        )
+        self._entries[doc_id] = entry
+        self._update(entry, 1)
+
+    def _remove(self, doc_id):
+        entry = self._entries.pop(doc_id, None)
+        if entry is not None:
+            self._update(entry, -1)
+
+    def _update(self, entry, sign):
+        geohash, district, location, active, severity = entry
+        for scope in ((None, ) if district is None else (None, district)):
+            for precision in range(MIN_PRECISION, MAX_PRECISION + 1):
+                cells = self._levels.setdefault((scope, precision), {})
+                cell = geohash[:precision]
+                stats = cells.get(cell)
+                if stats is None:
+                    stats = cells[cell] = {'count': 0, 'active': 0, 'lat': 0.0, 'lon': 0.0, 'severities': [0, 0, 0, 0]}
+                stats['count'] += sign
+                stats['active'] += sign * active
+                stats['lat'] += sign * location[0]
+                stats['lon'] += sign * location[1]
+                stats['severities'][severity] += sign
+                if stats['count'] == 0:
+                    del cells[cell]
+
+    def clusters(self, zoom, bbox=None, district=None):
+        """
+        Clusters for one map view
+
+        Args:
+            zoom (int): Web-map zoom level
+            bbox (tuple): (min_lat, min_lon, max_lat, max_lon) of the view, or None for everywhere
+            district (str): Only documents from this district
+
+        Returns:
+            list: Cluster dicts with the cell's geohash, centroid, count,
+                  activeCount and worstSeverity
+        """
+        precision = precision_for_zoom(zoom)
+        with self._lock:
+            cells = self._levels.get((district, precision), {})
+            if bbox is None:
+                selected = list(cells.items())
+            elif cell_count(*bbox, precision) <= len(cells):
+                selected = [(cell, cells[cell]) for cell in covering_cells(*bbox, precision) if cell in cells]
+            else:
+                selected = []
+                for cell, stats in cells.items():
+                    cell_min_lat, cell_min_lon, cell_max_lat, cell_max_lon = geohash_bounds(cell)
+                    if cell_min_lat <= bbox[2] and cell_max_lat >= bbox[0] and \
+                       cell_min_lon <= bbox[3] and cell_max_lon >= bbox[1]:
+                        selected.append((cell, stats))
+            return [self._cluster(cell, stats) for cell, stats in selected]
+
+    @staticmethod
+    def _cluster(cell, stats):
+        worst = next((rank for rank in (3, 2, 1) if stats['severities'][rank] > 0), None)
+        return {
+            'geohash': cell,
+            'latitude': stats['lat'] / stats['count'],
+            'longitude': stats['lon'] / stats['count'],
+            'count': stats['count'],
+            'activeCount': stats['active'],
+            'worstSeverity': SEVERITY_LABELS.get(worst),
+            'isActive': stats['active'] > 0
+        }
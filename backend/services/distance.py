@@ -0,0 +1,42 @@
+"""
+Vectorized great-circle distances over coordinate arrays
+"""
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+
+
+def haversine_distances(latitude, longitude, latitudes, longitudes):
+    """
+    Distances in km from one point to many, computed in a single pass
+
+    Args:
+        latitude (float): Latitude of the origin
+        longitude (float): Longitude of the origin
+        latitudes (array-like): Latitudes of the targets
+        longitudes (array-like): Longitudes of the targets
+
+    Returns:
+        numpy.ndarray: Distance to each target, in km
+    """
+    lat1 = np.radians(latitude)
+    lat2 = np.radians(np.asarray(latitudes, dtype=np.float64))
+    dlat = lat2 - lat1
+    dlon = np.radians(np.asarray(longitudes, dtype=np.float64) - longitude)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def within_radius(latitude, longitude, latitudes, longitudes, radius_km):
+    """
+    Targets within radius_km of a point, nearest first
+
+    Returns:
+        tuple: (indices, distances) as numpy arrays
+    """
+    distances = haversine_distances(latitude, longitude, latitudes, longitudes)
+    indices = np.flatnonzero(distances <= radius_km)
+    order = np.argsort(distances[indices], kind='stable')
+    return indices[order], distances[indices[order]]
+
@@ -1,16 +1,175 @@
 import firebase_admin
-from firebase_admin import credentials, firestore, storage, auth
+from firebase_admin import credentials, storage, auth
 import os
 import json
+import asyncio
+import base64
 import logging
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from services.cache import TTLCache
+from services.live_view import LiveView
+from services.clustering import ClusterAggregate
+from services.tiles import tile_bounds, feature_collection, content_etag
+from services.pincode_service import location_fields
+from services.geo import filter_within_radius, document_geohash, search_cells, box_cells, geohash_range, in_bounds
+from services.storage_backend import create_backend, DocumentNotFoundError, DOCUMENT_ID, DESCENDING
 
 logger = logging.getLogger(__name__)
 
+# Page size bounds for paginated report listings
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# Report counters, one document per district plus one for the whole state
+STATS_COLLECTION = 'report_stats'
+STATS_ALL_ID = '_all'
+ACTIVE_STATUSES = ['reported', 'contaminated']
+
+# Lab assignment statuses for areas that are still contaminated
+CONTAMINATED_ASSIGNMENT_STATUSES = ['pending_lab_visit', 'solution_uploaded', 'phc_cleaning']
+
+# Map tile layers: document fields copied into each GeoJSON feature
+TILE_LAYERS = {
+    'reports': ['status', 'active', 'severity', 'district', 'pinCode', 'localityName'],
+    'assignments': ['status', 'severity', 'district', 'pinCode', 'localityName', 'reportCount']
+}
+
+# Report fields the live view keeps for the map layers
+REPORT_VIEW_FIELDS = ['latitude', 'longitude', 'reportedAt'] + TILE_LAYERS['reports']
+
+class ReportStatsMissingError(Exception):
+    """Raised when reports exist but their report_stats counters were never built"""
+
+
 class FirebaseService:
     """Firebase service for database operations"""
     
-    def __init__(self):
-        """Initialize Firebase app"""
+    def __init__(self, backend=None):
+        """
+        Set up caches; the storage backend is created lazily on first use
+        
+        Creating the Firestore client (credential parsing, gRPC channels) is
+        deferred until a request needs it, and redone in each forked worker
+        so no client is ever shared across processes.
+        """
+        self._backend = backend
+        self._backend_pid = os.getpid() if backend is not None else None
+        self._owns_backend = backend is None
+        self._init_lock = threading.Lock()
+        self._loop = None
+        self._loop_pid = None
+        self._live_view = None
+        self._live_view_pid = None
+        self._create_caches()
+    
+    def _create_caches(self):
+        # Read-through cache for report queries, keyed by (query, district, ...).
+        # Report writes in this process invalidate it; writes from other
+        # workers show up once entries expire.
+        self.report_cache = TTLCache(
+            max_size=int(os.getenv('REPORT_CACHE_SIZE', 256)),
+            ttl=float(os.getenv('REPORT_CACHE_TTL', 15))
+        )
+        
+        # email -> user index for login lookups, per user collection.
+        # Misses are cached too, for a shorter time, so repeated failed
+        # logins do not hit the database.
+        self.user_cache = TTLCache(
+            max_size=int(os.getenv('USER_CACHE_SIZE', 10000)),
+            ttl=float(os.getenv('USER_CACHE_TTL', 600))
+        )
+        self.user_cache_negative_ttl = float(os.getenv('USER_CACHE_NEGATIVE_TTL', 30))
+        
+        # Rendered map tiles, keyed by (layer, z, x, y) and stored with the
+        # ETag they were rendered for.
+        self.tile_cache = TTLCache(
+            max_size=int(os.getenv('TILE_CACHE_SIZE', 2048)),
+            ttl=float(os.getenv('TILE_CACHE_TTL', 3600))
+        )
+    
+    @property
+    def backend(self):
+        """Storage backend for this process, created on first access"""
+        if self._backend is None or (self._owns_backend and self._backend_pid != os.getpid()):
+            with self._init_lock:
+                if self._backend is None or (self._owns_backend and self._backend_pid != os.getpid()):
+                    self._backend = create_backend(
+                        firestore_client_factory=self._firestore_client,
+                        firestore_async_client_factory=self._firestore_async_client
+                    )
+                    self._backend_pid = os.getpid()
+                    logger.info(f"Using {self._backend.name} storage backend in process {self._backend_pid}")
+        return self._backend
+    
+    @property
+    def initialized(self):
+        return self._backend is not None and self._backend_pid == os.getpid()
+    
+    def reset_after_fork(self):
+        """
+        Drop per-process state inherited from the parent process
+        
+        Registered with os.register_at_fork, so pre-forking servers (gunicorn
+        with --preload, multiprocessing) get a fresh client, fresh locks and
+        empty caches in every worker.
+        """
+        self._init_lock = threading.Lock()
+        self._loop = None
+        self._loop_pid = None
+        self._live_view = None
+        self._live_view_pid = None
+        if self._owns_backend:
+            self._backend = None
+            self._backend_pid = None
+        self._create_caches()
+    
+    @property
+    def live_view(self):
+        """
+        Materialized view of active reports and open assignments for this process
+        
+        Started on first access unless LIVE_VIEW_ENABLED=0. Returns None if
+        disabled or if the listeners could not be started.
+        """
+        if os.getenv('LIVE_VIEW_ENABLED', '1') == '0':
+            return None
+        if self._live_view_pid != os.getpid():
+            # Resolved before taking _init_lock, which the backend property also takes
+            backend = self.backend
+            with self._init_lock:
+                if self._live_view_pid != os.getpid():
+                    self._live_view_pid = os.getpid()
+                    try:
+                        self._live_view = LiveView(
+                            backend, ACTIVE_STATUSES, CONTAMINATED_ASSIGNMENT_STATUSES,
+                            check_interval=float(os.getenv('LIVE_VIEW_CHECK_INTERVAL', 10)),
+                            report_days=self.map_report_days(),
+                            report_fields=REPORT_VIEW_FIELDS
+                        ).start()
+                    except Exception as e:
+                        logger.error(f"Live view could not be started: {str(e)}", exc_info=True)
+                        self._live_view = None
+        return self._live_view
+    
+    def _firestore_client(self):
+        """Initialize Firebase app and return a Firestore client owned by this process"""
+        app = self.initialize_app()
+        # Not firestore.client(): firebase_admin caches that client on the app,
+        # which would hand the parent's gRPC channel to forked workers
+        from google.cloud import firestore as cloud_firestore
+        return cloud_firestore.Client(credentials=app.credential.get_credential(), project=app.project_id)
+    
+    def _firestore_async_client(self):
+        """Initialize Firebase app and return a Firestore AsyncClient owned by this process"""
+        app = self.initialize_app()
+        from google.cloud import firestore as cloud_firestore
+        return cloud_firestore.AsyncClient(credentials=app.credential.get_credential(), project=app.project_id)
+    
+    def initialize_app(self):
+        """Initialize the default Firebase app from available credentials and return it"""
         if not firebase_admin._apps:
             cred = None
             
@@ -51,102 +210,633 @@ class FirebaseService:
                 'storageBucket': storage_bucket
             })
         
-        # Initialize Firestore client
-        self.db = firestore.client()
+        return firebase_admin.get_app()
+    
+    @staticmethod
+    def _copy_reports(reports):
+        """Copy cached reports so callers can annotate them without touching the cache"""
+        return {report_id: dict(report) for report_id, report in reports.items()}
+    
+    def _invalidate_report_cache(self, district=None):
+        """Drop cached report queries affected by a write"""
+        if district is None:
+            self.report_cache.clear()
+        else:
+            self.report_cache.delete_where(lambda key: key[1] in (district, None))
+    
+    @staticmethod
+    def _stats_bucket(report):
+        """Counter a report contributes to besides totalReports, if any"""
+        if report.get('status') in ACTIVE_STATUSES and report.get('active') is True:
+            return 'activeReports'
+        if report.get('status') == 'cleaned':
+            return 'cleanAreas'
+        return None
+    
+    @staticmethod
+    def _stats_doc_id(district):
+        return str(district).replace('/', '_') if district else 'Unknown'
+    
+    def _stats_increments(self, report, sign):
+        """Counter increments for adding (sign=1) or removing (sign=-1) a report"""
+        deltas = {'totalReports': sign}
+        bucket = self._stats_bucket(report)
+        if bucket:
+            deltas[bucket] = sign
+        district = report.get('district') or 'Unknown'
+        return [
+            (STATS_COLLECTION, self._stats_doc_id(district), deltas, {'district': district}),
+            (STATS_COLLECTION, STATS_ALL_ID, deltas, None)
+        ]
+    
+    @staticmethod
+    def _merge_counters(increments):
+        """Combine counter increments per counter document, dropping zero deltas"""
+        merged = {}
+        for collection, doc_id, deltas, fields in increments:
+            entry = merged.setdefault((collection, doc_id), ({}, fields))
+            for field, delta in deltas.items():
+                entry[0][field] = entry[0].get(field, 0) + delta
+        changes = []
+        for (collection, doc_id), (deltas, fields) in merged.items():
+            deltas = {field: delta for field, delta in deltas.items() if delta}
+            if deltas:
+                changes.append((collection, doc_id, deltas, fields))
+        return changes
+    
+    def _stats_changes(self, old_report, new_report):
+        """Counter increments for a report update"""
+        return self._merge_counters(self._stats_increments(old_report, -1) + self._stats_increments(new_report, 1))
+    
+    @staticmethod
+    def _with_geohash(data):
+        """Set data['geohash'] from its coordinates, if it has any"""
+        geohash = document_geohash(data)
+        if geohash:
+            data['geohash'] = geohash
+        return data
+    
+    @classmethod
+    def _with_location(cls, data, fill_names=True):
+        """Geocode data from its PIN code when it has no coordinates, then set its geohash"""
+        data.update(location_fields(data, fill_names))
+        return cls._with_geohash(data)
     
     def add_water_quality_report(self, report_data):
-        """Add a water quality report"""
-        import uuid
+        """Add a water quality report and its counter increments in one atomic batch"""
+        self._with_location(report_data)
         report_id = str(uuid.uuid4())
-        self.db.collection('water_quality_reports').document(report_id).set(report_data)
+        self.backend.commit_batch(
+            [('set', 'water_quality_reports', report_id, report_data)] +
+            [('increment', ) + change for change in self._stats_increments(report_data, 1)]
+        )
+        self._invalidate_report_cache(report_data.get('district'))
         return report_id
     
+    def add_water_quality_reports(self, reports):
+        """
+        Add many water quality reports with batched writes
+        
+        reports maps report IDs to report data. The reports and their
+        combined counter increments are committed together (see
+        StorageBackend.commit_batch). IDs that already exist are skipped,
+        reports and counters alike, so writing a batch again after a retry
+        neither overwrites later changes nor counts a report twice.
+        
+        Returns:
+            list: IDs of the reports written
+        """
+        existing = self.backend.get_many('water_quality_reports', list(reports))
+        if existing:
+            logger.info(f"Skipping {len(existing)} reports that were already saved")
+        reports = {report_id: data for report_id, data in reports.items() if report_id not in existing}
+        if not reports:
+            return []
+        
+        writes = []
+        increments = []
+        for report_id, report_data in reports.items():
+            self._with_location(report_data)
+            writes.append(('set', 'water_quality_reports', report_id, report_data))
+            increments.extend(self._stats_increments(report_data, 1))
+        writes.extend(('increment',) + change for change in self._merge_counters(increments))
+        
+        self.backend.commit_batch(writes)
+        self._invalidate_report_cache()
+        return list(reports)
+    
+    def get_water_quality_report(self, report_id):
+        """Get a single water quality report"""
+        return self.backend.get('water_quality_reports', report_id)
+    
     def get_water_quality_reports(self, district=None):
         """Get water quality reports"""
+        cache_key = ('reports', district)
+        cached = self.report_cache.get(cache_key)
+        if cached is not None:
+            return self._copy_reports(cached)
+        
         try:
-            if district:
-                docs = self.db.collection('water_quality_reports').where(filter=firestore.FieldFilter('district', '==', district)).stream()
-            else:
-                docs = self.db.collection('water_quality_reports').stream()
-            
-            reports = {}
-            for doc in docs:
-                reports[doc.id] = doc.to_dict()
-            return reports
+            filters = self._report_filters(district)
+            reports = self.backend.to_dict(self.backend.query('water_quality_reports', filters))
         except Exception as e:
             logger.info(f"No reports found or error: {str(e)}")
             return {}
+        
+        self.report_cache.set(cache_key, reports)
+        return self._copy_reports(reports)
     
-    def get_active_reports(self):
-        """Get active contamination reports (both reported and contaminated)"""
+    @staticmethod
+    def encode_cursor(report_id, reported_at):
+        """Encode the position after a report as an opaque page token"""
+        raw = json.dumps([reported_at, report_id], separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+    
+    @staticmethod
+    def decode_cursor(cursor):
+        """Decode a page token produced by encode_cursor"""
         try:
-            # Get reports with active=True
-            docs = self.db.collection('water_quality_reports').where(
-                filter=firestore.FieldFilter('active', '==', True)
-            ).stream()
-            
-            reports = {}
-            for doc in docs:
-                data = doc.to_dict()
-                # Include both 'reported' and 'contaminated' status
-                if data.get('status') in ['reported', 'contaminated']:
-                    reports[doc.id] = data
+            padded = cursor + '=' * (-len(cursor) % 4)
+            reported_at, report_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            return {'reportedAt': reported_at, DOCUMENT_ID: report_id}
+        except (ValueError, TypeError) as e:
+            raise ValueError('Invalid cursor') from e
+    
+    def get_water_quality_reports_page(self, district=None, limit=None, cursor=None):
+        """
+        Get one page of water quality reports, newest first
+        
+        Args:
+            district (str): Optional district filter
+            limit (int): Page size, clamped to 1..MAX_PAGE_SIZE (default DEFAULT_PAGE_SIZE)
+            cursor (str): Token returned as next_cursor by the previous page
+        
+        Returns:
+            tuple: (reports dict in page order, next_cursor or None on the last page)
+        """
+        limit = max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+        start_after = self.decode_cursor(cursor) if cursor else None
+        cache_key = ('page', district, limit, cursor)
+        cached = self.report_cache.get(cache_key)
+        if cached is not None:
+            return self._copy_reports(cached[0]), cached[1]
+        
+        filters = [('district', '==', district)] if district else []
+        # Fetch one extra document to know whether another page exists
+        rows = self.backend.query(
+            'water_quality_reports',
+            filters,
+            order_by=[('reportedAt', DESCENDING), (DOCUMENT_ID, DESCENDING)],
+            limit=limit + 1,
+            start_after=start_after
+        )
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_id, last_report = rows[-1]
+            next_cursor = self.encode_cursor(last_id, last_report.get('reportedAt'))
+        
+        reports = self.backend.to_dict(rows)
+        self.report_cache.set(cache_key, (reports, next_cursor))
+        return self._copy_reports(reports), next_cursor
+    
+    @staticmethod
+    def _report_filters(district=None, statuses=None, active=None):
+        filters = []
+        if district:
+            filters.append(('district', '==', district))
+        if active is not None:
+            filters.append(('active', '==', active))
+        if statuses:
+            filters.append(('status', 'in', list(statuses)) if len(statuses) > 1 else ('status', '==', statuses[0]))
+        return filters
+    
+    def query_reports(self, district=None, statuses=None, active=None, limit=None):
+        """
+        Get water quality reports matching every given filter
+        
+        The filters are composed into a single server-side query, so only
+        matching documents are transferred. Combinations used by the routes
+        are backed by the composite indexes in firestore.indexes.json.
+        
+        Args:
+            district (str): Only reports from this district
+            statuses (list): Only reports whose status is in this list (max 30)
+            active (bool): Only reports with this active flag
+            limit (int): Maximum number of reports returned
+        
+        Returns:
+            dict: {report_id: report}
+        """
+        statuses = tuple(statuses) if statuses else None
+        cache_key = ('query', district, statuses, active, limit)
+        cached = self.report_cache.get(cache_key)
+        if cached is not None:
+            return self._copy_reports(cached)
+        
+        filters = self._report_filters(district, statuses, active)
+        reports = self.backend.to_dict(self.backend.query('water_quality_reports', filters, limit=limit))
+        self.report_cache.set(cache_key, reports)
+        return self._copy_reports(reports)
+    
+    def get_active_reports(self, district=None):
+        """Get active contamination reports (both reported and contaminated)"""
+        live_view = self.live_view
+        reports = live_view.active_reports(district) if live_view else None
+        if reports is not None:
             return reports
+        try:
+            return self.query_reports(district=district, statuses=ACTIVE_STATUSES, active=True)
         except Exception as e:
             logger.info(f"No active reports found or error: {str(e)}")
             return {}
     
+    def get_nearby_reports(self, latitude, longitude, radius_km):
+        """
+        Get reports within radius_km of a point
+        
+        Read with geohash range queries rather than from the live view, which
+        only keeps recent reports, and only their map fields.
+        
+        Returns:
+            list: Report dicts with 'id' and 'distance' (km), nearest first
+        """
+        reports = self._reports_near(latitude, longitude, radius_km)
+        return self._with_distances(filter_within_radius(reports.items(), latitude, longitude, radius_km))
+    
+    @staticmethod
+    def _with_distances(matches):
+        """Flatten (report_id, report, distance_km) matches into report dicts"""
+        results = []
+        for report_id, report, distance in matches:
+            report['id'] = report_id
+            report['distance'] = round(distance, 2)
+            results.append(report)
+        return results
+    
+    def _reports_near(self, latitude, longitude, radius_km):
+        """
+        Reports whose stored geohash falls in the cells around a point
+        
+        One range query per covering cell, issued concurrently. Reports
+        written before geohashes were stored need scripts.backfill_geohash.
+        """
+        return self._reports_in_cells(search_cells(latitude, longitude, radius_km))
+    
+    def _reports_in_cells(self, cells):
+        results = self.gather(*[
+            self.backend.aquery('water_quality_reports', geohash_range(cell))
+            for cell in cells
+        ])
+        reports = {}
+        for documents in results:
+            reports.update(self.backend.to_dict(documents))
+        return reports
+    
+    def get_tile(self, layer, z, x, y):
+        """
+        Render a z/x/y map tile of one layer ('reports' or 'assignments') as GeoJSON
+        
+        Tiles are cached per process and keyed by a version that only changes
+        when a write touches the tile.
+        
+        Returns:
+            tuple: (GeoJSON string, ETag)
+        """
+        properties = TILE_LAYERS[layer]
+        bounds = tile_bounds(z, x, y)
+        live_view = self.live_view
+        tile_layer = live_view.tile_layer(layer) if live_view else None
+        
+        if tile_layer is None:
+            # Not synced: render from queries, without caching
+            if layer == 'reports':
+                since = self.map_window_start()
+                documents = [(report_id, report) for report_id, report in
+                             self._reports_in_cells(box_cells(*bounds)).items()
+                             if str(report.get('reportedAt') or '') >= since]
+            else:
+                documents = self.get_contaminated_assignments().items()
+            documents = [(doc_id, data) for doc_id, data in documents if in_bounds(data, *bounds)]
+            body = json.dumps(feature_collection(documents, properties), separators=(',', ':'))
+            return body, content_etag(body)
+        
+        index, versions = tile_layer
+        etag = versions.etag(layer, z, x, y)
+        cached = self.tile_cache.get((layer, z, x, y))
+        if cached is not None and cached[0] == etag:
+            return cached[1], etag
+        body = json.dumps(feature_collection(index.within_bounds(*bounds), properties), separators=(',', ':'))
+        self.tile_cache.set((layer, z, x, y), (etag, body))
+        return body, etag
+    
+    @staticmethod
+    def map_report_days():
+        """Days of reports shown on the map layers (MAP_REPORT_DAYS, default 30)"""
+        return float(os.getenv('MAP_REPORT_DAYS', 30))
+    
+    def map_window_start(self):
+        """ISO timestamp of the oldest report shown on the map layers"""
+        return (datetime.now() - timedelta(days=self.map_report_days())).isoformat()
+    
+    def get_report_clusters(self, zoom, bbox=None, district=None):
+        """
+        Get recent report markers aggregated into geohash cells sized for a map zoom level
+        
+        Args:
+            zoom (int): Web-map zoom level
+            bbox (tuple): (min_lat, min_lon, max_lat, max_lon) of the view
+            district (str): Only reports from this district
+        
+        Returns:
+            list: Cluster dicts (see ClusterAggregate.clusters)
+        """
+        live_view = self.live_view
+        clusters = live_view.report_clusters_for(zoom, bbox, district) if live_view else None
+        if clusters is not None:
+            return clusters
+        
+        # Not synced: aggregate the query results instead
+        aggregate = ClusterAggregate(
+            lambda report: report.get('active') is True and report.get('status') in ACTIVE_STATUSES
+        )
+        filters = self._report_filters(district) + [('reportedAt', '>=', self.map_window_start())]
+        aggregate.apply([('added', report_id, report) for report_id, report in
+                         self.backend.query('water_quality_reports', filters)], True)
+        return aggregate.clusters(zoom, bbox, district)
+    
+    def get_active_reports_near(self, latitude, longitude, radius_km):
+        """
+        Get active reports within radius_km of a point
+        
+        Returns:
+            list: Report dicts with 'id' and 'distance' (km), nearest first
+        """
+        live_view = self.live_view
+        matches = live_view.active_reports_near(latitude, longitude, radius_km) if live_view else None
+        if matches is None:
+            matches = filter_within_radius(self.get_active_reports().items(), latitude, longitude, radius_km)
+        return self._with_distances(matches)
+    
     def update_report_status(self, report_id, status):
         """Update report status"""
-        self.db.collection('water_quality_reports').document(report_id).update({'status': status})
+        return self.update_water_quality_report(report_id, {'status': status})
+    
+    def update_water_quality_report(self, report_id, fields):
+        """Update fields on a water quality report"""
+        self._with_location(fields, fill_names=False)
+        if {'status', 'active', 'district'} & set(fields):
+            # Adjust the report counters in the same transaction as the update
+            self.backend.update_and_increment('water_quality_reports', report_id, fields, self._stats_changes)
+        else:
+            self.backend.update('water_quality_reports', report_id, fields)
+        self._invalidate_report_cache()
         return True
     
-    def add_lab_assignment(self, assignment_data):
-        """Add lab assignment"""
-        import uuid
+    def bulk_update_report_status(self, report_ids, status, extra_writes=None):
+        """
+        Update the status of many reports with batched writes
+        
+        Reads the reports and commits the status updates, the combined
+        counter changes and any extra_writes (see StorageBackend.commit_batch)
+        in transactions, like update_water_quality_report, so overlapping
+        updates of the same report cannot both change the counters.
+        Unknown report IDs are skipped.
+        
+        Returns:
+            list: IDs of the reports that were updated
+        """
+        def counters(old_reports):
+            increments = []
+            for old_report in old_reports.values():
+                increments.extend(self._stats_changes(old_report, {**old_report, 'status': status}))
+            return self._merge_counters(increments)
+        
+        report_ids = list(dict.fromkeys(report_ids))
+        old_reports = self.backend.update_many_and_increment(
+            'water_quality_reports', report_ids, {'status': status}, counters, extra_writes
+        )
+        missing = [report_id for report_id in report_ids if report_id not in old_reports]
+        if missing:
+            logger.warning(f"Skipped {len(missing)} unknown report IDs: {missing}")
+        
+        self._invalidate_report_cache()
+        return [report_id for report_id in report_ids if report_id in old_reports]
+    
+    def rebuild_report_stats(self):
+        """
+        Recompute the report counters from a full scan of the reports collection
+        
+        The rebuilt counters replace the old ones in one batch, and _all is
+        stamped with builtAt so get_report_statistics knows they are
+        complete. Report writes that land during the scan are not counted,
+        so run it with report writes stopped.
+        """
+        logger.info("Rebuilding report statistics from all reports")
+        totals = {}
+        for _, report in self.backend.query('water_quality_reports'):
+            for _, doc_id, deltas, fields in self._stats_increments(report, 1):
+                entry = totals.setdefault(doc_id, {
+                    'totalReports': 0, 'activeReports': 0, 'cleanAreas': 0, **(fields or {})
+                })
+                for field, delta in deltas.items():
+                    entry[field] += delta
+        totals.setdefault(STATS_ALL_ID, {'totalReports': 0, 'activeReports': 0, 'cleanAreas': 0})
+        totals[STATS_ALL_ID]['builtAt'] = datetime.now(timezone.utc).isoformat()
+        
+        writes = [
+            ('delete', STATS_COLLECTION, doc_id)
+            for doc_id, _ in self.backend.query(STATS_COLLECTION) if doc_id not in totals
+        ]
+        writes.extend(('set', STATS_COLLECTION, doc_id, counters) for doc_id, counters in totals.items())
+        self.backend.commit_batch(writes)
+        self._invalidate_report_cache()
+        return totals
+    
+    def get_report_statistics(self):
+        """
+        Get report counters for the whole state and per district
+        
+        Reads the small report_stats collection instead of the reports
+        themselves, so the cost does not grow with the number of reports.
+        The counters are never rebuilt here; see scripts.rebuild_report_stats.
+        They count only once _all carries the builtAt stamp that rebuild
+        writes, since report writes create _all on a database that already
+        had reports too.
+        
+        Returns:
+            dict: {'all': counters, 'districts': {district: counters}}
+        
+        Raises:
+            ReportStatsMissingError: If there are reports but no counters yet
+        """
+        cache_key = ('stats', None)
+        cached = self.report_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        docs = self.backend.to_dict(self.backend.query(STATS_COLLECTION))
+        if not docs.get(STATS_ALL_ID, {}).get('builtAt'):
+            self._check_stats_missing(self.backend.query('water_quality_reports', limit=1))
+            self._stamp_stats_built()
+        
+        stats = self._stats_from_docs(docs)
+        self.report_cache.set(cache_key, stats)
+        return stats
+    
+    @staticmethod
+    def _check_stats_missing(any_report):
+        """Raise if the counters were never built although reports exist"""
+        if any_report:
+            raise ReportStatsMissingError(
+                'Report statistics have not been built yet; run python -m scripts.rebuild_report_stats'
+            )
+    
+    def _stamp_stats_built(self):
+        """
+        Mark the counters as complete on a database without reports
+        
+        Every report written from here on goes through the counter
+        increments, so zero counters plus those increments are exact.
+        """
+        self.backend.increment(STATS_COLLECTION, STATS_ALL_ID, {}, {'builtAt': datetime.now(timezone.utc).isoformat()})
+    
+    @staticmethod
+    def _stats_from_docs(docs):
+        def counters(doc_id, doc):
+            values = {field: int(doc.get(field, 0)) for field in ('totalReports', 'activeReports', 'cleanAreas')}
+            negative = {field: value for field, value in values.items() if value < 0}
+            if negative:
+                logger.warning(f"Negative report counters in {STATS_COLLECTION}/{doc_id}: {negative}")
+            return values
+        
+        return {
+            'all': counters(STATS_ALL_ID, docs.get(STATS_ALL_ID, {})),
+            'districts': {
+                doc.get('district', doc_id): counters(doc_id, doc)
+                for doc_id, doc in docs.items() if doc_id != STATS_ALL_ID
+            }
+        }
+    
+    def add_lab_assignment(self, assignment_data, report_status=None):
+        """
+        Add lab assignment
+        
+        If report_status is given, the reports in assignment_data['reportIds']
+        move to that status in the same batch as the assignment is created.
+        """
+        self._with_location(assignment_data)
+        if report_status is None:
+            return self.backend.add('lab_assignments', assignment_data)
+        
         assignment_id = str(uuid.uuid4())
-        self.db.collection('lab_assignments').document(assignment_id).set(assignment_data)
+        self.bulk_update_report_status(
+            assignment_data.get('reportIds', []),
+            report_status,
+            extra_writes=[('set', 'lab_assignments', assignment_id, assignment_data)]
+        )
         return assignment_id
     
+    def get_lab_assignment(self, assignment_id):
+        """Get a single lab assignment"""
+        return self.backend.get('lab_assignments', assignment_id)
+    
+    @staticmethod
+    def _lab_assignment_filters(district=None, statuses=None, report_id=None):
+        filters = []
+        if district:
+            filters.append(('district', '==', district))
+        if statuses:
+            filters.append(('status', 'in', list(statuses)))
+        if report_id:
+            filters.append(('reportIds', 'array_contains', report_id))
+        return filters
+    
+    def get_lab_assignments(self, district=None, statuses=None, report_id=None):
+        """Get lab assignments, optionally filtered by district, status list or contained report"""
+        filters = self._lab_assignment_filters(district, statuses, report_id)
+        return self.backend.to_dict(self.backend.query('lab_assignments', filters))
+    
+    def get_contaminated_assignments(self):
+        """Get lab assignments for areas that are still contaminated"""
+        live_view = self.live_view
+        assignments = live_view.open_assignments() if live_view else None
+        if assignments is not None:
+            return assignments
+        return self.get_lab_assignments(statuses=CONTAMINATED_ASSIGNMENT_STATUSES)
+    
+    def get_contaminated_assignments_near(self, latitude, longitude, radius_km):
+        """
+        Get contaminated-area lab assignments within radius_km of a point
+        
+        Returns:
+            list: (assignment_id, assignment, distance_km) tuples, nearest first
+        """
+        live_view = self.live_view
+        matches = live_view.open_assignments_near(latitude, longitude, radius_km) if live_view else None
+        if matches is None:
+            assignments = self.get_contaminated_assignments()
+            matches = filter_within_radius(assignments.items(), latitude, longitude, radius_km)
+        return matches
+    
+    def update_lab_assignment(self, assignment_id, fields, report_status=None):
+        """
+        Update fields on a lab assignment
+        
+        If report_status is given, the assignment's reports move to that
+        status in the same batch as the assignment update.
+        """
+        self._with_location(fields, fill_names=False)
+        if report_status is None:
+            self.backend.update('lab_assignments', assignment_id, fields)
+            return True
+        
+        assignment = self.get_lab_assignment(assignment_id)
+        if assignment is None:
+            raise DocumentNotFoundError(f'lab_assignments/{assignment_id} not found')
+        self.bulk_update_report_status(
+            assignment.get('reportIds', []),
+            report_status,
+            extra_writes=[('update', 'lab_assignments', assignment_id, fields)]
+        )
+        return True
+    
+    def _add_user(self, collection, user_data):
+        """Add a user and refresh its entry in the email index"""
+        user_id = self.backend.add(collection, user_data)
+        if user_data.get('email'):
+            self.user_cache.set((collection, user_data['email']), {user_id: dict(user_data)})
+        return user_id
+    
+    def _get_user_by_email(self, collection, email):
+        """Look up users by email through the email index"""
+        cache_key = (collection, email)
+        cached = self.user_cache.get(cache_key)
+        if cached is not None:
+            return {user_id: dict(user) for user_id, user in cached.items()} or None
+        
+        users = self.backend.to_dict(self.backend.query(collection, [('email', '==', email)]))
+        if users:
+            self.user_cache.set(cache_key, users)
+        else:
+            self.user_cache.set(cache_key, {}, ttl=self.user_cache_negative_ttl)
+        return {user_id: dict(user) for user_id, user in users.items()} or None
+    
     def add_phc_user(self, user_data):
         """Add PHC user"""
-        import uuid
-        user_id = str(uuid.uuid4())
-        self.db.collection('phc_users').document(user_id).set(user_data)
-        return user_id
+        return self._add_user('phc_users', user_data)
     
     def add_lab_user(self, user_data):
         """Add Lab user"""
-        import uuid
-        user_id = str(uuid.uuid4())
-        self.db.collection('lab_users').document(user_id).set(user_data)
-        return user_id
+        return self._add_user('lab_users', user_data)
     
     def get_phc_by_email(self, email):
         """Get PHC by email"""
         try:
-            logger.info(f"Searching for PHC user with email: {email}")
-            docs = self.db.collection('phc_users').where(filter=firestore.FieldFilter('email', '==', email)).stream()
-            users = {}
-            count = 0
-            for doc in docs:
-                count += 1
-                logger.info(f"Found PHC user: {doc.id}")
-                users[doc.id] = doc.to_dict()
-            
-            logger.info(f"Total PHC users found: {count}")
-            
-            if not users:
-                # Try checking all documents in phc_users collection
-                logger.info("No users found with email query, checking all phc_users...")
-                all_docs = self.db.collection('phc_users').stream()
-                all_count = 0
-                for doc in all_docs:
-                    all_count += 1
-                    logger.info(f"PHC user exists: {doc.id}, email: {doc.to_dict().get('email')}")
-                logger.info(f"Total PHC users in collection: {all_count}")
-            
-            return users if users else None
+            users = self._get_user_by_email('phc_users', email)
+            logger.info(f"PHC users found for {email}: {len(users) if users else 0}")
+            return users
         except Exception as e:
             logger.error(f"Error getting PHC user: {str(e)}", exc_info=True)
             return None
@@ -154,17 +844,14 @@ class FirebaseService:
     def get_lab_by_email(self, email):
         """Get Lab by email"""
         try:
-            docs = self.db.collection('lab_users').where(filter=firestore.FieldFilter('email', '==', email)).stream()
-            users = {}
-            for doc in docs:
-                users[doc.id] = doc.to_dict()
-            return users if users else None
+            return self._get_user_by_email('lab_users', email)
         except Exception as e:
             logger.error(f"Error getting Lab user: {str(e)}", exc_info=True)
             return None
     
     def upload_file(self, file_path, destination_path):
         """Upload file to Firebase Storage"""
+        self.initialize_app()
         bucket = storage.bucket()
         blob = bucket.blob(destination_path)
         blob.upload_from_filename(file_path)
@@ -172,25 +859,123 @@ class FirebaseService:
     
     def add_lab_solution(self, solution_data):
         """Add lab solution"""
-        import uuid
-        solution_id = str(uuid.uuid4())
-        self.db.collection('lab_solutions').document(solution_id).set(solution_data)
-        return solution_id
+        return self.backend.add('lab_solutions', solution_data)
     
     def get_lab_solutions(self, district=None):
         """Get lab solutions"""
         try:
-            if district:
-                docs = self.db.collection('lab_solutions').where(filter=firestore.FieldFilter('district', '==', district)).stream()
-            else:
-                docs = self.db.collection('lab_solutions').stream()
-            
-            solutions = {}
-            for doc in docs:
-                solutions[doc.id] = doc.to_dict()
-            return solutions
+            filters = [('district', '==', district)] if district else []
+            return self.backend.to_dict(self.backend.query('lab_solutions', filters))
+        except Exception as e:
+            logger.info(f"No lab solutions found: {str(e)}")
+            return {}
+
+    # ==================== ASYNC DATA ACCESS ====================
+    
+    def _event_loop(self):
+        """Event loop for async queries, running in a daemon thread of this process"""
+        if self._loop is None or self._loop_pid != os.getpid():
+            with self._init_lock:
+                if self._loop is None or self._loop_pid != os.getpid():
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name='firebase-async', daemon=True).start()
+                    self._loop = loop
+                    self._loop_pid = os.getpid()
+        return self._loop
+    
+    def gather(self, *coroutines, timeout=30):
+        """
+        Run independent async queries concurrently and return their results in order
+        
+        Lets synchronous Flask routes fan out, e.g.:
+            reports, active = firebase_service.gather(
+                firebase_service.aget_water_quality_reports(district),
+                firebase_service.aget_active_reports(district)
+            )
+        The call takes roughly as long as the slowest query.
+        """
+        async def run_all():
+            return await asyncio.gather(*coroutines)
+        
+        return asyncio.run_coroutine_threadsafe(run_all(), self._event_loop()).result(timeout)
+    
+    async def _aquery_cached(self, cache_key, collection, filters, limit=None):
+        cached = self.report_cache.get(cache_key)
+        if cached is not None:
+            return self._copy_reports(cached)
+        documents = self.backend.to_dict(await self.backend.aquery(collection, filters, limit=limit))
+        self.report_cache.set(cache_key, documents)
+        return self._copy_reports(documents)
+    
+    async def aget_water_quality_reports(self, district=None):
+        """Async get_water_quality_reports"""
+        try:
+            return await self._aquery_cached(('reports', district), 'water_quality_reports', self._report_filters(district))
+        except Exception as e:
+            logger.info(f"No reports found or error: {str(e)}")
+            return {}
+    
+    async def aquery_reports(self, district=None, statuses=None, active=None, limit=None):
+        """Async query_reports"""
+        statuses = tuple(statuses) if statuses else None
+        return await self._aquery_cached(
+            ('query', district, statuses, active, limit),
+            'water_quality_reports',
+            self._report_filters(district, statuses, active),
+            limit=limit
+        )
+    
+    async def aget_active_reports(self, district=None):
+        """Async get_active_reports"""
+        live_view = self.live_view
+        reports = live_view.active_reports(district) if live_view else None
+        if reports is not None:
+            return reports
+        try:
+            return await self.aquery_reports(district=district, statuses=ACTIVE_STATUSES, active=True)
+        except Exception as e:
+            logger.info(f"No active reports found or error: {str(e)}")
+            return {}
+    
+    async def aget_lab_assignments(self, district=None, statuses=None, report_id=None):
+        """Async get_lab_assignments"""
+        filters = self._lab_assignment_filters(district, statuses, report_id)
+        return self.backend.to_dict(await self.backend.aquery('lab_assignments', filters))
+    
+    async def aget_contaminated_assignments(self):
+        """Async get_contaminated_assignments"""
+        live_view = self.live_view
+        assignments = live_view.open_assignments() if live_view else None
+        if assignments is not None:
+            return assignments
+        return await self.aget_lab_assignments(statuses=CONTAMINATED_ASSIGNMENT_STATUSES)
+    
+    async def aget_lab_solutions(self, district=None):
+        """Async get_lab_solutions"""
+        try:
+            filters = [('district', '==', district)] if district else []
+            return self.backend.to_dict(await self.backend.aquery('lab_solutions', filters))
         except Exception as e:
             logger.info(f"No lab solutions found: {str(e)}")
             return {}
+    
+    async def aget_report_statistics(self):
+        """Async get_report_statistics"""
+        cache_key = ('stats', None)
+        cached = self.report_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        docs = self.backend.to_dict(await self.backend.aquery(STATS_COLLECTION))
+        if not docs.get(STATS_ALL_ID, {}).get('builtAt'):
+            self._check_stats_missing(await self.backend.aquery('water_quality_reports', limit=1))
+            self._stamp_stats_built()
+        
+        stats = self._stats_from_docs(docs)
+        self.report_cache.set(cache_key, stats)
+        return stats
 
 firebase_service = FirebaseService()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=firebase_service.reset_after_fork)
@@ -0,0 +1,308 @@
+"""
+Geospatial helpers: distances, geohashes and an in-memory spatial index
+"""
+
+import math
+import threading
+
+import numpy as np
+
+from services.distance import EARTH_RADIUS_KM, within_radius
+
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Precision 5 cells are about 4.9 km x 4.9 km at the equator
+INDEX_PRECISION = 5
+
+# Precision of the 'geohash' field stored on documents (about 5 m)
+STORED_PRECISION = 9
+
+# Most geohash range queries issued for one proximity search
+MAX_QUERY_CELLS = 9
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """Calculate distance between two coordinates in km"""
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
+    c = 2 * math.asin(math.sqrt(a))
+    return EARTH_RADIUS_KM * c
+
+
+def coordinates(data):
+    """(latitude, longitude) of a document as floats, or None if missing or invalid"""
+    try:
+        latitude = float(data['latitude'])
+        longitude = float(data['longitude'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return latitude, longitude
+
+
+def radius_matches(latitude, longitude, latitudes, longitudes, radius_km):
+    """
+    Indices of coordinates within radius_km of a point, nearest first
+
+    A bounding-box comparison discards most far-away points before the
+    exact great-circle check runs on the rest.
+
+    Returns:
+        tuple: (indices, distances) as numpy arrays
+    """
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    min_lat, min_lon, max_lat, max_lon = bounding_box(latitude, longitude, radius_km)
+    inside = np.flatnonzero((latitudes >= min_lat) & (latitudes <= max_lat) &
+                            (longitudes >= min_lon) & (longitudes <= max_lon))
+    indices, distances = within_radius(latitude, longitude, latitudes[inside], longitudes[inside], radius_km)
+    return inside[indices], distances
+
+
+def filter_within_radius(documents, latitude, longitude, radius_km):
+    """
+    (doc_id, data) pairs within radius_km of a point, in one vectorized pass
+
+    Documents without valid coordinates are skipped.
+
+    Returns:
+        list: (doc_id, data, distance_km) tuples, nearest first
+    """
+    ids, kept, latitudes, longitudes = [], [], [], []
+    for doc_id, data in documents:
+        location = coordinates(data)
+        if location is None:
+            continue
+        ids.append(doc_id)
+        kept.append(data)
+        latitudes.append(location[0])
+        longitudes.append(location[1])
+    indices, distances = radius_matches(latitude, longitude, latitudes, longitudes, radius_km)
+    return [(ids[i], kept[i], float(distance)) for i, distance in zip(indices, distances)]
+
+
+def encode_geohash(latitude, longitude, precision=9):
+    """Encode a coordinate as a base32 geohash string"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(geohash) < precision:
+        value, bounds = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            bounds[0] = mid
+        else:
+            bits <<= 1
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(geohash)
+
+
+def geohash_bounds(geohash):
+    """(min_lat, min_lon, max_lat, max_lon) of a geohash cell"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        bits = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            bounds = lon_range if even else lat_range
+            mid = (bounds[0] + bounds[1]) / 2
+            if (bits >> shift) & 1:
+                bounds[0] = mid
+            else:
+                bounds[1] = mid
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def cell_size(precision):
+    """(lat_degrees, lon_degrees) spanned by a geohash cell of the given precision"""
+    bits = precision * 5
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """(min_lat, min_lon, max_lat, max_lon) enclosing a circle of radius_km"""
+    dlat = radius_km / KM_PER_DEGREE
+    cos_lat = math.cos(math.radians(latitude))
+    dlon = 180.0 if cos_lat < 1e-6 else min(radius_km / (KM_PER_DEGREE * cos_lat), 180.0)
+    return (max(latitude - dlat, -90.0), max(longitude - dlon, -180.0),
+            min(latitude + dlat, 90.0), min(longitude + dlon, 180.0))
+
+
+def cell_count(min_lat, min_lon, max_lat, max_lon, precision):
+    """Number of geohash cells covering a bounding box"""
+    lat_size, lon_size = cell_size(precision)
+    rows = math.floor((max_lat + 90) / lat_size) - math.floor((min_lat + 90) / lat_size) + 1
+    cols = math.floor((max_lon + 180) / lon_size) - math.floor((min_lon + 180) / lon_size) + 1
+    return rows * cols
+
+
+def covering_cells(min_lat, min_lon, max_lat, max_lon, precision):
+    """Geohash cells of the given precision that cover a bounding box"""
+    lat_size, lon_size = cell_size(precision)
+    first_row = max(math.floor((min_lat + 90) / lat_size), 0)
+    last_row = min(math.floor((max_lat + 90) / lat_size), round(180 / lat_size) - 1)
+    first_col = max(math.floor((min_lon + 180) / lon_size), 0)
+    last_col = min(math.floor((max_lon + 180) / lon_size), round(360 / lon_size) - 1)
+    cells = []
+    for row in range(first_row, last_row + 1):
+        lat = (row + 0.5) * lat_size - 90
+        for col in range(first_col, last_col + 1):
+            cells.append(encode_geohash(lat, (col + 0.5) * lon_size - 180, precision))
+    return cells
+
+
+def document_geohash(data):
+    """Geohash to store on a document, or None if it has no valid coordinates"""
+    location = coordinates(data)
+    if location is None:
+        return None
+    return encode_geohash(location[0], location[1], STORED_PRECISION)
+
+
+def search_cells(latitude, longitude, radius_km, max_cells=MAX_QUERY_CELLS):
+    """
+    Geohash cells covering a search circle's bounding box
+
+    Every document within radius_km has a stored geohash starting with one of them.
+    """
+    return box_cells(*bounding_box(latitude, longitude, radius_km), max_cells=max_cells)
+
+
+def box_cells(min_lat, min_lon, max_lat, max_lon, max_cells=MAX_QUERY_CELLS):
+    """Covering geohash cells of the finest precision that needs at most max_cells cells"""
+    precision = 1
+    for candidate in range(STORED_PRECISION, 0, -1):
+        if cell_count(min_lat, min_lon, max_lat, max_lon, candidate) <= max_cells:
+            precision = candidate
+            break
+    return covering_cells(min_lat, min_lon, max_lat, max_lon, precision)
+
+
+def in_bounds(data, min_lat, min_lon, max_lat, max_lon):
+    """Whether a document's coordinates fall in a bounding box (max edges excluded)"""
+    location = coordinates(data)
+    return location is not None and min_lat <= location[0] < max_lat and min_lon <= location[1] < max_lon
+
+
+def geohash_range(cell):
+    """Range filters matching stored geohashes that start with cell"""
+    # '~' sorts after every geohash character
+    return [('geohash', '>=', cell), ('geohash', '<', cell + '~')]
+
+
+class SpatialIndex:
+    """
+    Geohash grid over document coordinates
+
+    Documents are bucketed by their precision-5 geohash cell. Radius and box
+    queries only visit the cells overlapping the search area (or the occupied
+    cells, whichever is fewer), then filter the candidates' coordinate arrays
+    with radius_matches. Kept current with apply(changes, reset), the watch
+    callback signature.
+    """
+
+    def __init__(self, precision=INDEX_PRECISION):
+        self.precision = precision
+        self._cells = {}
+        self._entries = {}
+        self._arrays = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def apply(self, changes, reset):
+        with self._lock:
+            if reset:
+                self._cells = {}
+                self._entries = {}
+                self._arrays = {}
+            for change_type, doc_id, data in changes:
+                self._remove(doc_id)
+                if change_type != 'removed':
+                    self._add(doc_id, data)
+
+    def _add(self, doc_id, data):
+        location = coordinates(data)
+        if location is None:
+            return
+        cell = encode_geohash(location[0], location[1], self.precision)
+        self._cells.setdefault(cell, {})[doc_id] = (location, data)
+        self._entries[doc_id] = cell
+        self._arrays.pop(cell, None)
+
+    def _remove(self, doc_id):
+        cell = self._entries.pop(doc_id, None)
+        if cell is None:
+            return
+        bucket = self._cells[cell]
+        bucket.pop(doc_id, None)
+        self._arrays.pop(cell, None)
+        if not bucket:
+            del self._cells[cell]
+
+    def _cell_arrays(self, cell):
+        """(ids, documents, latitudes, longitudes) for one cell, rebuilt after it changes"""
+        arrays = self._arrays.get(cell)
+        if arrays is None:
+            bucket = self._cells[cell]
+            locations = np.array([location for location, _ in bucket.values()], dtype=np.float64)
+            arrays = (list(bucket), [data for _, data in bucket.values()], locations[:, 0], locations[:, 1])
+            self._arrays[cell] = arrays
+        return arrays
+
+    def _candidates(self, min_lat, min_lon, max_lat, max_lon):
+        """Concatenated arrays of every occupied cell overlapping a bounding box"""
+        if cell_count(min_lat, min_lon, max_lat, max_lon, self.precision) <= len(self._cells):
+            cells = [cell for cell in covering_cells(min_lat, min_lon, max_lat, max_lon, self.precision)
+                     if cell in self._cells]
+        else:
+            cells = []
+            for cell in self._cells:
+                cell_min_lat, cell_min_lon, cell_max_lat, cell_max_lon = geohash_bounds(cell)
+                if cell_min_lat <= max_lat and cell_max_lat >= min_lat and \
+                   cell_min_lon <= max_lon and cell_max_lon >= min_lon:
+                    cells.append(cell)
+        ids, documents, latitudes, longitudes = [], [], [], []
+        for cell in cells:
+            cell_ids, cell_documents, cell_latitudes, cell_longitudes = self._cell_arrays(cell)
+            ids.extend(cell_ids)
+            documents.extend(cell_documents)
+            latitudes.append(cell_latitudes)
+            longitudes.append(cell_longitudes)
+        if not ids:
+            return [], [], np.empty(0), np.empty(0)
+        return ids, documents, np.concatenate(latitudes), np.concatenate(longitudes)
+
+    def within_bounds(self, min_lat, min_lon, max_lat, max_lon):
+        """[(doc_id, data)] inside a bounding box (max edges excluded, so tiles do not overlap)"""
+        with self._lock:
+            ids, documents, latitudes, longitudes = self._candidates(min_lat, min_lon, max_lat, max_lon)
+            inside = np.flatnonzero((latitudes >= min_lat) & (latitudes < max_lat) &
+                                    (longitudes >= min_lon) & (longitudes < max_lon))
+            return [(ids[i], dict(documents[i])) for i in inside]
+
+    def within_radius(self, latitude, longitude, radius_km):
+        """[(doc_id, data, distance_km)] within radius_km, nearest first"""
+        with self._lock:
+            ids, documents, latitudes, longitudes = self._candidates(*bounding_box(latitude, longitude, radius_km))
+            indices, distances = radius_matches(latitude, longitude, latitudes, longitudes, radius_km)
+            return [(ids[i], dict(documents[i]), float(distance)) for i, distance in zip(indices, distances)]
@@ -0,0 +1,253 @@
+"""
+In-process materialized view of reports and active contamination
+Kept current by live queries on water_quality_reports and lab_assignments
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from services.geo import SpatialIndex
+from services.clustering import ClusterAggregate
+from services.tiles import TileVersions
+
+logger = logging.getLogger(__name__)
+
+
+class LiveCollection:
+    """
+    Documents matching one live query, updated incrementally from watch callbacks
+
+    filters may be a callable returning the filters, evaluated on every
+    subscription (for windows such as "the last 30 days"). With fields set,
+    only those fields of each document are kept and passed to listeners.
+    """
+
+    def __init__(self, name, collection, filters, fields=None):
+        self.name = name
+        self.collection = collection
+        self.filters = filters
+        self.fields = fields
+        self.subscribed_at = None
+        self.documents = {}
+        self.handle = None
+        self.synced = False
+        self.last_event_at = None
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """listener(changes, reset) is called after each applied batch of changes"""
+        self._listeners.append(listener)
+
+    def current_filters(self):
+        return self.filters() if callable(self.filters) else self.filters
+
+    def apply(self, changes, reset):
+        if self.fields is not None:
+            changes = [
+                (change_type, doc_id, data if change_type == 'removed' else
+                 {field: data[field] for field in self.fields if field in data})
+                for change_type, doc_id, data in changes
+            ]
+        with self._lock:
+            if reset:
+                self.documents = {}
+            for change_type, doc_id, data in changes:
+                if change_type == 'removed':
+                    self.documents.pop(doc_id, None)
+                else:
+                    self.documents[doc_id] = data
+            self.synced = True
+            self.last_event_at = time.time()
+        for listener in self._listeners:
+            try:
+                listener(changes, reset)
+            except Exception as e:
+                logger.error(f"Live view listener failed for {self.name}: {str(e)}", exc_info=True)
+
+    def snapshot(self):
+        """Copy of the current documents"""
+        with self._lock:
+            return {doc_id: dict(data) for doc_id, data in self.documents.items()}
+
+    @property
+    def ready(self):
+        return self.synced and self.handle is not None and self.handle.is_active
+
+
+class LiveView:
+    """
+    Reports, active reports and open lab assignments, held in memory
+
+    Each collection is fed by a backend watch (Firestore on_snapshot). A
+    monitor thread replaces any watch that has stopped: the new subscription's
+    first snapshot replaces the collection contents, so the view resyncs
+    after outages. Until a collection is ready, callers should fall back
+    to querying the backend. Report coordinates are additionally kept in
+    spatial indexes for proximity lookups.
+
+    The map layers (report tiles and clusters) only cover reports from the
+    last report_days days, and keep only report_fields of each. The monitor
+    moves that window forward every window_refresh seconds, so a process
+    never holds or re-reads the whole report collection.
+    """
+
+    def __init__(self, backend, active_statuses, assignment_statuses, check_interval=10.0, max_backoff=300.0,
+                 report_days=30.0, report_fields=None, window_refresh=86400.0):
+        self.backend = backend
+        self.check_interval = check_interval
+        self.max_backoff = max_backoff
+        self.report_days = report_days
+        self.window_refresh = window_refresh
+        self.recent_reports = LiveCollection(
+            'recent_reports', 'water_quality_reports', self.recent_report_filters, fields=report_fields
+        )
+        self.active_statuses = list(active_statuses)
+        self.reports = LiveCollection('active_reports', 'water_quality_reports', [
+            ('active', '==', True),
+            ('status', 'in', self.active_statuses)
+        ])
+        self.assignments = LiveCollection('open_assignments', 'lab_assignments', [
+            ('status', 'in', list(assignment_statuses))
+        ])
+        self.collections = [self.recent_reports, self.reports, self.assignments]
+        self.report_index = SpatialIndex()
+        self.active_report_index = SpatialIndex()
+        self.assignment_index = SpatialIndex()
+        self.recent_reports.add_listener(self.report_index.apply)
+        self.reports.add_listener(self.active_report_index.apply)
+        self.assignments.add_listener(self.assignment_index.apply)
+        self.report_clusters = ClusterAggregate(self.is_active_report)
+        self.recent_reports.add_listener(self.report_clusters.apply)
+        # Tile versions are bumped after the indexes are updated, and read before
+        # them when rendering, so a cached tile is never newer than its version
+        self.tile_layers = {
+            'reports': (self.recent_reports, self.report_index, TileVersions()),
+            'assignments': (self.assignments, self.assignment_index, TileVersions())
+        }
+        for live, _, versions in self.tile_layers.values():
+            live.add_listener(versions.apply)
+        self.resubscribe_count = 0
+        self._stopped = threading.Event()
+        self._monitor = None
+
+    def start(self):
+        for live in self.collections:
+            self._subscribe(live)
+        self._monitor = threading.Thread(target=self._monitor_loop, name='live-view-monitor', daemon=True)
+        self._monitor.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        for live in self.collections:
+            if live.handle is not None:
+                try:
+                    live.handle.unsubscribe()
+                except Exception:
+                    pass
+
+    def recent_report_filters(self):
+        """Filters for reports inside the current window"""
+        return [('reportedAt', '>=', self.report_window_start())]
+
+    def report_window_start(self):
+        """ISO timestamp of the oldest report the map layers cover"""
+        return (datetime.now() - timedelta(days=self.report_days)).isoformat()
+
+    def _subscribe(self, live):
+        try:
+            live.synced = False
+            live.subscribed_at = time.time()
+            live.handle = self.backend.watch(live.collection, live.current_filters(), live.apply)
+            logger.info(f"Live view subscribed to {live.name}")
+            return True
+        except Exception as e:
+            live.handle = None
+            logger.error(f"Live view failed to subscribe to {live.name}: {str(e)}")
+            return False
+
+    def _monitor_loop(self):
+        backoff = {live.name: self.check_interval for live in self.collections}
+        next_attempt = {live.name: 0.0 for live in self.collections}
+        while not self._stopped.wait(self.check_interval):
+            live = self.recent_reports
+            if live.handle is not None and live.handle.is_active and \
+                    time.time() - live.subscribed_at >= self.window_refresh:
+                # Resubscribe with a later window start; the reset drops older reports
+                logger.info(f"Moving the {live.name} window forward")
+                old_handle = live.handle
+                if self._subscribe(live):
+                    old_handle.unsubscribe()
+            for live in self.collections:
+                if live.handle is not None and live.handle.is_active:
+                    backoff[live.name] = self.check_interval
+                    continue
+                if time.time() < next_attempt[live.name]:
+                    continue
+                logger.warning(f"Live view watch on {live.name} is down, resubscribing")
+                self.resubscribe_count += 1
+                if self._subscribe(live):
+                    backoff[live.name] = self.check_interval
+                else:
+                    backoff[live.name] = min(backoff[live.name] * 2, self.max_backoff)
+                next_attempt[live.name] = time.time() + backoff[live.name]
+
+    @property
+    def ready(self):
+        return all(live.ready for live in self.collections)
+
+    def active_reports(self, district=None):
+        """Active reports from memory, or None if the view is not synced"""
+        if not self.reports.ready:
+            return None
+        reports = self.reports.snapshot()
+        if district:
+            reports = {report_id: report for report_id, report in reports.items() if report.get('district') == district}
+        return reports
+
+    def active_reports_near(self, latitude, longitude, radius_km):
+        """[(report_id, report, distance_km)] nearest first, or None if the view is not synced"""
+        if not self.reports.ready:
+            return None
+        return self.active_report_index.within_radius(latitude, longitude, radius_km)
+
+    def is_active_report(self, report):
+        return report.get('active') is True and report.get('status') in self.active_statuses
+
+    def report_clusters_for(self, zoom, bbox=None, district=None):
+        """Clusters of recent reports for a map view, or None if the view is not synced"""
+        if not self.recent_reports.ready:
+            return None
+        return self.report_clusters.clusters(zoom, bbox, district)
+
+    def tile_layer(self, layer):
+        """(SpatialIndex, TileVersions) for a tile layer, or None if the view is not synced"""
+        live, index, versions = self.tile_layers[layer]
+        if not live.ready:
+            return None
+        return index, versions
+
+    def open_assignments_near(self, latitude, longitude, radius_km):
+        """[(assignment_id, assignment, distance_km)] nearest first, or None if the view is not synced"""
+        if not self.assignments.ready:
+            return None
+        return self.assignment_index.within_radius(latitude, longitude, radius_km)
+
+    def open_assignments(self):
+        """Open lab assignments from memory, or None if the view is not synced"""
+        if not self.assignments.ready:
+            return None
+        return self.assignments.snapshot()
+
+    def status(self):
+        return {
+            live.name: {
+                'ready': live.ready,
+                'documents': len(live.documents),
+                'lastEventAt': live.last_event_at
+            }
+            for live in self.collections
+        } | {'resubscribes': self.resubscribe_count}
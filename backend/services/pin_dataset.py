@@ -0,0 +1,174 @@
+"""
+Compact binary PIN code dataset, memory-mapped on first use
+
+File layout (little-endian):
+    header      8s magic, uint32 count, uint32 string count
+    pins        uint32[count], sorted ascending
+    latitudes   float32[count]
+    longitudes  float32[count]
+    districts   uint32[count], index into the string table
+    localities  uint32[count], index into the string table
+    offsets     uint32[string count + 1], byte offsets into the string blob
+    strings     UTF-8 blob of the interned district and locality names
+
+The arrays are numpy views onto the mapping, so pre-forked workers share the
+pages instead of each holding a dict of dicts. Single lookups go through
+memoryviews of the same pages, which are cheaper than numpy scalars.
+"""
+
+import bisect
+import mmap
+import struct
+
+import numpy as np
+
+MAGIC = b'LUITPIN1'
+HEADER = struct.Struct('<8sII')
+
+
+def write_dataset(path, entries):
+    """
+    Write PIN code entries in the compact format
+
+    Args:
+        path (str): Output file
+        entries (dict): {'781001': {'latitude', 'longitude', 'locality', 'district'}, ...}
+    """
+    pins = sorted(entries, key=int)
+    strings = {}
+
+    def intern(value):
+        return strings.setdefault(value or '', len(strings))
+
+    districts = [intern(entries[pin]['district']) for pin in pins]
+    localities = [intern(entries[pin]['locality']) for pin in pins]
+    encoded = [value.encode('utf-8') for value in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype='<u4')
+    offsets[1:] = np.cumsum([len(value) for value in encoded])
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(pins), len(encoded)))
+        f.write(np.array([int(pin) for pin in pins], dtype='<u4').tobytes())
+        f.write(np.array([entries[pin]['latitude'] for pin in pins], dtype='<f4').tobytes())
+        f.write(np.array([entries[pin]['longitude'] for pin in pins], dtype='<f4').tobytes())
+        f.write(np.array(districts, dtype='<u4').tobytes())
+        f.write(np.array(localities, dtype='<u4').tobytes())
+        f.write(offsets.tobytes())
+        f.write(b''.join(encoded))
+
+
+class PinDataset:
+    """Read-only view of a compact PIN code file"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, string_count = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a PIN code dataset')
+
+        offset = HEADER.size
+
+        def array(dtype, length):
+            nonlocal offset
+            view = np.frombuffer(self._mmap, dtype=dtype, count=length, offset=offset)
+            offset += view.nbytes
+            return view
+
+        self.pins = array('<u4', count)
+        self.latitudes = array('<f4', count)
+        self.longitudes = array('<f4', count)
+        self.districts = array('<u4', count)
+        self.localities = array('<u4', count)
+        self._offsets = array('<u4', string_count + 1)
+        self._strings_offset = offset
+
+        # Native-order views for scalar access (the file is little-endian, as are supported hosts)
+        self._pin_values = self._scalars(self.pins, 'I')
+        self._latitude_values = self._scalars(self.latitudes, 'f')
+        self._longitude_values = self._scalars(self.longitudes, 'f')
+        self._district_values = self._scalars(self.districts, 'I')
+        self._locality_values = self._scalars(self.localities, 'I')
+        self._offset_values = self._scalars(self._offsets, 'I')
+
+    @staticmethod
+    def _scalars(array, fmt):
+        return memoryview(array).cast('B').cast(fmt)
+
+    def __len__(self):
+        return len(self.pins)
+
+    def string(self, index):
+        start = self._strings_offset + self._offset_values[index]
+        end = self._strings_offset + self._offset_values[index + 1]
+        return self._mmap[start:end].decode('utf-8')
+
+    def index_of(self, pincode):
+        """Row of a PIN code, or None if absent"""
+        try:
+            value = int(pincode)
+        except (TypeError, ValueError):
+            return None
+        row = bisect.bisect_left(self._pin_values, value)
+        if row < len(self._pin_values) and self._pin_values[row] == value:
+            return row
+        return None
+
+    def entry(self, row):
+        """PIN_CODE_DATABASE-style record for a row"""
+        return {
+            'latitude': round(self._latitude_values[row], 6),
+            'longitude': round(self._longitude_values[row], 6),
+            'locality': self.string(self._locality_values[row]),
+            'district': self.string(self._district_values[row])
+        }
+
+    def get(self, pincode):
+        row = self.index_of(pincode)
+        return None if row is None else self.entry(row)
+
+    def rows(self, pincodes):
+        """
+        Rows of many PIN codes in one vectorized search
+
+        Returns:
+            numpy.ndarray: Row of each PIN code, -1 where it is absent or not a number
+        """
+        values = np.array([int(pincode) if pincode.isdigit() else -1 for pincode in pincodes], dtype=np.int64)
+        if not len(self.pins):
+            return np.full(len(values), -1, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(self.pins, values), len(self.pins) - 1)
+        return np.where(self.pins[rows] == values, rows, -1)
+
+    def columns(self, rows):
+        """
+        (latitudes, longitudes, localities, districts) lists for many rows
+
+        Names are decoded once per distinct string rather than once per row.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        names = {}
+
+        def decode(indices):
+            values = []
+            for index in indices.tolist():
+                value = names.get(index)
+                if value is None:
+                    value = names[index] = self.string(index)
+                values.append(value)
+            return values
+
+        # np.round on the float64 values agrees with round(value, 6) in entry()
+        return (np.round(self.latitudes[rows].astype(np.float64), 6).tolist(),
+                np.round(self.longitudes[rows].astype(np.float64), 6).tolist(),
+                decode(self.localities[rows]),
+                decode(self.districts[rows]))
+
+    def pincode(self, row):
+        return f'{self._pin_values[row]:06d}'
+
+    def items(self):
+        """(pincode, record) for every row, in PIN order"""
+        for row in range(len(self.pins)):
+            yield self.pincode(row), self.entry(row)
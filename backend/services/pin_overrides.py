@@ -0,0 +1,104 @@
+"""
+PIN code overrides added at runtime, persisted and shared by every worker
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from services.geo import coordinates
+
+logger = logging.getLogger(__name__)
+
+# One document per overridden PIN code, keyed by the PIN code
+OVERRIDES_COLLECTION = 'pincode_overrides'
+
+# Counter bumped with every override write, so workers can tell cheaply whether anything changed
+VERSION_COLLECTION = 'pincode_override_versions'
+VERSION_DOC_ID = 'current'
+
+OVERRIDE_FIELDS = ('latitude', 'longitude', 'locality', 'district')
+
+
+def _utc_timestamp(value):
+    """updatedAt as an aware UTC datetime, or None if missing or written without a timezone"""
+    try:
+        timestamp = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    return timestamp.astimezone(timezone.utc) if timestamp.tzinfo else None
+
+
+class PinOverrides:
+    """
+    Overrides from the pincode_overrides collection, held in memory
+
+    Every override is loaded on first use. After that, current() reads the
+    version counter at most once per check_interval seconds and, only when it
+    has moved, fetches the overrides updated since the last fetch (less
+    clock_skew, to tolerate clocks that differ between hosts). updatedAt is
+    stored in UTC; overrides saved without a timezone are still loaded, but
+    never move the fetch window. Writes from
+    this process apply immediately; writes from other workers show up
+    within check_interval.
+    """
+
+    def __init__(self, backend_getter, check_interval=30.0, clock_skew=300.0):
+        self._backend_getter = backend_getter
+        self.check_interval = check_interval
+        self.clock_skew = clock_skew
+        self.records = {}
+        self.version = None
+        self._updated_since = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        """{pincode: record} of every override, refreshed if the check interval has passed"""
+        if self._checked_at is None or time.monotonic() - self._checked_at >= self.check_interval:
+            with self._lock:
+                if self._checked_at is None or time.monotonic() - self._checked_at >= self.check_interval:
+                    self._refresh()
+        return self.records
+
+    def _refresh(self):
+        self._checked_at = time.monotonic()
+        try:
+            backend = self._backend_getter()
+            version = (backend.get(VERSION_COLLECTION, VERSION_DOC_ID) or {}).get('version', 0)
+            if version == self.version:
+                return
+            filters = []
+            if self._updated_since is not None:
+                since = self._updated_since - timedelta(seconds=self.clock_skew)
+                filters.append(('updatedAt', '>=', since.isoformat()))
+            rows = backend.query(OVERRIDES_COLLECTION, filters)
+        except Exception as e:
+            logger.error(f"❌ Could not refresh PIN code overrides: {str(e)}")
+            return
+
+        records = dict(self.records)
+        for pincode, data in rows:
+            if coordinates(data) is None:
+                logger.warning(f"⚠️ Skipping PIN code override {pincode} without valid coordinates")
+            else:
+                records[pincode] = {field: data.get(field) for field in OVERRIDE_FIELDS}
+            updated_at = _utc_timestamp(data.get('updatedAt'))
+            if updated_at and (self._updated_since is None or updated_at > self._updated_since):
+                self._updated_since = updated_at
+        if rows:
+            logger.info(f"Applied {len(rows)} PIN code overrides (version {version})")
+        self.records = records
+        self.version = version
+
+    def save(self, pincode, record):
+        """Persist an override and apply it in this process"""
+        data = {field: record[field] for field in OVERRIDE_FIELDS}
+        self._backend_getter().commit_batch([
+            # UTC, so the updatedAt window compares correctly across hosts in any timezone
+            ('set', OVERRIDES_COLLECTION, pincode, {**data, 'updatedAt': datetime.now(timezone.utc).isoformat()}),
+            ('increment', VERSION_COLLECTION, VERSION_DOC_ID, {'version': 1}, None)
+        ])
+        with self._lock:
+            self.records = {**self.records, pincode: data}
@@ -3,11 +3,33 @@ PIN Code to Latitude/Longitude conversion service
 Maps Indian PIN codes to their geographical coordinates
 """
 
+import heapq
 import logging
+import math
+import os
+import threading
+
+from services.distance import EARTH_RADIUS_KM
+from services.geo import coordinates
+from services.pin_dataset import PinDataset
+from services.pin_overrides import PinOverrides
+from services.pin_search import PinSearchIndex, MATCH_ORDER
 
 logger = logging.getLogger(__name__)
 
-# PIN code to coordinates mapping for Assam and surrounding regions
+# Placeholder names written when a report does not say where it is from
+UNKNOWN_NAMES = (None, '', 'Unknown')
+
+# Compact national PIN dataset (see services/pin_dataset.py and
+# scripts/build_pin_dataset.py). Optional: without it only the entries below are known.
+PIN_DATASET_PATH = os.getenv(
+    'PIN_DATASET_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'pincodes.bin')
+)
+
+# PIN code to coordinates mapping for Assam and surrounding regions. These
+# entries take precedence over the dataset file; overrides added with
+# add_pincode (see services/pin_overrides.py) take precedence over both.
 # Format: 'PINCODE': {'latitude': float, 'longitude': float, 'locality': 'Name', 'district': 'District'}
 PIN_CODE_DATABASE = {
     # Kamrup Metropolitan District
@@ -55,6 +77,78 @@ PIN_CODE_DATABASE = {
 }
 
 
+_dataset = None
+_dataset_loaded = False
+_dataset_lock = threading.Lock()
+
+
+def _storage_backend():
+    # firebase_service imports this module, so it is only looked up once needed
+    from services.firebase_service import firebase_service
+    return firebase_service.backend
+
+
+# Overrides added with add_pincode, persisted in the pincode_overrides collection
+_overrides = PinOverrides(
+    _storage_backend,
+    check_interval=float(os.getenv('PIN_OVERRIDES_CHECK_INTERVAL', 30))
+)
+
+
+def _get_dataset():
+    """The memory-mapped PIN dataset, opened on first use, or None if there is no file"""
+    global _dataset, _dataset_loaded
+    if not _dataset_loaded:
+        with _dataset_lock:
+            if not _dataset_loaded:
+                if os.path.exists(PIN_DATASET_PATH):
+                    try:
+                        _dataset = PinDataset(PIN_DATASET_PATH)
+                        logger.info(f"Loaded {len(_dataset)} PIN codes from {PIN_DATASET_PATH}")
+                    except (OSError, ValueError) as e:
+                        logger.error(f"❌ Could not load PIN dataset {PIN_DATASET_PATH}: {str(e)}")
+                _dataset_loaded = True
+    return _dataset
+
+
+def _lookup(pincode: str, overrides: dict = None):
+    """PIN record from the overrides, the built-in entries or the dataset file, or None"""
+    if overrides is None:
+        overrides = _overrides.current()
+    data = overrides.get(pincode) or PIN_CODE_DATABASE.get(pincode)
+    if data is None:
+        dataset = _get_dataset()
+        if dataset is not None:
+            data = dataset.get(pincode)
+    return data
+
+
+def _base_pincodes():
+    """(pincode, record) for the built-in entries and the dataset file, without overrides"""
+    dataset = _get_dataset()
+    if dataset is not None:
+        for pincode, data in dataset.items():
+            if pincode not in PIN_CODE_DATABASE:
+                yield pincode, data
+    yield from list(PIN_CODE_DATABASE.items())
+
+
+_search_index = None
+_search_index_lock = threading.Lock()
+
+
+def _get_search_index() -> PinSearchIndex:
+    """The locality and district search index over the base PIN codes, built on first use"""
+    global _search_index
+    index = _search_index
+    if index is None:
+        with _search_index_lock:
+            if _search_index is None:
+                _search_index = PinSearchIndex(_base_pincodes())
+            index = _search_index
+    return index
+
+
 def get_coordinates_from_pincode(pincode: str) -> dict:
     """
     Convert PIN code to latitude and longitude
@@ -96,8 +190,8 @@ def get_coordinates_from_pincode(pincode: str) -> dict:
         # Clean PIN code
         pincode = pincode.strip()
         
-        if pincode in PIN_CODE_DATABASE:
-            data = PIN_CODE_DATABASE[pincode]
+        data = _lookup(pincode)
+        if data is not None:
             logger.info(f"✅ PIN code {pincode} found in database: {data}")
             return {
                 'success': True,
@@ -143,12 +237,20 @@ def get_pincode_info(pincode: str) -> dict:
     return get_coordinates_from_pincode(pincode)
 
 
+def _search_exact(field: str, name: str) -> list:
+    """PIN codes whose field equals name, from the search index and the overrides"""
+    overrides, override_index, _ = _get_override_indexes()
+    results = [pincode for pincode in _get_search_index().exact(field, name) if pincode not in overrides]
+    results.extend(override_index.exact(field, name))
+    return results
+
+
 def search_by_locality(locality: str) -> list:
     """
     Search all PIN codes for a specific locality
     
     Args:
-        locality (str): Locality name
+        locality (str): Locality name (case and punctuation are ignored)
     
     Returns:
         list: List of PIN codes matching the locality
@@ -158,10 +260,7 @@ def search_by_locality(locality: str) -> list:
         ['781001', '781002', '781003', ...]
     """
     try:
-        results = [
-            pincode for pincode, data in PIN_CODE_DATABASE.items()
-            if data['locality'].lower() == locality.lower()
-        ]
+        results = _search_exact('locality', locality)
         logger.info(f"🔍 Found {len(results)} PIN codes for locality {locality}")
         return results
     except Exception as e:
@@ -174,7 +273,7 @@ def search_by_district(district: str) -> list:
     Search all PIN codes for a specific district
     
     Args:
-        district (str): District name
+        district (str): District name (case and punctuation are ignored)
     
     Returns:
         list: List of PIN codes matching the district
@@ -184,10 +283,7 @@ def search_by_district(district: str) -> list:
         ['781001', '781002', '781003', ...]
     """
     try:
-        results = [
-            pincode for pincode, data in PIN_CODE_DATABASE.items()
-            if data['district'].lower() == district.lower()
-        ]
+        results = _search_exact('district', district)
         logger.info(f"🔍 Found {len(results)} PIN codes for district {district}")
         return results
     except Exception as e:
@@ -195,9 +291,59 @@ def search_by_district(district: str) -> list:
         return []
 
 
+def search_pincodes(query: str, field: str = 'locality', limit: int = 10) -> dict:
+    """
+    Autocomplete PIN codes from a partly typed or misspelt locality or district
+    
+    Args:
+        query (str): Text typed so far, e.g. 'guwa' or 'Guwahti'
+        field (str): 'locality' or 'district'
+        limit (int): Most PIN codes to return
+    
+    Returns:
+        dict: {
+            'success': bool,
+            'results': [{'pincode', 'latitude', 'longitude', 'locality', 'district', 'match'}],
+            'error': str or None
+        }
+        where match is 'exact', 'prefix' or 'fuzzy'
+    """
+    if field not in PinSearchIndex.FIELDS:
+        return {'success': False, 'results': [],
+                'error': f"Field must be one of: {', '.join(PinSearchIndex.FIELDS)}"}
+    
+    limit = max(1, int(limit))
+    overrides, override_index, _ = _get_override_indexes()
+    # Overridden PIN codes are matched on their override names instead of the indexed ones
+    matches = [
+        (pincode, match) for pincode, _, match in
+        _get_search_index().search(field, query, limit, exclude=overrides) + override_index.search(field, query, limit)
+    ]
+    matches.sort(key=lambda item: MATCH_ORDER.index(item[1]))
+    
+    results = []
+    for pincode, match in matches[:limit]:
+        data = _lookup(pincode, overrides)
+        if data is None:
+            continue
+        results.append({
+            'pincode': pincode,
+            'latitude': data['latitude'],
+            'longitude': data['longitude'],
+            'locality': data['locality'],
+            'district': data['district'],
+            'match': match
+        })
+    return {'success': True, 'results': results, 'error': None}
+
+
 def add_pincode(pincode: str, latitude: float, longitude: float, locality: str, district: str) -> dict:
     """
-    Add a new PIN code to the database (runtime only, not persistent)
+    Add or correct a PIN code
+    
+    The entry is stored in the pincode_overrides collection and takes
+    precedence over the built-in entries and the dataset file in every
+    worker (other workers pick it up within PIN_OVERRIDES_CHECK_INTERVAL).
     
     Args:
         pincode (str): PIN code
@@ -210,7 +356,7 @@ def add_pincode(pincode: str, latitude: float, longitude: float, locality: str,
         dict: Success or error message
     """
     try:
-        if pincode in PIN_CODE_DATABASE:
+        if _lookup(pincode) is not None:
             logger.warning(f"⚠️ PIN code {pincode} already exists, updating...")
         
         if not (-90 <= latitude <= 90) or not (-180 <= longitude <= 180):
@@ -219,12 +365,12 @@ def add_pincode(pincode: str, latitude: float, longitude: float, locality: str,
                 'error': 'Invalid coordinates: latitude must be -90 to 90, longitude -180 to 180'
             }
         
-        PIN_CODE_DATABASE[pincode] = {
+        _overrides.save(pincode, {
             'latitude': float(latitude),
             'longitude': float(longitude),
             'locality': locality,
             'district': district
-        }
+        })
         logger.info(f"✅ Added PIN code {pincode}: {locality}, {district}")
         return {
             'success': True,
@@ -239,10 +385,97 @@ def add_pincode(pincode: str, latitude: float, longitude: float, locality: str,
         }
 
 
+# PIN codes per chunk when resolving a batch incrementally
+RESOLVE_CHUNK_SIZE = 1000
+
+
+def _distinct_pincodes(pincodes: list) -> list:
+    """Cleaned PIN codes in first-seen order, without duplicates or non-string/integer values"""
+    return list(dict.fromkeys(
+        str(pincode).strip() for pincode in pincodes
+        if isinstance(pincode, (str, int)) and not isinstance(pincode, bool)
+    ))
+
+
+def _resolve_distinct(unique: list) -> dict:
+    """Columns for already de-duplicated PIN codes (see resolve_pincodes)"""
+    overrides = _overrides.current()
+    records = []
+    for pincode in unique:
+        data = overrides.get(pincode) or PIN_CODE_DATABASE.get(pincode)
+        records.append(None if data is None else
+                       (data['latitude'], data['longitude'], data['locality'], data['district']))
+    
+    dataset = _get_dataset()
+    if dataset is not None:
+        pending = [position for position, record in enumerate(records) if record is None]
+        if pending:
+            rows = dataset.rows([unique[position] for position in pending])
+            found = rows >= 0
+            positions = [position for position, hit in zip(pending, found.tolist()) if hit]
+            for position, latitude, longitude, locality, district in zip(positions, *dataset.columns(rows[found])):
+                records[position] = (latitude, longitude, locality, district)
+    
+    found = [(pincode, ) + record for pincode, record in zip(unique, records) if record is not None]
+    columns = [list(column) for column in zip(*found)] if found else [[], [], [], [], []]
+    result = dict(zip(('pincode', 'latitude', 'longitude', 'locality', 'district'), columns))
+    result['missing'] = [pincode for pincode, record in zip(unique, records) if record is None]
+    return result
+
+
+def resolve_pincodes(pincodes: list) -> dict:
+    """
+    Resolve many PIN codes in one pass, as columns
+    
+    Duplicates are resolved once. PIN codes not in the overrides or the
+    built-in entries are looked up in the dataset file with a single
+    vectorized search.
+    
+    Args:
+        pincodes (list): PIN codes (strings or integers)
+    
+    Returns:
+        dict: {
+            'pincode': [...], 'latitude': [...], 'longitude': [...],
+            'locality': [...], 'district': [...],   # one entry per PIN code found, in input order
+            'missing': [...]                        # PIN codes not found
+        }
+    
+    Example:
+        >>> resolve_pincodes(['781001', '781001', '000000'])
+        {'pincode': ['781001'], 'latitude': [26.1445], ..., 'missing': ['000000']}
+    """
+    unique = _distinct_pincodes(pincodes)
+    result = _resolve_distinct(unique)
+    logger.info(f"🔍 Resolved {len(result['pincode'])} of {len(unique)} distinct PIN codes")
+    return result
+
+
+def iter_resolve_pincodes(pincodes: list, chunk_size: int = RESOLVE_CHUNK_SIZE):
+    """
+    Resolve a large batch of PIN codes chunk by chunk
+    
+    Duplicates are dropped across the whole batch, not just within a chunk.
+    
+    Yields:
+        dict: resolve_pincodes-style columns for up to chunk_size distinct PIN codes
+    """
+    unique = _distinct_pincodes(pincodes)
+    found = 0
+    for start in range(0, len(unique), chunk_size):
+        chunk = _resolve_distinct(unique[start:start + chunk_size])
+        found += len(chunk['pincode'])
+        yield chunk
+    logger.info(f"🔍 Resolved {found} of {len(unique)} distinct PIN codes")
+
+
 def batch_get_coordinates(pincodes: list) -> dict:
     """
     Get coordinates for multiple PIN codes
     
+    Resolved in one pass with resolve_pincodes; prefer that for large
+    batches, since this builds a dict per PIN code.
+    
     Args:
         pincodes (list): List of PIN codes
     
@@ -256,7 +489,258 @@ def batch_get_coordinates(pincodes: list) -> dict:
             '781002': {'success': True, 'latitude': 26.1507, ...}
         }
     """
+    resolved = resolve_pincodes([pincode for pincode in pincodes if isinstance(pincode, str)])
+    found = {pincode: position for position, pincode in enumerate(resolved['pincode'])}
+    
     results = {}
     for pincode in pincodes:
-        results[pincode] = get_coordinates_from_pincode(pincode)
+        if not pincode or not isinstance(pincode, str):
+            error = 'Invalid PIN code format'
+        elif pincode.strip() in found:
+            position = found[pincode.strip()]
+            results[pincode] = {
+                'success': True,
+                'latitude': resolved['latitude'][position],
+                'longitude': resolved['longitude'][position],
+                'locality': resolved['locality'][position],
+                'district': resolved['district'][position],
+                'error': None
+            }
+            continue
+        else:
+            error = f'PIN code {pincode.strip()} not found in database'
+        results[pincode] = {
+            'success': False,
+            'latitude': None,
+            'longitude': None,
+            'locality': None,
+            'district': None,
+            'error': error
+        }
     return results
+
+
+def location_fields(document: dict, fill_names: bool = True) -> dict:
+    """
+    Fields that locate a document from its PIN code
+    
+    Documents that already have valid coordinates, or whose PIN code is
+    unknown, get nothing.
+    
+    Args:
+        document (dict): Report or lab assignment data with a 'pinCode'
+        fill_names (bool): Also fill 'district' and 'localityName' when missing or 'Unknown'
+    
+    Returns:
+        dict: Fields to set on the document, e.g.
+              {'latitude': 26.1445, 'longitude': 91.7362, 'locationSource': 'pinCode', ...}
+    """
+    if coordinates(document) is not None or not document.get('pinCode'):
+        return {}
+    
+    result = get_coordinates_from_pincode(str(document['pinCode']))
+    if not result['success']:
+        return {}
+    
+    fields = {
+        'latitude': result['latitude'],
+        'longitude': result['longitude'],
+        'locationSource': 'pinCode'
+    }
+    if fill_names:
+        if document.get('district') in UNKNOWN_NAMES:
+            fields['district'] = result['district']
+        if document.get('localityName') in UNKNOWN_NAMES:
+            fields['localityName'] = result['locality']
+    return fields
+
+
+# ==================== REVERSE GEOCODING ====================
+
+def _unit_vector(latitude: float, longitude: float) -> tuple:
+    """Point on the unit sphere; straight-line distance between these grows with great-circle distance"""
+    lat = math.radians(latitude)
+    lon = math.radians(longitude)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+
+class PinCodeTree:
+    """
+    KD-tree over PIN code locations
+    
+    Built once over 3-D unit vectors, so the nearest neighbours in the tree
+    are the nearest PIN codes on the Earth's surface. A k-nearest query
+    visits O(log n) nodes for small k.
+    """
+    
+    def __init__(self, pincodes):
+        entries = [
+            (_unit_vector(data['latitude'], data['longitude']), pincode)
+            for pincode, data in pincodes
+        ]
+        self.size = len(entries)
+        self.root = self._build(entries, 0)
+    
+    def _build(self, entries: list, depth: int):
+        if not entries:
+            return None
+        axis = depth % 3
+        entries.sort(key=lambda entry: entry[0][axis])
+        mid = len(entries) // 2
+        point, pincode = entries[mid]
+        return (point, pincode, axis,
+                self._build(entries[:mid], depth + 1),
+                self._build(entries[mid + 1:], depth + 1))
+    
+    def nearest(self, latitude: float, longitude: float, k: int = 1, exclude=()) -> list:
+        """
+        The k PIN codes closest to a point, skipping those in exclude
+        
+        Returns:
+            list: (pincode, distance_km) tuples, nearest first
+        """
+        target = _unit_vector(latitude, longitude)
+        heap = []  # (-squared chord length, pincode), farthest kept result on top
+        self._search(self.root, target, k, heap, exclude)
+        results = sorted((-neg_d2, pincode) for neg_d2, pincode in heap)
+        return [
+            (pincode, 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(d2) / 2)))
+            for d2, pincode in results
+        ]
+    
+    def _search(self, node, target: tuple, k: int, heap: list, exclude):
+        if node is None:
+            return
+        point, pincode, axis, left, right = node
+        if pincode not in exclude:
+            d2 = (point[0] - target[0]) ** 2 + (point[1] - target[1]) ** 2 + (point[2] - target[2]) ** 2
+            if len(heap) < k:
+                heapq.heappush(heap, (-d2, pincode))
+            elif d2 < -heap[0][0]:
+                heapq.heapreplace(heap, (-d2, pincode))
+        
+        diff = target[axis] - point[axis]
+        near, far = (left, right) if diff < 0 else (right, left)
+        self._search(near, target, k, heap, exclude)
+        # The far side can only hold closer points if the splitting plane is nearer than the worst kept result
+        if len(heap) < k or diff * diff < -heap[0][0]:
+            self._search(far, target, k, heap, exclude)
+
+
+_pin_tree = None
+_pin_tree_lock = threading.Lock()
+
+
+def _get_pin_tree() -> PinCodeTree:
+    """The KD-tree over every known PIN code, built on first use"""
+    global _pin_tree
+    tree = _pin_tree
+    if tree is None:
+        with _pin_tree_lock:
+            if _pin_tree is None:
+                _pin_tree = PinCodeTree(_base_pincodes())
+            tree = _pin_tree
+    return tree
+
+
+_override_indexes = None
+_override_indexes_lock = threading.Lock()
+
+
+def _get_override_indexes() -> tuple:
+    """
+    (overrides, PinSearchIndex, PinCodeTree) over the current overrides
+    
+    The base indexes skip overridden PIN codes and these small indexes hold
+    their override records instead. They are rebuilt only when a refresh or
+    add_pincode replaces the override records.
+    """
+    global _override_indexes
+    overrides = _overrides.current()
+    indexes = _override_indexes
+    if indexes is None or indexes[0] is not overrides:
+        with _override_indexes_lock:
+            if _override_indexes is None or _override_indexes[0] is not overrides:
+                _override_indexes = (overrides, PinSearchIndex(overrides.items()), PinCodeTree(overrides.items()))
+            indexes = _override_indexes
+    return indexes
+
+
+def reverse_geocode(latitude: float, longitude: float, k: int = 1) -> dict:
+    """
+    Find the PIN codes nearest to a coordinate
+    
+    Args:
+        latitude (float): Latitude of the point
+        longitude (float): Longitude of the point
+        k (int): Number of PIN codes to return
+    
+    Returns:
+        dict: {
+            'success': bool,
+            'results': [{'pincode', 'latitude', 'longitude', 'locality', 'district', 'distance'}],
+            'error': str or None
+        }
+    
+    Example:
+        >>> reverse_geocode(26.1446, 91.7360)
+        {
+            'success': True,
+            'results': [{'pincode': '781001', 'distance': 0.02, ...}],
+            'error': None
+        }
+    """
+    try:
+        latitude = float(latitude)
+        longitude = float(longitude)
+        if not (-90 <= latitude <= 90) or not (-180 <= longitude <= 180):
+            return {
+                'success': False,
+                'results': [],
+                'error': 'Invalid coordinates: latitude must be -90 to 90, longitude -180 to 180'
+            }
+        
+        k = max(1, int(k))
+        overrides, _, override_tree = _get_override_indexes()
+        # Overridden PIN codes are measured at their override coordinates, not their indexed ones
+        nearest = (_get_pin_tree().nearest(latitude, longitude, k, exclude=overrides) +
+                   override_tree.nearest(latitude, longitude, k))
+        nearest.sort(key=lambda item: item[1])
+        
+        results = []
+        for pincode, distance in nearest[:k]:
+            data = _lookup(pincode, overrides)
+            if data is None:
+                continue
+            results.append({
+                'pincode': pincode,
+                'latitude': data['latitude'],
+                'longitude': data['longitude'],
+                'locality': data['locality'],
+                'district': data['district'],
+                'distance': round(distance, 3)
+            })
+        return {'success': bool(results), 'results': results,
+                'error': None if results else 'No PIN codes in database'}
+    
+    except (TypeError, ValueError) as e:
+        return {'success': False, 'results': [], 'error': f'Invalid coordinates: {str(e)}'}
+
+
+def batch_reverse_geocode(points: list, k: int = 1) -> list:
+    """
+    Reverse geocode many coordinates against one KD-tree
+    
+    Args:
+        points (list): [{'latitude': float, 'longitude': float}, ...]
+        k (int): Number of PIN codes per point
+    
+    Returns:
+        list: One reverse_geocode result per point, in order
+    """
+    return [
+        reverse_geocode(point.get('latitude'), point.get('longitude'), k)
+        if isinstance(point, dict) else
+        {'success': False, 'results': [], 'error': 'Each point needs latitude and longitude'}
+        for point in points
+    ]
@@ -0,0 +1,440 @@
+"""
+Durable queue for SMS received by the webhook
+
+The webhook only appends the raw message to a local SQLite file and replies.
+SmsIngester threads claim queued messages in batches, parse them and write
+the resulting reports with batched writes. Every worker process on a host
+shares the same file, so a claim is a short write transaction and a claim
+left by a crashed worker is picked up again once its lease expires.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from services.sms_service import parse_sms_batch, validate_sms_data
+
+logger = logging.getLogger(__name__)
+
+# Message states. 'processing' rows whose lease has expired are claimed again.
+PENDING = 'pending'
+PROCESSING = 'processing'
+DONE = 'done'            # report written
+REJECTED = 'rejected'    # not a valid report; not retried
+FAILED = 'failed'        # write failed max_attempts times; see replay()
+STATUSES = (PENDING, PROCESSING, DONE, REJECTED, FAILED)
+
+# Reports per batched write. Each report is one write plus at most two
+# counter increments, and a commit_batch chunk of 500 operations is atomic.
+MAX_SMS_BATCH_SIZE = 150
+
+
+class QueueFullError(Exception):
+    """Raised when enqueuing while the backlog is at its maximum depth"""
+
+
+class SmsQueue:
+    """
+    SQLite-backed queue of incoming SMS
+
+    Each message gets its report ID when it is enqueued, so writing it again
+    after a retry or replay finds the saved report instead of adding a
+    duplicate. Messages carrying a gateway message ID (Twilio MessageSid,
+    SNS MessageId) are enqueued once however often the gateway retries.
+    """
+
+    def __init__(self, path, max_depth=50000, lease=120.0, depth_check_interval=1.0):
+        self.path = path
+        self.max_depth = max_depth
+        self.lease = lease
+        self.depth_check_interval = depth_check_interval
+        self._depth = None
+        self._depth_checked_at = None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            # An acknowledged message must survive a power cut, not just a crash
+            self._conn.execute('PRAGMA synchronous=FULL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS sms_messages ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' external_id TEXT UNIQUE,'
+            ' report_id TEXT NOT NULL,'
+            ' sender TEXT,'
+            ' provider TEXT,'
+            ' body TEXT NOT NULL,'
+            ' status TEXT NOT NULL,'
+            ' attempts INTEGER NOT NULL DEFAULT 0,'
+            ' received_at REAL NOT NULL,'
+            ' available_at REAL NOT NULL,'
+            ' finished_at REAL,'
+            ' error TEXT'
+            ')'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS sms_messages_ready ON sms_messages (status, available_at)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS sms_messages_finished ON sms_messages (status, finished_at)')
+        logger.info(f"SMS queue ready at {path}")
+
+    def _transaction(self, work):
+        """Run work(conn) in an IMMEDIATE transaction, which takes the write lock up front"""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = work(self._conn)
+                self._conn.execute('COMMIT')
+                return result
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def backlog(self):
+        """Messages waiting or being processed, re-counted at most once per depth_check_interval"""
+        now = time.monotonic()
+        if self._depth_checked_at is None or now - self._depth_checked_at >= self.depth_check_interval:
+            with self._lock:
+                self._depth = self._conn.execute(
+                    'SELECT COUNT(*) FROM sms_messages WHERE status IN (?, ?)', (PENDING, PROCESSING)
+                ).fetchone()[0]
+            self._depth_checked_at = now
+        return self._depth
+
+    def enqueue(self, body, sender=None, provider=None, external_id=None):
+        """
+        Durably append a message
+
+        Returns:
+            tuple: (queue ID, report ID, duplicate), duplicate being True if
+                   external_id was already queued
+
+        Raises:
+            QueueFullError: If the backlog has reached max_depth
+        """
+        if self.max_depth and self.backlog() >= self.max_depth:
+            raise QueueFullError(f'SMS queue backlog is at its limit of {self.max_depth}')
+        now = time.time()
+        report_id = str(uuid.uuid4())
+        with self._lock:
+            cursor = self._conn.execute(
+                'INSERT OR IGNORE INTO sms_messages'
+                ' (external_id, report_id, sender, provider, body, status, received_at, available_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (external_id or None, report_id, sender, provider, body, PENDING, now, now)
+            )
+            if cursor.rowcount:
+                if self._depth is not None:
+                    self._depth += 1
+                return cursor.lastrowid, report_id, False
+            queue_id, report_id = self._conn.execute(
+                'SELECT id, report_id FROM sms_messages WHERE external_id = ?', (external_id, )
+            ).fetchone()
+            return queue_id, report_id, True
+
+    def claim(self, limit, max_attempts=None):
+        """
+        Take up to limit ready messages, oldest first, for one lease
+
+        A message whose lease expired after its max_attempts-th claim, e.g.
+        one that crashes the worker every time, is marked failed instead of
+        being claimed again.
+
+        Returns:
+            list: Message dicts (id, report_id, sender, provider, body, attempts, received_at)
+        """
+        def work(conn):
+            now = time.time()
+            if max_attempts:
+                abandoned = conn.execute(
+                    'UPDATE sms_messages SET status = ?, finished_at = ?, error = ?'
+                    ' WHERE status = ? AND available_at <= ? AND attempts >= ?',
+                    (FAILED, now, f'Lease expired after {max_attempts} attempts', PROCESSING, now, max_attempts)
+                ).rowcount
+                if abandoned:
+                    logger.warning(f"⚠️ {abandoned} SMS marked failed after their lease expired {max_attempts} times")
+            rows = conn.execute(
+                'SELECT id, report_id, sender, provider, body, attempts, received_at FROM sms_messages'
+                ' WHERE status IN (?, ?) AND available_at <= ? ORDER BY available_at, id LIMIT ?',
+                (PENDING, PROCESSING, now, limit)
+            ).fetchall()
+            conn.executemany(
+                'UPDATE sms_messages SET status = ?, attempts = attempts + 1, available_at = ? WHERE id = ?',
+                [(PROCESSING, now + self.lease, row[0]) for row in rows]
+            )
+            return rows
+
+        columns = ('id', 'report_id', 'sender', 'provider', 'body', 'attempts', 'received_at')
+        return [dict(zip(columns, row[:5] + (row[5] + 1, row[6]))) for row in self._transaction(work)]
+
+    def finish(self, status, outcomes):
+        """
+        Record the outcome of claimed messages
+
+        Args:
+            status (str): DONE, REJECTED or FAILED
+            outcomes (list): (queue ID, error or None) pairs
+        """
+        now = time.time()
+        self._transaction(lambda conn: conn.executemany(
+            'UPDATE sms_messages SET status = ?, finished_at = ?, error = ? WHERE id = ?',
+            [(status, now, error, queue_id) for queue_id, error in outcomes]
+        ))
+
+    def retry(self, queue_ids, error, delay):
+        """Put claimed messages back, ready again after delay seconds"""
+        self._transaction(lambda conn: conn.executemany(
+            'UPDATE sms_messages SET status = ?, available_at = ?, error = ? WHERE id = ?',
+            [(PENDING, time.time() + delay, error, queue_id) for queue_id in queue_ids]
+        ))
+
+    def replay(self, queue_ids=None, statuses=(FAILED, )):
+        """
+        Queue finished messages again with a fresh attempt count
+
+        Args:
+            queue_ids (list): Messages to replay; all with one of statuses if None
+            statuses (tuple): States that may be replayed, e.g. (FAILED, REJECTED)
+                              after a parser fix
+
+        Returns:
+            int: Messages queued again
+        """
+        placeholders = ', '.join('?' * len(statuses))
+        sql = (f'UPDATE sms_messages SET status = ?, attempts = 0, available_at = ?, finished_at = NULL, error = NULL'
+               f' WHERE status IN ({placeholders})')
+        now = time.time()
+
+        def work(conn):
+            if queue_ids is None:
+                return conn.execute(sql, (PENDING, now) + tuple(statuses)).rowcount
+            return sum(
+                conn.execute(sql + ' AND id = ?', (PENDING, now) + tuple(statuses) + (queue_id, )).rowcount
+                for queue_id in queue_ids
+            )
+
+        replayed = self._transaction(work)
+        self._depth_checked_at = None
+        return replayed
+
+    def purge(self, older_than):
+        """Delete done and rejected messages finished more than older_than seconds ago"""
+        cutoff = time.time() - older_than
+        return self._transaction(lambda conn: conn.execute(
+            'DELETE FROM sms_messages WHERE status IN (?, ?) AND finished_at < ?', (DONE, REJECTED, cutoff)
+        ).rowcount)
+
+    def failed(self, limit=100):
+        """Most recently failed messages, for inspection before a replay"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT id, sender, provider, body, attempts, received_at, finished_at, error FROM sms_messages'
+                ' WHERE status = ? ORDER BY finished_at DESC LIMIT ?', (FAILED, limit)
+            ).fetchall()
+        columns = ('id', 'sender', 'provider', 'body', 'attempts', 'received_at', 'finished_at', 'error')
+        return [dict(zip(columns, row)) for row in rows]
+
+    def metrics(self, window=60.0):
+        """
+        Backlog and throughput figures
+
+        Returns:
+            dict: counts per status, backlog (pending + processing), age in
+                  seconds of the oldest unprocessed message, and messages
+                  finished per second over the last window seconds
+        """
+        now = time.time()
+        with self._lock:
+            counts = dict(self._conn.execute('SELECT status, COUNT(*) FROM sms_messages GROUP BY status').fetchall())
+            oldest = self._conn.execute(
+                'SELECT MIN(received_at) FROM sms_messages WHERE status IN (?, ?)', (PENDING, PROCESSING)
+            ).fetchone()[0]
+            finished = dict(self._conn.execute(
+                'SELECT status, COUNT(*) FROM sms_messages WHERE status IN (?, ?, ?) AND finished_at >= ?'
+                ' GROUP BY status', (DONE, REJECTED, FAILED, now - window)
+            ).fetchall())
+        return {
+            'counts': {status: counts.get(status, 0) for status in STATUSES},
+            'backlog': counts.get(PENDING, 0) + counts.get(PROCESSING, 0),
+            'maxBacklog': self.max_depth,
+            'oldestAgeSeconds': round(now - oldest, 1) if oldest is not None else 0,
+            'perSecond': {status: round(count / window, 2) for status, count in finished.items()},
+            'windowSeconds': window
+        }
+
+
+def report_from_sms(data, message):
+    """Water quality report document for a parsed and validated SMS"""
+    sender = message.get('sender')
+    return {
+        'problem': data.get('problem'),
+        'sourceType': data.get('sourceType'),
+        'pinCode': data.get('pinCode'),
+        'localityName': data.get('localityName', 'Unknown'),
+        'district': data.get('district', 'Unknown'),
+        'status': 'reported',
+        'reportedAt': datetime.fromtimestamp(message['received_at']).isoformat(),
+        'reportedBy': f'SMS:{sender}' if sender else 'SMS',
+        'description': data.get('description', ''),
+        'active': True,
+        'upvotes': 0,
+        'verified': False
+    }
+
+
+class SmsIngester:
+    """
+    Worker threads draining an SmsQueue
+
+    Each worker claims up to batch_size messages, parses them in one pass,
+    marks invalid ones rejected and hands the reports to
+    write_reports({report_id: report}) in a single batched write. A failed
+    write puts the batch back with exponential backoff; after max_attempts
+    its messages are marked failed and wait for SmsQueue.replay.
+    """
+
+    def __init__(self, queue, write_reports, workers=2, batch_size=100, poll_interval=1.0,
+                 max_attempts=5, retry_delay=5.0, max_retry_delay=300.0, retention=7 * 86400.0):
+        self.queue = queue
+        self.write_reports = write_reports
+        self.workers = workers
+        self.batch_size = max(1, min(batch_size, MAX_SMS_BATCH_SIZE))
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.retention = retention
+        self.batches = 0
+        self.write_failures = 0
+        self.last_error = None
+        self._purged_at = 0.0
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'sms-ingester-{number}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.workers} SMS ingester threads in process {os.getpid()}")
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+    def notify(self):
+        """Wake an idle worker, e.g. right after an enqueue in this process"""
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                processed = self.process_batch()
+                if self.retention and time.time() - self._purged_at >= 3600:
+                    self._purged_at = time.time()
+                    purged = self.queue.purge(self.retention)
+                    if purged:
+                        logger.info(f"Purged {purged} finished SMS from the queue")
+            except Exception as e:
+                # Queue file errors; keep the thread alive and try again shortly
+                self.last_error = str(e)
+                logger.error(f"❌ SMS ingester error: {str(e)}", exc_info=True)
+                processed = 0
+            if not processed:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def process_batch(self):
+        """Claim, parse and write one batch; returns the number of messages claimed"""
+        messages = self.queue.claim(self.batch_size, self.max_attempts)
+        if not messages:
+            return 0
+        self.batches += 1
+
+        reports = {}
+        written = []
+        rejected = []
+        for message, parsed in zip(messages, parse_sms_batch([message['body'] for message in messages])):
+            if not parsed['success']:
+                rejected.append((message['id'], parsed.get('error')))
+                continue
+            validation = validate_sms_data(parsed['data'])
+            if not validation['valid']:
+                rejected.append((message['id'], '; '.join(validation.get('errors') or [])))
+                continue
+            reports[message['report_id']] = report_from_sms(validation['data'], message)
+            written.append(message)
+
+        if rejected:
+            self.queue.finish(REJECTED, rejected)
+        if not reports:
+            return len(messages)
+
+        try:
+            self.write_reports(reports)
+        except Exception as e:
+            self.write_failures += 1
+            self.last_error = str(e)
+            logger.error(f"❌ Failed to write {len(reports)} SMS reports: {str(e)}")
+            given_up = [message for message in written if message['attempts'] >= self.max_attempts]
+            retried = [message['id'] for message in written if message['attempts'] < self.max_attempts]
+            if given_up:
+                self.queue.finish(FAILED, [(message['id'], str(e)) for message in given_up])
+                logger.warning(f"⚠️ {len(given_up)} SMS marked failed after {self.max_attempts} attempts")
+            if retried:
+                attempts = min(message['attempts'] for message in written)
+                delay = min(self.retry_delay * 2 ** (attempts - 1), self.max_retry_delay)
+                self.queue.retry(retried, str(e), delay)
+            return len(messages)
+
+        self.queue.finish(DONE, [(message['id'], None) for message in written])
+        logger.info(f"✅ Saved {len(reports)} SMS reports ({len(rejected)} rejected)")
+        return len(messages)
+
+    def status(self):
+        return {
+            'workers': sum(1 for thread in self._threads if thread.is_alive()),
+            'batchSize': self.batch_size,
+            'batches': self.batches,
+            'writeFailures': self.write_failures,
+            'lastError': self.last_error
+        }
+
+
+_ingester = None
+_ingester_pid = None
+_ingester_lock = threading.Lock()
+
+
+def get_sms_ingester():
+    """
+    Queue and ingester threads for this process, started on first use
+
+    Configured by SMS_QUEUE_PATH (default sms_queue.db), SMS_QUEUE_WORKERS,
+    SMS_QUEUE_BATCH_SIZE, SMS_QUEUE_MAX_DEPTH, SMS_QUEUE_MAX_ATTEMPTS and
+    SMS_QUEUE_RETENTION_DAYS. Recreated after a fork, since threads and
+    SQLite connections do not survive one.
+    """
+    global _ingester, _ingester_pid
+    if _ingester_pid != os.getpid():
+        with _ingester_lock:
+            if _ingester_pid != os.getpid():
+                from services.firebase_service import firebase_service
+                queue = SmsQueue(
+                    os.getenv('SMS_QUEUE_PATH', 'sms_queue.db'),
+                    max_depth=int(os.getenv('SMS_QUEUE_MAX_DEPTH', 50000))
+                )
+                _ingester = SmsIngester(
+                    queue,
+                    firebase_service.add_water_quality_reports,
+                    workers=int(os.getenv('SMS_QUEUE_WORKERS', 2)),
+                    batch_size=int(os.getenv('SMS_QUEUE_BATCH_SIZE', 100)),
+                    max_attempts=int(os.getenv('SMS_QUEUE_MAX_ATTEMPTS', 5)),
+                    retention=float(os.getenv('SMS_QUEUE_RETENTION_DAYS', 7)) * 86400
+                ).start()
+                _ingester_pid = os.getpid()
+    return _ingester
@@ -3,12 +3,34 @@ SMS Formatting and Parsing Service
 Handles conversion of water quality reports to SMS format and parsing incoming SMS
 """
 
+import bisect
 import logging
 import re
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Field keys of the structured format ("PIN CODE: 781014", "ISSUE TYPE: ...").
+# One pattern finds every key; see extract_sms_fields for where values end.
+# The leading lookahead lets the regex engine skip to candidate first letters.
+_FIELD_KEY = re.compile(
+    r'(?=[PISLD])(?<![A-Z])(PIN\s*(?:CODE)?|ISSUE\s*(?:TYPE)?|PROBLEM|SOURCE\s*(?:TYPE)?|LOCATION|DESCRIPTION)\s*:',
+    re.IGNORECASE
+)
+
+# Characters after which a key starts a new field ("PIN CODE: 781014, ISSUE: ...")
+_FIELD_SEPARATORS = '\n\r,;|'
+
+# Value after a key: leading whitespace (including line breaks) skipped, up to the end of the line
+_FIELD_VALUE = re.compile(r'\s*([^\n]*)')
+_LEADING_DIGITS = re.compile(r'\d+')
+
+# First three letters of a field key -> field name
+_FIELD_NAMES = {
+    'PIN': 'PIN', 'ISS': 'ISSUE', 'PRO': 'PROBLEM',
+    'SOU': 'SOURCE', 'LOC': 'LOCATION', 'DES': 'DESCRIPTION'
+}
+
 
 def format_report_to_sms(report_data: dict) -> dict:
     """
@@ -90,31 +112,10 @@ def parse_sms_report(sms_text: str) -> dict:
         }
     """
     try:
-        if not sms_text or not isinstance(sms_text, str):
-            return {
-                'success': False,
-                'error': 'Invalid SMS text',
-                'data': None,
-                'format_detected': None
-            }
-        
-        sms_text = sms_text.strip()
-        
-        # Try to detect and parse compact format first
-        if sms_text.startswith('WQ|'):
-            return _parse_compact_format(sms_text)
-        
-        # Try to parse structured format
-        elif 'PIN' in sms_text.upper() or 'CODE' in sms_text.upper():
-            return _parse_structured_format(sms_text)
-        
-        else:
-            return {
-                'success': False,
-                'error': 'Unrecognized SMS format. Expected format starting with "WQ|" or containing "PIN CODE"',
-                'data': None,
-                'format_detected': 'unknown'
-            }
+        result = _parse_sms(sms_text, datetime.now().isoformat())
+        if result['success']:
+            logger.info(f"✅ Parsed {result['format_detected']} SMS format for PIN {result['data']['pinCode']}")
+        return result
     
     except Exception as e:
         logger.error(f"❌ Error parsing SMS: {str(e)}")
@@ -126,7 +127,104 @@ def parse_sms_report(sms_text: str) -> dict:
         }
 
 
-def _parse_compact_format(sms_text: str) -> dict:
+def parse_sms_batch(messages: list, reported_at: str = None) -> list:
+    """
+    Parse many SMS messages at once, e.g. a bulk dump from the SMS gateway
+    
+    Same results as parse_sms_report, without a log line per message.
+    
+    Args:
+        messages (list): SMS message texts
+        reported_at (str): ISO timestamp stored as 'reportedAt' on every
+                           parsed report (default: now)
+    
+    Returns:
+        list: One parse_sms_report-style result per message, in order
+    """
+    reported_at = reported_at or datetime.now().isoformat()
+    results = []
+    for sms_text in messages:
+        try:
+            results.append(_parse_sms(sms_text, reported_at))
+        except Exception as e:
+            results.append({'success': False, 'error': str(e), 'data': None, 'format_detected': None})
+    parsed = sum(1 for result in results if result['success'])
+    logger.info(f"✅ Parsed {parsed} of {len(results)} SMS messages")
+    return results
+
+
+def _parse_sms(sms_text, reported_at: str) -> dict:
+    """Detect the format of one message and parse it"""
+    if not sms_text or not isinstance(sms_text, str):
+        return {
+            'success': False,
+            'error': 'Invalid SMS text',
+            'data': None,
+            'format_detected': None
+        }
+    
+    sms_text = sms_text.strip()
+    
+    # Try to detect and parse compact format first
+    if sms_text.startswith('WQ|'):
+        return _parse_compact_format(sms_text, reported_at)
+    
+    # Try to parse structured format
+    upper_text = sms_text.upper()
+    if 'PIN' in upper_text or 'CODE' in upper_text:
+        return _parse_structured_format(sms_text, reported_at)
+    
+    return {
+        'success': False,
+        'error': 'Unrecognized SMS format. Expected format starting with "WQ|" or containing "PIN CODE"',
+        'data': None,
+        'format_detected': 'unknown'
+    }
+
+
+def extract_sms_fields(sms_text: str) -> dict:
+    """
+    Every KEY: VALUE field of a structured SMS, found in one scan
+    
+    Keys are matched case-insensitively. A key at the start of the message
+    or of a line, or right after ',', ';' or '|', starts a field and ends
+    the previous value; elsewhere it is only used if the key appears nowhere
+    else, so free text such as "near the source: river" stays in its value.
+    A value runs to the end of its line or to the next field, whichever
+    comes first; an empty value continues on the next line.
+    
+    Returns:
+        dict: Values keyed by 'PIN', 'ISSUE', 'PROBLEM', 'SOURCE', 'LOCATION'
+              and 'DESCRIPTION', for the keys present
+    """
+    found = {}
+    stops = []
+    for match in _FIELD_KEY.finditer(sms_text):
+        key = _FIELD_NAMES[match.group(1)[:3].upper()]
+        position = match.start()
+        previous = sms_text[position - 1] if position else '\n'
+        if previous in ' \t':
+            previous = sms_text[:position].rstrip(' \t')[-1:] or '\n'
+        if previous in _FIELD_SEPARATORS:
+            stops.append(position)
+            if key not in found or not found[key][1]:
+                found[key] = (match, True)
+        elif key not in found:
+            found[key] = (match, False)
+    
+    fields = {}
+    for key, (match, _) in found.items():
+        value = _FIELD_VALUE.match(sms_text, match.end())
+        start, end = value.span(1)
+        if stops and stops[-1] < end:
+            stop = bisect.bisect_left(stops, start)
+            if stop < len(stops):
+                end = min(end, stops[stop])
+        fields[key] = sms_text[start:end].rstrip(' \t\r,;|')
+    return fields
+
+
+def _parse_compact_format(sms_text: str, reported_at: str) -> dict:
     """Parse compact SMS format: WQ|781014|Health symptoms|Tube well|Description"""
     try:
         parts = sms_text.split('|')
@@ -144,8 +242,6 @@ def _parse_compact_format(sms_text: str) -> dict:
         source = parts[3].strip()
         description = parts[4].strip() if len(parts) > 4 else ''
         
-        logger.info(f"✅ Parsed compact SMS format for PIN {pincode}")
-        
         return {
             'success': True,
             'data': {
@@ -153,7 +249,7 @@ def _parse_compact_format(sms_text: str) -> dict:
                 'problem': problem,
                 'sourceType': source,
                 'description': description,
-                'reportedAt': datetime.now().isoformat(),
+                'reportedAt': reported_at,
                 'reportedBy': 'SMS',
                 'localityName': 'Unknown',
                 'district': 'Unknown'
@@ -172,48 +268,22 @@ def _parse_compact_format(sms_text: str) -> dict:
         }
 
 
-def _parse_structured_format(sms_text: str) -> dict:
+def _parse_structured_format(sms_text: str, reported_at: str) -> dict:
     """Parse structured SMS format with KEY: VALUE lines"""
     try:
+        fields = extract_sms_fields(sms_text)
+        pin_match = _LEADING_DIGITS.match(fields.get('PIN', ''))
         data = {
-            'pinCode': None,
-            'problem': None,
-            'sourceType': None,
-            'description': '',
-            'localityName': 'Unknown',
+            'pinCode': pin_match.group(0) if pin_match else None,
+            'problem': fields.get('ISSUE') or fields.get('PROBLEM') or None,
+            'sourceType': fields.get('SOURCE') or None,
+            'description': fields.get('DESCRIPTION', ''),
+            'localityName': fields.get('LOCATION') or 'Unknown',
             'district': 'Unknown',
-            'reportedAt': datetime.now().isoformat(),
+            'reportedAt': reported_at,
             'reportedBy': 'SMS'
         }
         
-        # Extract PIN code (multiple possible formats)
-        pin_match = re.search(r'PIN\s*(?:CODE)?:\s*(\d+)', sms_text, re.IGNORECASE)
-        if pin_match:
-            data['pinCode'] = pin_match.group(1).strip()
-        
-        # Extract issue/problem
-        issue_match = re.search(r'ISSUE\s*(?:TYPE)?:\s*([^\n]+)', sms_text, re.IGNORECASE)
-        problem_match = re.search(r'PROBLEM:\s*([^\n]+)', sms_text, re.IGNORECASE)
-        if issue_match:
-            data['problem'] = issue_match.group(1).strip()
-        elif problem_match:
-            data['problem'] = problem_match.group(1).strip()
-        
-        # Extract source type
-        source_match = re.search(r'SOURCE\s*(?:TYPE)?:\s*([^\n]+)', sms_text, re.IGNORECASE)
-        if source_match:
-            data['sourceType'] = source_match.group(1).strip()
-        
-        # Extract location/locality
-        location_match = re.search(r'LOCATION:\s*([^\n]+)', sms_text, re.IGNORECASE)
-        if location_match:
-            data['localityName'] = location_match.group(1).strip()
-        
-        # Extract description
-        desc_match = re.search(r'DESCRIPTION:\s*([^\n]+)', sms_text, re.IGNORECASE)
-        if desc_match:
-            data['description'] = desc_match.group(1).strip()
-        
         # Validate required fields
         if not data['pinCode']:
             return {
@@ -239,8 +309,6 @@ def _parse_structured_format(sms_text: str) -> dict:
                 'format_detected': 'structured'
             }
         
-        logger.info(f"✅ Parsed structured SMS format for PIN {data['pinCode']}")
-        
         return {
             'success': True,
             'data': data,
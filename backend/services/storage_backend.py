@@ -0,0 +1,742 @@
+"""
+Storage backends for FirebaseService
+Firestore for production, SQLite (file or in-memory) for local runs and load tests
+"""
+
+import asyncio
+import functools
+import json
+import logging
+import re
+import sqlite3
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Field path used by Firestore for the document ID in filters, ordering and cursors
+DOCUMENT_ID = '__name__'
+
+ASCENDING = 'asc'
+DESCENDING = 'desc'
+
+SUPPORTED_OPERATORS = ('==', '!=', '<', '<=', '>', '>=', 'in', 'not-in', 'array_contains')
+
+# Firestore limit on operations per commit
+MAX_BATCH_OPERATIONS = 500
+
+# Documents updated per transaction, leaving room in the commit for counters and extra writes
+MAX_TRANSACTION_DOCUMENTS = 250
+
+
+class DocumentNotFoundError(Exception):
+    """Raised when updating a document that does not exist"""
+
+
+def document_matches(doc_id, data, filters):
+    """Evaluate backend query filters against a document in Python"""
+    for field, op, value in filters or []:
+        actual = doc_id if field == DOCUMENT_ID else data.get(field)
+        if op == 'array_contains':
+            if not isinstance(actual, list) or value not in actual:
+                return False
+            continue
+        if actual is None and not (op == '==' and value is None):
+            return False
+        try:
+            if op == '==':
+                matched = actual == value
+            elif op == '!=':
+                matched = actual != value
+            elif op == '<':
+                matched = actual < value
+            elif op == '<=':
+                matched = actual <= value
+            elif op == '>':
+                matched = actual > value
+            elif op == '>=':
+                matched = actual >= value
+            elif op == 'in':
+                matched = actual in value
+            elif op == 'not-in':
+                matched = actual not in value
+            else:
+                raise ValueError(f'Unsupported operator: {op}')
+        except TypeError:
+            matched = False
+        if not matched:
+            return False
+    return True
+
+
+class WatchHandle:
+    """Handle for a live query subscription returned by StorageBackend.watch"""
+
+    @property
+    def is_active(self):
+        raise NotImplementedError
+
+    def unsubscribe(self):
+        raise NotImplementedError
+
+
+class StorageBackend:
+    """
+    Document store interface used by FirebaseService
+
+    Documents are plain dicts grouped in named collections. Queries take:
+        filters:     list of (field, operator, value) tuples, ANDed together
+        order_by:    list of (field, 'asc' | 'desc') tuples
+        limit:       maximum number of documents returned
+        start_after: dict of order_by field values (and optionally DOCUMENT_ID)
+                     to resume after, as with Firestore cursors
+
+    and return a list of (document_id, data) tuples in query order.
+    """
+
+    name = 'base'
+
+    def add(self, collection, data, doc_id=None):
+        """Create a document and return its ID"""
+        doc_id = doc_id or str(uuid.uuid4())
+        self.set(collection, doc_id, data)
+        return doc_id
+
+    def set(self, collection, doc_id, data, merge=False):
+        raise NotImplementedError
+
+    def update(self, collection, doc_id, fields):
+        raise NotImplementedError
+
+    def get(self, collection, doc_id):
+        raise NotImplementedError
+
+    def delete(self, collection, doc_id):
+        raise NotImplementedError
+
+    def query(self, collection, filters=None, order_by=None, limit=None, start_after=None):
+        raise NotImplementedError
+
+    def get_many(self, collection, doc_ids):
+        """Get several documents at once as {doc_id: data}, skipping missing ones"""
+        raise NotImplementedError
+
+    async def aget(self, collection, doc_id):
+        """Async get; runs the blocking call in the event loop's executor by default"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.get, collection, doc_id)
+
+    async def aquery(self, collection, filters=None, order_by=None, limit=None, start_after=None):
+        """Async query; runs the blocking call in the event loop's executor by default"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(self.query, collection, filters, order_by, limit, start_after)
+        )
+
+    def increment(self, collection, doc_id, deltas, fields=None):
+        """Atomically add deltas to numeric fields, creating the document if needed"""
+        raise NotImplementedError
+
+    def commit_batch(self, writes):
+        """
+        Apply a list of writes with as few round-trips as possible
+
+        Each write is one of:
+            ('set', collection, doc_id, data)
+            ('update', collection, doc_id, fields)
+            ('increment', collection, doc_id, deltas, fields)
+            ('delete', collection, doc_id)
+
+        Writes are committed in chunks of MAX_BATCH_OPERATIONS; each chunk is atomic.
+        """
+        raise NotImplementedError
+
+    def watch(self, collection, filters, callback):
+        """
+        Subscribe to a live query
+
+        callback(changes, reset) is called with a list of
+        (change_type, doc_id, data) tuples, change_type being 'added',
+        'modified' or 'removed'. The first call delivers every matching
+        document with reset=True; later calls deliver incremental changes.
+        Returns a WatchHandle. A handle whose is_active turns False has
+        stopped delivering changes and should be replaced by a new watch.
+        """
+        raise NotImplementedError
+
+    def update_and_increment(self, collection, doc_id, fields, counters):
+        """
+        Update a document and adjust counters in one transaction
+
+        counters(old_data, new_data) returns a list of
+        (collection, doc_id, deltas, fields) increments to apply alongside
+        the update. Returns the document data as it was before the update.
+        """
+        raise NotImplementedError
+
+    def update_many_and_increment(self, collection, doc_ids, fields, counters, extra_writes=None):
+        """
+        Update several documents and adjust counters in transactions
+
+        The documents are read and updated inside the transaction, so
+        overlapping updates of the same document cannot both apply their
+        counter changes. counters(old_docs) gets {doc_id: old_data} for the
+        documents found and returns a list of (collection, doc_id, deltas,
+        fields) increments. extra_writes (see commit_batch) go with the first
+        transaction. Large updates are split into transactions of
+        MAX_TRANSACTION_DOCUMENTS documents; missing documents are skipped.
+        Returns {doc_id: old_data} for the updated documents.
+        """
+        raise NotImplementedError
+
+    def to_dict(self, rows):
+        """Convert query rows to the {doc_id: data} shape the routes return"""
+        return {doc_id: data for doc_id, data in rows}
+
+
+class FirestoreBackend(StorageBackend):
+    """
+    Backend on top of a google-cloud-firestore client
+
+    The async methods use a separate AsyncClient, created on first use by
+    async_client_factory inside the event loop that awaits them.
+    """
+
+    name = 'firestore'
+
+    def __init__(self, client, async_client_factory=None):
+        self.client = client
+        self._async_client_factory = async_client_factory
+        self._async_client = None
+
+    def _get_async_client(self):
+        if self._async_client is None:
+            if self._async_client_factory is None:
+                raise RuntimeError('No AsyncClient factory configured for FirestoreBackend')
+            self._async_client = self._async_client_factory()
+        return self._async_client
+
+    def set(self, collection, doc_id, data, merge=False):
+        self.client.collection(collection).document(doc_id).set(data, merge=merge)
+
+    def update(self, collection, doc_id, fields):
+        from google.api_core.exceptions import NotFound
+        try:
+            self.client.collection(collection).document(doc_id).update(fields)
+        except NotFound as e:
+            raise DocumentNotFoundError(f'{collection}/{doc_id} not found') from e
+
+    def get(self, collection, doc_id):
+        doc = self.client.collection(collection).document(doc_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    def delete(self, collection, doc_id):
+        self.client.collection(collection).document(doc_id).delete()
+
+    def get_many(self, collection, doc_ids):
+        refs = [self.client.collection(collection).document(doc_id) for doc_id in doc_ids]
+        if not refs:
+            return {}
+        return {doc.id: doc.to_dict() for doc in self.client.get_all(refs) if doc.exists}
+
+    @staticmethod
+    def _increment_data(deltas, fields):
+        from firebase_admin import firestore
+        data = {field: firestore.Increment(delta) for field, delta in deltas.items()}
+        data.update(fields or {})
+        return data
+
+    def increment(self, collection, doc_id, deltas, fields=None):
+        self.client.collection(collection).document(doc_id).set(self._increment_data(deltas, fields), merge=True)
+
+    def _apply_write(self, writer, write):
+        """Add one commit_batch write to a WriteBatch or Transaction"""
+        kind, collection, doc_id = write[:3]
+        ref = self.client.collection(collection).document(doc_id)
+        if kind == 'set':
+            writer.set(ref, write[3])
+        elif kind == 'update':
+            writer.update(ref, write[3])
+        elif kind == 'increment':
+            writer.set(ref, self._increment_data(write[3], write[4]), merge=True)
+        elif kind == 'delete':
+            writer.delete(ref)
+        else:
+            raise ValueError(f'Unknown batch write: {kind}')
+
+    def commit_batch(self, writes):
+        for start in range(0, len(writes), MAX_BATCH_OPERATIONS):
+            batch = self.client.batch()
+            for write in writes[start:start + MAX_BATCH_OPERATIONS]:
+                self._apply_write(batch, write)
+            batch.commit()
+
+    def update_and_increment(self, collection, doc_id, fields, counters):
+        from firebase_admin import firestore
+
+        ref = self.client.collection(collection).document(doc_id)
+
+        @firestore.transactional
+        def run(transaction):
+            snapshot = ref.get(transaction=transaction)
+            if not snapshot.exists:
+                raise DocumentNotFoundError(f'{collection}/{doc_id} not found')
+            old_data = snapshot.to_dict()
+            transaction.update(ref, fields)
+            for counter_collection, counter_id, deltas, counter_fields in counters(old_data, {**old_data, **fields}):
+                transaction.set(
+                    self.client.collection(counter_collection).document(counter_id),
+                    self._increment_data(deltas, counter_fields),
+                    merge=True
+                )
+            return old_data
+
+        return run(self.client.transaction())
+
+    def update_many_and_increment(self, collection, doc_ids, fields, counters, extra_writes=None):
+        from firebase_admin import firestore
+
+        @firestore.transactional
+        def run(transaction, chunk, writes):
+            refs = [self.client.collection(collection).document(doc_id) for doc_id in chunk]
+            old_docs = {snapshot.id: snapshot.to_dict() for snapshot in transaction.get_all(refs) if snapshot.exists}
+            for doc_id in old_docs:
+                transaction.update(self.client.collection(collection).document(doc_id), fields)
+            for write in writes + [('increment',) + change for change in counters(old_docs)]:
+                self._apply_write(transaction, write)
+            return old_docs
+
+        doc_ids = list(doc_ids)
+        writes = list(extra_writes or [])
+        updated = {}
+        for start in range(0, max(len(doc_ids), 1), MAX_TRANSACTION_DOCUMENTS):
+            updated.update(run(self.client.transaction(), doc_ids[start:start + MAX_TRANSACTION_DOCUMENTS], writes))
+            writes = []
+        return updated
+
+    def watch(self, collection, filters, callback):
+        state = {'initial': True}
+
+        def on_snapshot(docs, changes, read_time):
+            if state['initial']:
+                state['initial'] = False
+                callback([('added', doc.id, doc.to_dict()) for doc in docs], True)
+            else:
+                callback([
+                    (change.type.name.lower(), change.document.id, change.document.to_dict())
+                    for change in changes
+                ], False)
+
+        return FirestoreWatch(self.build_query(collection, filters).on_snapshot(on_snapshot))
+
+    def build_query(self, collection, filters=None, order_by=None, limit=None, start_after=None, client=None):
+        """Translate backend query arguments into a Firestore query on client (sync client by default)"""
+        from firebase_admin import firestore
+
+        query = (client or self.client).collection(collection)
+        for field, op, value in filters or []:
+            query = query.where(filter=firestore.FieldFilter(field, op, value))
+        for field, direction in order_by or []:
+            query = query.order_by(
+                field,
+                direction=firestore.Query.DESCENDING if direction == DESCENDING else firestore.Query.ASCENDING
+            )
+        if start_after:
+            query = query.start_after(start_after)
+        if limit:
+            query = query.limit(limit)
+        return query
+
+    def query(self, collection, filters=None, order_by=None, limit=None, start_after=None):
+        query = self.build_query(collection, filters, order_by, limit, start_after)
+        return [(doc.id, doc.to_dict()) for doc in query.stream()]
+
+    async def aget(self, collection, doc_id):
+        doc = await self._get_async_client().collection(collection).document(doc_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    async def aquery(self, collection, filters=None, order_by=None, limit=None, start_after=None):
+        query = self.build_query(collection, filters, order_by, limit, start_after, client=self._get_async_client())
+        return [(doc.id, doc.to_dict()) async for doc in query.stream()]
+
+
+class FirestoreWatch(WatchHandle):
+    """WatchHandle around a Firestore on_snapshot Watch"""
+
+    def __init__(self, watch):
+        self._watch = watch
+
+    @property
+    def is_active(self):
+        # The Watch closes itself when its stream fails without recovery
+        return not self._watch._closed
+
+    def unsubscribe(self):
+        self._watch.unsubscribe()
+
+
+class LocalWatch(WatchHandle):
+    """In-process live query on the SQLite backend, fed by its own writes"""
+
+    def __init__(self, backend, collection, filters, callback):
+        self.backend = backend
+        self.collection = collection
+        self.filters = filters
+        self.callback = callback
+        self.doc_ids = set()
+        self._active = True
+
+    @property
+    def is_active(self):
+        return self._active
+
+    def unsubscribe(self):
+        self._active = False
+        self.backend._remove_watch(self)
+
+    def dispatch(self, changes):
+        """Turn raw document writes into added/modified/removed changes for this query"""
+        events = []
+        for doc_id, data in changes:
+            matches = data is not None and document_matches(doc_id, data, self.filters)
+            if matches:
+                events.append(('modified' if doc_id in self.doc_ids else 'added', doc_id, data))
+                self.doc_ids.add(doc_id)
+            elif doc_id in self.doc_ids:
+                self.doc_ids.discard(doc_id)
+                events.append(('removed', doc_id, data))
+        if events:
+            self.callback(events, False)
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Backend storing documents as JSON rows in SQLite
+
+    Supports the same filter operators, ordering, limits and cursors as the
+    Firestore backend. Fields used in filters or ordering get an expression
+    index the first time they are queried, so equality and range lookups stay
+    indexed at millions of documents. Use path ':memory:' for a throwaway store.
+
+    Watches only see writes made through this backend instance.
+    """
+
+    name = 'sqlite'
+
+    _FIELD_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self._lock = threading.RLock()
+        self._indexed_fields = set()
+        self._watches = []
+        self._pending_changes = None
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS documents ('
+            ' collection TEXT NOT NULL,'
+            ' id TEXT NOT NULL,'
+            ' data TEXT NOT NULL,'
+            ' PRIMARY KEY (collection, id)'
+            ') WITHOUT ROWID'
+        )
+        logger.info(f"SQLite storage backend ready at {path}")
+
+    # ---- helpers ----
+
+    @staticmethod
+    def _dumps(data):
+        return json.dumps(data, default=str, separators=(',', ':'))
+
+    def _field_expr(self, field):
+        if field == DOCUMENT_ID:
+            return 'id'
+        if not self._FIELD_PATTERN.match(field):
+            raise ValueError(f'Unsupported field path for SQLite backend: {field}')
+        self._ensure_index(field)
+        return f"json_extract(data, '$.{field}')"
+
+    def _ensure_index(self, field):
+        if field in self._indexed_fields:
+            return
+        with self._lock:
+            self._conn.execute(
+                f'CREATE INDEX IF NOT EXISTS "idx_documents_{field}" '
+                f"ON documents (collection, json_extract(data, '$.{field}'))"
+            )
+            self._indexed_fields.add(field)
+
+    @staticmethod
+    def _bind(value):
+        # json_extract returns 1/0 for JSON booleans
+        if isinstance(value, bool):
+            return int(value)
+        return value
+
+    def _filter_clause(self, field, op, value):
+        expr = self._field_expr(field)
+        if op == '==':
+            if value is None:
+                return f'{expr} IS NULL', []
+            return f'{expr} = ?', [self._bind(value)]
+        if op in ('!=', '<', '<=', '>', '>='):
+            return f'{expr} {op} ?', [self._bind(value)]
+        if op in ('in', 'not-in'):
+            values = [self._bind(v) for v in value]
+            if not values:
+                return ('0', []) if op == 'in' else (f'{expr} IS NOT NULL', [])
+            placeholders = ', '.join('?' for _ in values)
+            keyword = 'IN' if op == 'in' else 'NOT IN'
+            return f'{expr} {keyword} ({placeholders})', values
+        if op == 'array_contains':
+            return (
+                f"EXISTS (SELECT 1 FROM json_each(data, '$.{field}') WHERE value = ?)",
+                [self._bind(value)]
+            )
+        raise ValueError(f'Unsupported operator for SQLite backend: {op}')
+
+    def _cursor_clause(self, orders, start_after):
+        """Build the lexicographic 'strictly after' condition for a cursor"""
+        keys = [(field, direction) for field, direction in orders if field in start_after]
+        clauses = []
+        params = []
+        for i, (field, direction) in enumerate(keys):
+            parts = []
+            for prev_field, _ in keys[:i]:
+                parts.append(f'{self._field_expr(prev_field)} = ?')
+                params.append(self._bind(start_after[prev_field]))
+            parts.append(f"{self._field_expr(field)} {'<' if direction == DESCENDING else '>'} ?")
+            params.append(self._bind(start_after[field]))
+            clauses.append('(' + ' AND '.join(parts) + ')')
+        return '(' + ' OR '.join(clauses) + ')', params
+
+    def _changed(self, collection, doc_id, data):
+        """Record a document write for watches, deferred while a transaction is open"""
+        if not self._watches:
+            return
+        if self._pending_changes is not None:
+            self._pending_changes.append((collection, doc_id, data))
+        else:
+            self._dispatch([(collection, doc_id, data)])
+
+    def _dispatch(self, changes):
+        for watch in list(self._watches):
+            relevant = [(doc_id, data) for collection, doc_id, data in changes if collection == watch.collection]
+            if relevant:
+                try:
+                    watch.dispatch(relevant)
+                except Exception as e:
+                    logger.error(f"Watch callback failed: {str(e)}", exc_info=True)
+
+    def _begin(self):
+        self._conn.execute('BEGIN')
+        self._pending_changes = []
+
+    def _commit(self):
+        self._conn.execute('COMMIT')
+        changes, self._pending_changes = self._pending_changes, None
+        if changes:
+            self._dispatch(changes)
+
+    def _rollback(self):
+        self._conn.execute('ROLLBACK')
+        self._pending_changes = None
+
+    def _remove_watch(self, watch):
+        with self._lock:
+            if watch in self._watches:
+                self._watches.remove(watch)
+
+    # ---- StorageBackend interface ----
+
+    def watch(self, collection, filters, callback):
+        with self._lock:
+            handle = LocalWatch(self, collection, filters, callback)
+            rows = self.query(collection, filters)
+            handle.doc_ids = {doc_id for doc_id, _ in rows}
+            self._watches.append(handle)
+            callback([('added', doc_id, data) for doc_id, data in rows], True)
+        return handle
+
+    def set(self, collection, doc_id, data, merge=False):
+        with self._lock:
+            if merge:
+                existing = self.get(collection, doc_id) or {}
+                existing.update(data)
+                data = existing
+            self._conn.execute(
+                'INSERT OR REPLACE INTO documents (collection, id, data) VALUES (?, ?, ?)',
+                (collection, doc_id, self._dumps(data))
+            )
+            self._changed(collection, doc_id, data)
+
+    def update(self, collection, doc_id, fields):
+        with self._lock:
+            existing = self.get(collection, doc_id)
+            if existing is None:
+                raise DocumentNotFoundError(f'{collection}/{doc_id} not found')
+            existing.update(fields)
+            self._conn.execute(
+                'UPDATE documents SET data = ? WHERE collection = ? AND id = ?',
+                (self._dumps(existing), collection, doc_id)
+            )
+            self._changed(collection, doc_id, existing)
+
+    def get(self, collection, doc_id):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT data FROM documents WHERE collection = ? AND id = ?',
+                (collection, doc_id)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete(self, collection, doc_id):
+        with self._lock:
+            self._conn.execute(
+                'DELETE FROM documents WHERE collection = ? AND id = ?',
+                (collection, doc_id)
+            )
+            self._changed(collection, doc_id, None)
+
+    def increment(self, collection, doc_id, deltas, fields=None):
+        with self._lock:
+            data = self.get(collection, doc_id) or {}
+            for field, delta in deltas.items():
+                data[field] = data.get(field, 0) + delta
+            data.update(fields or {})
+            self.set(collection, doc_id, data)
+
+    def get_many(self, collection, doc_ids):
+        doc_ids = list(doc_ids)
+        found = {}
+        # Stay below SQLite's bound parameter limit
+        for start in range(0, len(doc_ids), MAX_BATCH_OPERATIONS):
+            chunk = doc_ids[start:start + MAX_BATCH_OPERATIONS]
+            placeholders = ', '.join('?' for _ in chunk)
+            with self._lock:
+                rows = self._conn.execute(
+                    f'SELECT id, data FROM documents WHERE collection = ? AND id IN ({placeholders})',
+                    [collection] + chunk
+                ).fetchall()
+            found.update((doc_id, json.loads(data)) for doc_id, data in rows)
+        return found
+
+    def _apply_write(self, write):
+        kind, collection, doc_id = write[:3]
+        if kind == 'set':
+            self.set(collection, doc_id, write[3])
+        elif kind == 'update':
+            self.update(collection, doc_id, write[3])
+        elif kind == 'increment':
+            self.increment(collection, doc_id, write[3], write[4])
+        elif kind == 'delete':
+            self.delete(collection, doc_id)
+        else:
+            raise ValueError(f'Unknown batch write: {kind}')
+
+    def commit_batch(self, writes):
+        with self._lock:
+            for start in range(0, len(writes), MAX_BATCH_OPERATIONS):
+                self._begin()
+                try:
+                    for write in writes[start:start + MAX_BATCH_OPERATIONS]:
+                        self._apply_write(write)
+                    self._commit()
+                except Exception:
+                    self._rollback()
+                    raise
+
+    def update_and_increment(self, collection, doc_id, fields, counters):
+        with self._lock:
+            old_data = self.get(collection, doc_id)
+            if old_data is None:
+                raise DocumentNotFoundError(f'{collection}/{doc_id} not found')
+            self._begin()
+            try:
+                self.update(collection, doc_id, fields)
+                for counter_collection, counter_id, deltas, counter_fields in counters(old_data, {**old_data, **fields}):
+                    self.increment(counter_collection, counter_id, deltas, counter_fields)
+                self._commit()
+            except Exception:
+                self._rollback()
+                raise
+            return old_data
+
+    def update_many_and_increment(self, collection, doc_ids, fields, counters, extra_writes=None):
+        # One SQLite transaction covers every document, so no chunking is needed
+        with self._lock:
+            old_docs = self.get_many(collection, doc_ids)
+            self._begin()
+            try:
+                for doc_id in old_docs:
+                    self.update(collection, doc_id, fields)
+                for write in list(extra_writes or []) + [('increment',) + change for change in counters(old_docs)]:
+                    self._apply_write(write)
+                self._commit()
+            except Exception:
+                self._rollback()
+                raise
+            return old_docs
+
+    def query(self, collection, filters=None, order_by=None, limit=None, start_after=None):
+        where = ['collection = ?']
+        params = [collection]
+
+        for field, op, value in filters or []:
+            clause, clause_params = self._filter_clause(field, op, value)
+            where.append(clause)
+            params.extend(clause_params)
+
+        # Like Firestore: ordering on a field excludes documents missing it,
+        # and ties are broken by document ID in the last order's direction
+        orders = list(order_by or [])
+        for field, _ in orders:
+            if field != DOCUMENT_ID:
+                where.append(f'{self._field_expr(field)} IS NOT NULL')
+        if orders and orders[-1][0] != DOCUMENT_ID:
+            orders.append((DOCUMENT_ID, orders[-1][1]))
+
+        if start_after:
+            if not orders:
+                raise ValueError('start_after requires order_by')
+            clause, clause_params = self._cursor_clause(orders, start_after)
+            where.append(clause)
+            params.extend(clause_params)
+
+        sql = 'SELECT id, data FROM documents WHERE ' + ' AND '.join(where)
+        if orders:
+            sql += ' ORDER BY ' + ', '.join(
+                f"{self._field_expr(field)} {'DESC' if direction == DESCENDING else 'ASC'}"
+                for field, direction in orders
+            )
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(int(limit))
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [(doc_id, json.loads(data)) for doc_id, data in rows]
+
+
+def create_backend(kind=None, firestore_client_factory=None, firestore_async_client_factory=None):
+    """
+    Create the storage backend named by kind (or the STORAGE_BACKEND env var)
+
+    'firestore' (default) uses firestore_client_factory() for the client and
+    firestore_async_client_factory() for the AsyncClient,
+    'sqlite' uses SQLITE_DB_PATH (default luit_local.db),
+    'memory' uses a private in-memory SQLite database.
+    """
+    import os
+
+    kind = (kind or os.getenv('STORAGE_BACKEND', 'firestore')).lower()
+    if kind == 'firestore':
+        return FirestoreBackend(firestore_client_factory(), firestore_async_client_factory)
+    if kind == 'sqlite':
+        return SQLiteBackend(os.getenv('SQLITE_DB_PATH', 'luit_local.db'))
+    if kind == 'memory':
+        return SQLiteBackend(':memory:')
+    raise ValueError(f'Unknown STORAGE_BACKEND: {kind}')
@@ -0,0 +1,117 @@
+"""
+Web-map (z/x/y) GeoJSON tiles for the report and lab assignment layers
+"""
+
+import hashlib
+import math
+import os
+import threading
+import time
+
+from services.geo import coordinates
+
+# Deepest zoom level served; Leaflet's OpenStreetMap layer stops at 19
+MAX_TILE_ZOOM = 18
+
+
+def tile_bounds(z, x, y):
+    """(min_lat, min_lon, max_lat, max_lon) of a Web Mercator tile"""
+    n = 1 << z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return lat(y + 1), x / n * 360.0 - 180.0, lat(y), (x + 1) / n * 360.0 - 180.0
+
+
+def tile_for_point(latitude, longitude, z):
+    """(x, y) of the tile containing a point at zoom z"""
+    n = 1 << z
+    latitude = max(min(latitude, 85.0511), -85.0511)
+    x = int((longitude + 180.0) / 360.0 * n)
+    lat_rad = math.radians(latitude)
+    y = int((1 - math.log(math.tan(lat_rad) + 1 / math.cos(lat_rad)) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def valid_tile(z, x, y):
+    return 0 <= z <= MAX_TILE_ZOOM and 0 <= x < (1 << z) and 0 <= y < (1 << z)
+
+
+def feature_collection(documents, properties):
+    """
+    GeoJSON FeatureCollection of point documents
+
+    Args:
+        documents (list): (doc_id, data) pairs
+        properties (list): Document fields copied into each feature's properties
+    """
+    features = []
+    for doc_id, data in documents:
+        location = coordinates(data)
+        if location is None:
+            continue
+        feature_properties = {'id': doc_id}
+        for field in properties:
+            feature_properties[field] = data.get(field)
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [round(location[1], 6), round(location[0], 6)]},
+            'properties': feature_properties
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def content_etag(body):
+    """ETag derived from a tile body, for tiles rendered without version tracking"""
+    return hashlib.sha1(body.encode('utf-8')).hexdigest()
+
+
+class TileVersions:
+    """
+    Version counter per tile of one layer
+
+    A change to a document bumps the tiles containing its old and new
+    position at every zoom level, so only tiles touched by a write get a
+    new version (and ETag). A reset bumps the layer's epoch, which changes
+    every tile. Kept current with apply(changes, reset), the watch callback
+    signature.
+
+    Versions are only comparable within one process, so ETags also carry a
+    token unique to the process and instance that issued them.
+    """
+
+    def __init__(self):
+        self.token = f'{os.getpid():x}.{time.time_ns():x}'
+        self.epoch = 0
+        self._versions = {}
+        self._locations = {}
+        self._lock = threading.Lock()
+
+    def apply(self, changes, reset):
+        with self._lock:
+            if reset:
+                self.epoch += 1
+                self._versions = {}
+                self._locations = {}
+            for change_type, doc_id, data in changes:
+                old = self._locations.pop(doc_id, None)
+                new = None if change_type == 'removed' else coordinates(data)
+                if new is not None:
+                    self._locations[doc_id] = new
+                if not reset:
+                    for location in {old, new} - {None}:
+                        self._bump(location)
+
+    def _bump(self, location):
+        for z in range(MAX_TILE_ZOOM + 1):
+            key = (z, ) + tile_for_point(location[0], location[1], z)
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+    def version(self, z, x, y):
+        with self._lock:
+            return self.epoch, self._versions.get((z, x, y), 0)
+
+    def etag(self, layer, z, x, y):
+        epoch, version = self.version(z, x, y)
+        return f'{layer}-{z}-{x}-{y}-{self.token}-{epoch}-{version}'
@@ -0,0 +1,25 @@
+"""
+The live view must start from a fresh process whose first request needs it
+"""
+
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIRST_REQUEST = """
+from main import create_app
+response = create_app().test_client().get('/api/water-quality/active-reports')
+print(response.status_code)
+"""
+
+
+def test_first_request_starts_live_view():
+    env = dict(os.environ, STORAGE_BACKEND='memory', LIVE_VIEW_ENABLED='1')
+    result = subprocess.run(
+        [sys.executable, '-c', FIRST_REQUEST], cwd=BACKEND_DIR, env=env,
+        capture_output=True, text=True, timeout=30
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == '200'
@@ -0,0 +1,55 @@
+"""
+PIN code overrides merged into the search and nearest-PIN indexes
+"""
+
+import os
+
+os.environ.setdefault('STORAGE_BACKEND', 'memory')
+os.environ.setdefault('LIVE_VIEW_ENABLED', '0')
+
+import pytest
+
+from services import pincode_service
+from services.pin_overrides import PinOverrides
+
+
+@pytest.fixture
+def overrides(monkeypatch):
+    """Fresh overrides, checked on every lookup so saves show up straight away"""
+    fresh = PinOverrides(pincode_service._storage_backend, check_interval=0)
+    monkeypatch.setattr(pincode_service, '_overrides', fresh)
+    monkeypatch.setattr(pincode_service, '_override_indexes', None)
+    return fresh
+
+
+def test_override_replaces_indexed_record(overrides):
+    pincode_service.add_pincode('781005', 27.5, 95.0, 'Zedpur', 'Tinsukia')
+
+    near_old = [r['pincode'] for r in pincode_service.reverse_geocode(26.1389, 91.7244, k=5)['results']]
+    assert '781005' not in near_old
+    assert pincode_service.reverse_geocode(27.5, 95.0)['results'][0]['pincode'] == '781005'
+
+    matches = pincode_service.search_pincodes('Zedpu')['results']
+    assert [(r['pincode'], r['match']) for r in matches] == [('781005', 'prefix')]
+    guwahati = [r['pincode'] for r in pincode_service.search_pincodes('Guwahati', limit=50)['results']]
+    assert '781005' not in guwahati
+
+
+def test_new_pincode_is_searchable(overrides):
+    pincode_service.add_pincode('799999', 26.1400, 91.7300, 'Guwahati Newtown', 'Kamrup Metropolitan')
+
+    assert pincode_service.reverse_geocode(26.14, 91.73)['results'][0]['pincode'] == '799999'
+    assert '799999' in [r['pincode'] for r in pincode_service.search_pincodes('Guwahati Newt')['results']]
+
+
+def test_version_checked_at_most_once_per_interval(monkeypatch):
+    backend = pincode_service._storage_backend()
+    reads = []
+    get = backend.get
+    monkeypatch.setattr(backend, 'get', lambda *args, **kwargs: reads.append(args) or get(*args, **kwargs))
+    monkeypatch.setattr(pincode_service, '_overrides', PinOverrides(lambda: backend, check_interval=60))
+
+    for _ in range(100):
+        pincode_service.reverse_geocode(26.14, 91.73, k=3)
+        pincode_service.search_pincodes('Guwah')
+    assert len(reads) == 1
@@ -0,0 +1,61 @@
+"""
+Report counters against the reports they count
+"""
+
+import os
+
+os.environ.setdefault('STORAGE_BACKEND', 'memory')
+os.environ.setdefault('LIVE_VIEW_ENABLED', '0')
+
+import pytest
+
+from services.firebase_service import FirebaseService, ReportStatsMissingError, STATS_COLLECTION, STATS_ALL_ID
+from services.storage_backend import SQLiteBackend
+
+REPORT = {'district': 'Kamrup', 'status': 'reported', 'active': True}
+
+
+@pytest.fixture
+def service():
+    return FirebaseService(backend=SQLiteBackend(':memory:'))
+
+
+def test_empty_database_counts_from_zero(service):
+    assert service.get_report_statistics()['all'] == {'totalReports': 0, 'activeReports': 0, 'cleanAreas': 0}
+    service.add_water_quality_report(dict(REPORT))
+    service._invalidate_report_cache()
+    assert service.get_report_statistics()['all']['totalReports'] == 1
+
+
+def test_existing_reports_need_a_rebuild(service):
+    # A report saved before the counters existed, then one saved after
+    service.backend.set('water_quality_reports', 'old', {'district': 'Kamrup', 'status': 'cleaned'})
+    service.add_water_quality_report(dict(REPORT))
+    assert service.backend.get(STATS_COLLECTION, STATS_ALL_ID)['totalReports'] == 1
+    with pytest.raises(ReportStatsMissingError):
+        service.get_report_statistics()
+
+    service.rebuild_report_stats()
+    assert service.get_report_statistics()['all'] == {'totalReports': 2, 'activeReports': 1, 'cleanAreas': 1}
+
+
+def test_rebuild_drops_stale_districts(service):
+    service.backend.set(STATS_COLLECTION, 'Gone', {'district': 'Gone', 'totalReports': -3})
+    service.add_water_quality_report(dict(REPORT))
+    service.rebuild_report_stats()
+    assert service.backend.get(STATS_COLLECTION, 'Gone') is None
+    assert list(service.get_report_statistics()['districts']) == ['Kamrup']
+
+
+def test_bulk_status_update_moves_counters_once(service):
+    service.get_report_statistics()
+    ids = [service.add_water_quality_report(dict(REPORT)) for _ in range(3)]
+    extra = [('set', 'lab_assignments', 'a1', {'reportIds': ids})]
+
+    assert service.bulk_update_report_status(ids + ['missing'], 'cleaned', extra_writes=extra) == ids
+    # Applying the same change again finds the new status and changes nothing
+    assert service.bulk_update_report_status(ids, 'cleaned') == ids
+
+    service._invalidate_report_cache()
+    assert service.get_report_statistics()['all'] == {'totalReports': 3, 'activeReports': 0, 'cleanAreas': 3}
+    assert service.backend.get('lab_assignments', 'a1') == {'reportIds': ids}
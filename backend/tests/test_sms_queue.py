@@ -0,0 +1,166 @@
+"""
+SMS queue leases, retries and replays against a temp-file queue
+"""
+
+import os
+
+os.environ.setdefault('STORAGE_BACKEND', 'memory')
+os.environ.setdefault('LIVE_VIEW_ENABLED', '0')
+
+import pytest
+from flask import Flask
+
+from services import sms_queue
+from services.sms_queue import SmsQueue, SmsIngester, QueueFullError, PENDING, PROCESSING, DONE, REJECTED, FAILED
+
+VALID_SMS = 'PIN CODE: 781014\nISSUE: Muddy water\nSOURCE: Tube well\nDESCRIPTION: Brown since Monday'
+
+
+class FakeClock:
+    """Stands in for the time module so leases and backoff expire on demand"""
+
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class FakeWriter:
+    """write_reports stand-in that fails a set number of times, then stores the reports"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = 0
+        self.saved = {}
+
+    def __call__(self, reports):
+        self.calls += 1
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('backend unavailable')
+        self.saved.update(reports)
+        return list(reports)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(sms_queue, 'time', fake)
+    return fake
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    return SmsQueue(str(tmp_path / 'sms_queue.db'), lease=60.0)
+
+
+def status_of(queue, queue_id):
+    return queue._conn.execute('SELECT status, attempts FROM sms_messages WHERE id = ?', (queue_id, )).fetchone()
+
+
+def test_external_id_is_queued_once(queue):
+    first = queue.enqueue(VALID_SMS, sender='+911', provider='twilio', external_id='SM1')
+    again = queue.enqueue(VALID_SMS, sender='+911', provider='twilio', external_id='SM1')
+    other = queue.enqueue(VALID_SMS, sender='+911', provider='twilio')
+
+    assert again == (first[0], first[1], True)
+    assert other[2] is False and other[1] != first[1]
+    assert queue.metrics()['backlog'] == 2
+
+
+def test_expired_lease_is_claimed_again(queue, clock):
+    queue_id, report_id, _ = queue.enqueue(VALID_SMS)
+
+    assert [(m['id'], m['attempts']) for m in queue.claim(10)] == [(queue_id, 1)]
+    assert queue.claim(10) == []
+    clock.advance(61)
+    reclaimed = queue.claim(10)
+    assert [(m['id'], m['report_id'], m['attempts']) for m in reclaimed] == [(queue_id, report_id, 2)]
+
+
+def test_message_that_keeps_expiring_is_failed(queue, clock):
+    queue_id, _, _ = queue.enqueue(VALID_SMS)
+    for _ in range(2):
+        assert queue.claim(10, max_attempts=2)
+        clock.advance(61)
+
+    assert queue.claim(10, max_attempts=2) == []
+    assert status_of(queue, queue_id) == (FAILED, 2)
+    assert 'Lease expired' in queue.failed()[0]['error']
+
+
+def test_failed_write_backs_off_then_fails(queue, clock):
+    queue_id, _, _ = queue.enqueue(VALID_SMS)
+    writer = FakeWriter(failures=10)
+    ingester = SmsIngester(queue, writer, max_attempts=3, retry_delay=5.0)
+
+    assert ingester.process_batch() == 1
+    assert status_of(queue, queue_id) == (PENDING, 1)
+    clock.advance(4)
+    assert ingester.process_batch() == 0
+    clock.advance(1)
+    assert ingester.process_batch() == 1
+    # Second failure waits twice as long
+    clock.advance(9)
+    assert ingester.process_batch() == 0
+    clock.advance(1)
+    assert ingester.process_batch() == 1
+
+    assert status_of(queue, queue_id) == (FAILED, 3)
+    assert writer.calls == 3 and ingester.write_failures == 3
+    clock.advance(3600)
+    assert ingester.process_batch() == 0
+
+
+def test_replay_writes_under_the_same_report_id(queue, clock):
+    queue_id, report_id, _ = queue.enqueue(VALID_SMS, sender='+911')
+    writer = FakeWriter(failures=1)
+    ingester = SmsIngester(queue, writer, max_attempts=1)
+
+    ingester.process_batch()
+    assert status_of(queue, queue_id) == (FAILED, 1)
+
+    assert queue.replay() == 1
+    assert status_of(queue, queue_id) == (PENDING, 0)
+    ingester.process_batch()
+    assert status_of(queue, queue_id) == (DONE, 1)
+    assert list(writer.saved) == [report_id]
+    assert writer.saved[report_id]['reportedBy'] == 'SMS:+911'
+
+
+def test_invalid_messages_are_rejected(queue):
+    bad_id, _, _ = queue.enqueue('hello there')
+    good_id, good_report, _ = queue.enqueue(VALID_SMS)
+    writer = FakeWriter()
+
+    assert SmsIngester(queue, writer).process_batch() == 2
+    assert status_of(queue, bad_id)[0] == REJECTED
+    assert status_of(queue, good_id)[0] == DONE
+    assert list(writer.saved) == [good_report]
+    assert queue.replay(statuses=(REJECTED, )) == 1
+    assert status_of(queue, bad_id) == (PENDING, 0)
+
+
+def test_full_queue_asks_the_gateway_to_retry(tmp_path, clock, monkeypatch):
+    from routes import reporting
+
+    queue = SmsQueue(str(tmp_path / 'sms_queue.db'), max_depth=1)
+    queue.enqueue(VALID_SMS)
+    with pytest.raises(QueueFullError):
+        queue.enqueue(VALID_SMS)
+
+    monkeypatch.setattr(reporting, 'get_sms_ingester', lambda: SmsIngester(queue, FakeWriter()))
+    app = Flask(__name__)
+    app.register_blueprint(reporting.reporting_bp, url_prefix='/api/reporting')
+    response = app.test_client().post('/api/reporting/sms/webhook', json={'from': '+911', 'message': VALID_SMS})
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(reporting.SMS_QUEUE_RETRY_AFTER)
+    assert queue.metrics()['counts'][PROCESSING] == 0 and queue.metrics()['backlog'] == 1
@@ -0,0 +1,51 @@
+"""
+The single-pass SMS tokenizer against the previous per-field parser
+"""
+
+import pytest
+
+from scripts.benchmark_sms import baseline_parse_sms, build_corpus, same_fields, COMPARED_FIELDS
+from services.sms_service import parse_sms_batch, parse_sms_report
+
+# Free text containing key words followed by ':' that the old parser kept whole
+FREE_TEXT = [
+    'PIN CODE: 781014\nISSUE: Muddy water\nSOURCE: Tube well\nDESCRIPTION: water near the source: river is bad',
+    'PIN CODE: 781014\nISSUE: Pipe broken at location: school\nSOURCE: Piped water supply',
+    'PIN CODE: 781014\nISSUE: Bad smell (problem: since Monday)\nSOURCE: Handpump\nDESCRIPTION: issue: since Monday',
+    'PIN: 781001 ISSUE: Muddy water SOURCE: Handpump',
+    'PIN CODE: 781006\nLOCATION: Near the pin code: 781007 office\nISSUE: Metallic taste\nSOURCE: Dug well'
+]
+
+
+@pytest.mark.parametrize('sms_text', FREE_TEXT)
+def test_free_text_matches_baseline(sms_text):
+    old = baseline_parse_sms(sms_text)
+    new = parse_sms_report(sms_text)
+    assert old['success'] and new['success']
+    assert {field: new['data'][field] for field in COMPARED_FIELDS} == \
+        {field: old['data'][field] for field in COMPARED_FIELDS}
+
+
+def test_free_text_values_kept_whole():
+    data = parse_sms_report(FREE_TEXT[0])['data']
+    assert data['description'] == 'water near the source: river is bad'
+    assert parse_sms_report(FREE_TEXT[1])['data']['problem'] == 'Pipe broken at location: school'
+
+
+def test_separated_fields_on_one_line():
+    data = parse_sms_report('PIN CODE: 781014, ISSUE: Health symptoms, SOURCE: Tube well')['data']
+    assert (data['pinCode'], data['problem'], data['sourceType']) == ('781014', 'Health symptoms', 'Tube well')
+
+
+def test_lower_case_with_crlf():
+    data = parse_sms_report('pin code:786001\r\nproblem: pungent smell\r\nsource type : river water\r\nlocation: Rangia')['data']
+    assert (data['pinCode'], data['problem'], data['sourceType'], data['localityName']) == \
+        ('786001', 'pungent smell', 'river water', 'Rangia')
+
+
+def test_corpus_only_differs_where_baseline_failed():
+    corpus = build_corpus(2000)
+    for sms_text, new in zip(corpus, parse_sms_batch(corpus)):
+        old = baseline_parse_sms(sms_text)
+        if not same_fields(old, new):
+            assert not old['success'] and new['success'], sms_text
@@ -1,4 +1,4 @@
-import { MapContainer, TileLayer, Marker, Popup, CircleMarker } from 'react-leaflet'
+import { MapContainer, TileLayer, Marker, Popup, CircleMarker, useMap, useMapEvents } from 'react-leaflet'
 import L from 'leaflet'
 import { useEffect, useRef } from 'react'
 import 'leaflet/dist/leaflet.css'
@@ -11,7 +11,18 @@ L.Icon.Default.mergeOptions({
   shadowUrl: 'https://cdnjs.cloudflare.com/ajax/libs/leaflet/1.7.1/images/marker-shadow.png',
 })
 
-export default function HotspotMap({ hotspots = [], userLocation = null }) {
+// Reports the current zoom and bounds so the server can cluster markers for this view
+function ViewWatcher({ onViewChange }) {
+  const map = useMap()
+  const report = () => onViewChange({ zoom: map.getZoom(), bbox: map.getBounds().toBBoxString() })
+
+  useMapEvents({ moveend: report })
+  useEffect(() => { report() }, [])
+
+  return null
+}
+
+export default function HotspotMap({ hotspots = [], userLocation = null, onViewChange = null }) {
   const mapRef = useRef(null)
 
   // Calculate center of map based on hotspots or user location
@@ -82,6 +93,37 @@ export default function HotspotMap({ hotspots = [], userLocation = null }) {
     })
   }
 
+  // Create icon for a cluster of several reports, labelled with its count
+  const createClusterIcon = (hotspot) => {
+    const color = hotspot.isActive ? '#dc2626' : '#16a34a'
+    const border = hotspot.isActive ? '#991b1b' : '#15803d'
+    const size = Math.min(30 + Math.log10(hotspot.count) * 10, 60)
+    return L.divIcon({
+      className: 'custom-marker',
+      html: `
+        <div style="
+          width: ${size}px;
+          height: ${size}px;
+          background-color: ${color};
+          border: 3px solid ${border};
+          border-radius: 50%;
+          display: flex;
+          align-items: center;
+          justify-content: center;
+          color: white;
+          font-weight: bold;
+          font-size: 13px;
+          cursor: pointer;
+        ">
+          ${hotspot.count}
+        </div>
+      `,
+      iconSize: [size, size],
+      iconAnchor: [size / 2, size / 2],
+      popupAnchor: [0, -size / 2],
+    })
+  }
+
   // Create user location icon
   const createUserIcon = () => {
     return L.divIcon({
@@ -119,6 +161,8 @@ export default function HotspotMap({ hotspots = [], userLocation = null }) {
           style={{ height: '500px', width: '100%' }}
           ref={mapRef}
         >
+          {onViewChange && <ViewWatcher onViewChange={onViewChange} />}
+
           <TileLayer
             url="https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png"
             attribution='&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a>'
@@ -140,17 +184,37 @@ export default function HotspotMap({ hotspots = [], userLocation = null }) {
             </Marker>
           )}
 
-          {/* Hotspot Markers */}
-          {hotspots.map((hotspot, index) => (
+          {/* Hotspot Markers (clusters from the server show their report count) */}
+          {hotspots.map((hotspot, index) => hotspot.count > 1 ? (
             <Marker
-              key={`${hotspot.id}-${index}`}
+              key={`${hotspot.geohash}-${index}`}
+              position={[hotspot.latitude, hotspot.longitude]}
+              icon={createClusterIcon(hotspot)}
+            >
+              <Popup className={hotspot.isActive ? 'bg-red-50' : 'bg-green-50'}>
+                <div className="text-sm min-w-48">
+                  <p className="font-bold text-gray-800">{hotspot.count} reports in this area</p>
+                  <hr className="my-2" />
+                  <p className="text-red-600">🔴 {hotspot.activeCount} contaminated</p>
+                  <p className="text-green-600">🟢 {hotspot.count - hotspot.activeCount} clean</p>
+                  <p className="text-gray-700">
+                    <span className="font-semibold">Worst severity:</span> {hotspot.worstSeverity || 'N/A'}
+                  </p>
+                  <p className="text-gray-600 text-xs mt-2">Zoom in to see individual reports</p>
+                </div>
+              </Popup>
+            </Marker>
+          ) : (
+            <Marker
+              key={`${hotspot.id || hotspot.geohash}-${index}`}
               position={[hotspot.latitude, hotspot.longitude]}
               icon={hotspot.isActive ? createContaminatedIcon() : createCleanIcon()}
             >
               <Popup className={hotspot.isActive ? 'bg-red-50' : 'bg-green-50'}>
                 <div className="text-sm min-w-48">
                   <p className={`font-bold ${hotspot.isActive ? 'text-red-600' : 'text-green-600'}`}>
-                    {hotspot.areaName || 'Unknown Area'}
+                    {/* A server cluster holding one report has no area name or status of its own */}
+                    {hotspot.count === 1 ? '1 report in this area' : hotspot.areaName || 'Unknown Area'}
                   </p>
                   <hr className="my-2" />
                   <p className="text-gray-700">
@@ -160,14 +224,16 @@ export default function HotspotMap({ hotspots = [], userLocation = null }) {
                     </span>
                   </p>
                   <p className="text-gray-700">
-                    <span className="font-semibold">Severity:</span> {hotspot.severity || 'N/A'}
+                    <span className="font-semibold">Severity:</span> {hotspot.severity || hotspot.worstSeverity || 'N/A'}
                   </p>
                   <p className="text-gray-600 text-xs mt-2">
                     📍 {hotspot.latitude.toFixed(4)}, {hotspot.longitude.toFixed(4)}
                   </p>
-                  <p className="text-gray-600 text-xs">
-                    Status: {hotspot.status || 'unknown'}
-                  </p>
+                  {hotspot.count !== 1 && (
+                    <p className="text-gray-600 text-xs">
+                      Status: {hotspot.status || 'unknown'}
+                    </p>
+                  )}
                 </div>
               </Popup>
             </Marker>
@@ -11,40 +11,9 @@ export default function LandingPage() {
   const [statistics, setStatistics] = useState({})
   const [userLocation, setUserLocation] = useState(null)
   const [showStatusPopup, setShowStatusPopup] = useState(true)
-  const [contaminatedAreas, setContaminatedAreas] = useState([])
   const [nearbyContaminatedAreas, setNearbyContaminatedAreas] = useState([])
   const [locationStatus, setLocationStatus] = useState('loading') // loading, granted, denied
 
-  // Haversine distance calculation (in km)
-  const calculateDistance = (lat1, lon1, lat2, lon2) => {
-    // Validate inputs
-    if (typeof lat1 !== 'number' || typeof lon1 !== 'number' || 
-        typeof lat2 !== 'number' || typeof lon2 !== 'number') {
-      console.error('Invalid coordinate types:', { lat1, lon1, lat2, lon2 })
-      return Infinity
-    }
-    
-    // Validate coordinate ranges
-    if (Math.abs(lat1) > 90 || Math.abs(lon1) > 180 || 
-        Math.abs(lat2) > 90 || Math.abs(lon2) > 180) {
-      console.error('Coordinates out of valid range:', { lat1, lon1, lat2, lon2 })
-      return Infinity
-    }
-    
-    const R = 6371 // Earth radius in km
-    const dLat = (lat2 - lat1) * Math.PI / 180
-    const dLon = (lon2 - lon1) * Math.PI / 180
-    const a = Math.sin(dLat/2) * Math.sin(dLat/2) +
-              Math.cos(lat1 * Math.PI / 180) * Math.cos(lat2 * Math.PI / 180) *
-              Math.sin(dLon/2) * Math.sin(dLon/2)
-    const c = 2 * Math.atan2(Math.sqrt(a), Math.sqrt(1-a))
-    const distance = R * c
-    
-    console.debug(`Distance calc: (${lat1},${lon1}) to (${lat2},${lon2}) = ${distance.toFixed(3)}km`)
-    
-    return distance
-  }
-
   useEffect(() => {
     // Get user's location for contamination alerts
     if (navigator.geolocation) {
@@ -72,13 +41,12 @@ export default function LandingPage() {
     fetchActiveReports()
     fetchReportedIssues()
     fetchStatistics()
-    fetchContaminatedAreas()
   }, [])
 
-  // Refetch contaminated areas when user location updates
+  // Fetch nearby contamination alerts once the user location is known
   useEffect(() => {
     if (userLocation) {
-      fetchContaminatedAreas()
+      fetchNearbyContaminatedAreas()
     }
   }, [userLocation])
 
@@ -113,8 +81,10 @@ export default function LandingPage() {
 
   const fetchReportedIssues = async () => {
     try {
-      const response = await api.get('/reporting/reported-issues')
-      setReportedIssues(Object.values(response.data.data || {}))
+      const response = await api.get('/reporting/reported-issues', {
+        params: { limit: 5 }
+      })
+      setReportedIssues(response.data.issues || [])
     } catch (error) {
       console.error('Error fetching reported issues:', error)
       console.error('Backend error details:', error.response?.data)
@@ -137,63 +107,17 @@ export default function LandingPage() {
     }
   }
 
-  const fetchContaminatedAreas = async () => {
+  const fetchNearbyContaminatedAreas = async () => {
     try {
-      const response = await api.get('/phc/contaminated-areas')
-      const areas = Object.values(response.data.data || [])
-      
-      console.log('📍 Contaminated areas fetched:', areas.length, areas)
-      setContaminatedAreas(areas)
-      
-      // Filter areas within 2km of user location
-      if (userLocation) {
-        console.log('👤 User location:', userLocation)
-        
-        if (areas.length === 0) {
-          console.log('⚠️ No contaminated areas available')
-          setNearbyContaminatedAreas([])
-          return
-        }
-        
-        const nearby = []
-        areas.forEach(area => {
-          // Check if coordinates exist
-          if (typeof area.latitude !== 'number' || typeof area.longitude !== 'number') {
-            console.warn(`❌ Invalid coordinates for PIN ${area.pinCode}:`, { 
-              lat: area.latitude, 
-              lon: area.longitude,
-              latType: typeof area.latitude,
-              lonType: typeof area.longitude
-            })
-            return
-          }
-          
-          // Calculate distance
-          const distance = calculateDistance(
-            userLocation.latitude,
-            userLocation.longitude,
-            area.latitude,
-            area.longitude
-          )
-          
-          console.log(`📌 PIN ${area.pinCode}: ${distance.toFixed(2)}km from user`)
-          
-          if (distance <= 2) {
-            area.distance = distance
-            nearby.push(area)
-            console.log(`✅ PIN ${area.pinCode} - WITHIN 2KM RADIUS - Adding to alerts`)
-          } else {
-            console.log(`❌ PIN ${area.pinCode} - Outside 2km (${distance.toFixed(2)}km)`)
-          }
-        })
-        
-        console.log(`🎯 Final nearby contaminated areas: ${nearby.length}`, nearby)
-        setNearbyContaminatedAreas(nearby)
-      } else {
-        console.log('⏳ User location not yet available')
-      }
+      // Only areas within 2km are returned, nearest first, with their distance
+      const response = await api.get('/phc/alerts-near', {
+        params: { latitude: userLocation.latitude, longitude: userLocation.longitude, radius: 2 }
+      })
+      const nearby = response.data.data || []
+      console.log(`🎯 Nearby contaminated areas: ${nearby.length}`, nearby)
+      setNearbyContaminatedAreas(nearby)
     } catch (error) {
-      console.error('Error fetching contaminated areas:', error)
+      console.error('Error fetching nearby contaminated areas:', error)
       console.error('Response data:', error.response?.data)
     }
   }
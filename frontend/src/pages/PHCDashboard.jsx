@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import { useNavigate } from 'react-router-dom'
 import { LogOut, AlertTriangle, CheckCircle, MapPin, FileText, Droplet } from 'lucide-react'
 import api from '../api'
@@ -12,6 +12,7 @@ export default function PHCDashboard() {
   const [activeReports, setActiveReports] = useState([])
   const [previousSolutions, setPreviousSolutions] = useState([])
   const [hotspots, setHotspots] = useState([])
+  const mapView = useRef({ zoom: 11, bbox: null })
   const [reportedIssues, setReportedIssues] = useState([])
   const [statistics, setStatistics] = useState({})
   const [areaStatus, setAreaStatus] = useState('loading')
@@ -38,12 +39,9 @@ export default function PHCDashboard() {
       })
     }
     
-    fetchActiveReports()
-    fetchPreviousSolutions()
+    fetchDashboard()
     fetchHotspots()
     fetchReportedIssues()
-    fetchStatistics()
-    fetchSentToLabPins()
 
     // Auto-refresh hotspots every 30 seconds
     const hotspotsInterval = setInterval(() => {
@@ -63,13 +61,34 @@ export default function PHCDashboard() {
     }
   }, [])
 
+  // Active reports, solutions, contaminated areas and statistics in one request
+  const fetchDashboard = async () => {
+    try {
+      const response = await api.get(`/phc/dashboard/${userDistrict}`)
+      showActiveReports(response.data.activeReports)
+      showPreviousSolutions(response.data.previousSolutions)
+      showSentToLabPins(response.data.contaminatedAreas)
+      setStatistics(response.data.statistics || {})
+    } catch (err) {
+      console.error('Error fetching dashboard, loading sections separately:', err)
+      fetchActiveReports()
+      fetchPreviousSolutions()
+      fetchStatistics()
+      fetchSentToLabPins()
+    }
+  }
+
+  const showSentToLabPins = (areas) => {
+    const pins = Object.values(areas || {}).map(area => area.pinCode)
+    console.log('✅ Sent to lab PINs updated:', pins)
+    setSentToLabPins(pins)
+  }
+
   const fetchSentToLabPins = async () => {
     try {
       console.log('📤 Fetching PINs already sent to lab...')
       const response = await api.get('/phc/contaminated-areas')
-      const pins = Object.values(response.data.data || {}).map(area => area.pinCode)
-      console.log('✅ Sent to lab PINs updated:', pins)
-      setSentToLabPins(pins)
+      showSentToLabPins(response.data.data)
     } catch (err) {
       console.error('❌ Error fetching sent to lab PINs:', err)
     }
@@ -80,57 +99,65 @@ export default function PHCDashboard() {
       console.log('Fetching active reports for district:', userDistrict)
       const response = await api.get(`/phc/active-reports/${userDistrict}`)
       console.log('Active reports response:', response.data)
-      const reports = Object.entries(response.data.data || {}).map(([id, data]) => ({
-        id,
-        ...data
-      }))
-      console.log('Processed reports:', reports)
-      
-      // Group reports by PIN code
-      const grouped = reports.reduce((acc, report) => {
-        const pinCode = report.pinCode || 'Unknown'
-        if (!acc[pinCode]) {
-          acc[pinCode] = {
-            pinCode,
-            locality: report.localityName,
-            district: report.district,
-            reports: [],
-            count: 0,
-            severity: 'none'
-          }
-        }
-        acc[pinCode].reports.push(report)
-        acc[pinCode].count++
-        
-        // Calculate severity based on count
-        if (acc[pinCode].count >= 20) {
-          acc[pinCode].severity = 'severe'
-        } else if (acc[pinCode].count >= 10) {
-          acc[pinCode].severity = 'medium'
-        } else if (acc[pinCode].count >= 5) {
-          acc[pinCode].severity = 'mild'
-        }
-        
-        return acc
-      }, {})
-      
-      console.log('Grouped by PIN code:', grouped)
-      setActiveReports(Object.values(grouped))
+      showActiveReports(response.data.data)
     } catch (err) {
       console.error('Error fetching active reports:', err)
       setError('Failed to load active reports')
     }
   }
 
+  const showActiveReports = (data) => {
+    const reports = Object.entries(data || {}).map(([id, report]) => ({
+      id,
+      ...report
+    }))
+    console.log('Processed reports:', reports)
+    
+    // Group reports by PIN code
+    const grouped = reports.reduce((acc, report) => {
+      const pinCode = report.pinCode || 'Unknown'
+      if (!acc[pinCode]) {
+        acc[pinCode] = {
+          pinCode,
+          locality: report.localityName,
+          district: report.district,
+          reports: [],
+          count: 0,
+          severity: 'none'
+        }
+      }
+      acc[pinCode].reports.push(report)
+      acc[pinCode].count++
+    
+      // Calculate severity based on count
+      if (acc[pinCode].count >= 20) {
+        acc[pinCode].severity = 'severe'
+      } else if (acc[pinCode].count >= 10) {
+        acc[pinCode].severity = 'medium'
+      } else if (acc[pinCode].count >= 5) {
+        acc[pinCode].severity = 'mild'
+      }
+    
+      return acc
+    }, {})
+    
+    console.log('Grouped by PIN code:', grouped)
+    setActiveReports(Object.values(grouped))
+  }
+
+  const showPreviousSolutions = (data) => {
+    setPreviousSolutions(Object.entries(data || {}).map(([id, solution]) => ({
+      id,
+      ...solution
+    })))
+  }
+
   const fetchPreviousSolutions = async () => {
     try {
       const response = await api.get('/phc/previous-solutions', {
         params: { district: userDistrict }
       })
-      setPreviousSolutions(Object.entries(response.data.data || {}).map(([id, data]) => ({
-        id,
-        ...data
-      })))
+      showPreviousSolutions(response.data.data)
     } catch (err) {
       console.error('Error fetching solutions:', err)
     }
@@ -138,8 +165,10 @@ export default function PHCDashboard() {
 
   const fetchHotspots = async () => {
     try {
+      // Clustered for the current map view, so the payload is bounded by screen area
+      const { zoom, bbox } = mapView.current
       const response = await api.get('/phc/hotspot-map', {
-        params: { district: userDistrict }
+        params: { district: userDistrict, zoom, ...(bbox ? { bbox } : {}) }
       })
       setHotspots(response.data.data || [])
     } catch (err) {
@@ -548,15 +577,22 @@ export default function PHCDashboard() {
             
             {/* Map Section */}
             <div className="mb-8">
-              <HotspotMap hotspots={hotspots} userLocation={userLocation} />
+              <HotspotMap
+                hotspots={hotspots}
+                userLocation={userLocation}
+                onViewChange={(view) => {
+                  mapView.current = view
+                  fetchHotspots()
+                }}
+              />
               <div className="mt-4 grid grid-cols-2 md:grid-cols-4 gap-4 text-sm">
                 <div className="bg-red-50 p-3 rounded-lg border border-red-200">
                   <p className="text-red-600 font-bold">🔴 Contaminated</p>
-                  <p className="text-red-700">{hotspots.filter(h => h.isActive).length} areas</p>
+                  <p className="text-red-700">{hotspots.reduce((sum, h) => sum + h.activeCount, 0)} reports</p>
                 </div>
                 <div className="bg-green-50 p-3 rounded-lg border border-green-200">
                   <p className="text-green-600 font-bold">🟢 Clean</p>
-                  <p className="text-green-700">{hotspots.filter(h => !h.isActive).length} areas</p>
+                  <p className="text-green-700">{hotspots.reduce((sum, h) => sum + h.count - h.activeCount, 0)} reports</p>
                 </div>
                 <div className="bg-blue-50 p-3 rounded-lg border border-blue-200">
                   <p className="text-blue-600 font-bold">📍 Your Location</p>
@@ -564,7 +600,7 @@ export default function PHCDashboard() {
                 </div>
                 <div className="bg-gray-50 p-3 rounded-lg border border-gray-200">
                   <p className="text-gray-600 font-bold">📊 Total Areas</p>
-                  <p className="text-gray-700">{hotspots.length} hotspots</p>
+                  <p className="text-gray-700">{hotspots.length} areas</p>
                 </div>
               </div>
             </div>
@@ -575,18 +611,19 @@ export default function PHCDashboard() {
               {hotspots.length > 0 ? (
                 <div className="grid grid-cols-1 md:grid-cols-2 gap-6">
                   {hotspots.map(hotspot => (
-                    <div key={hotspot.id} className="card">
+                    <div key={hotspot.geohash} className="card">
                       <div className="flex items-center gap-3 mb-3">
                         <MapPin className={hotspot.isActive ? 'text-red-600' : 'text-green-600'} />
-                        <h3 className="font-bold text-lg text-gray-800">{hotspot.areaName || 'Unknown Area'}</h3>
+                        <h3 className="font-bold text-lg text-gray-800">
+                          {hotspot.count} {hotspot.count === 1 ? 'report' : 'reports'}
+                        </h3>
                       </div>
                       <div className="space-y-2 text-sm text-gray-600 mb-4">
                         <p>📍 Lat: {hotspot.latitude.toFixed(4)}, Lon: {hotspot.longitude.toFixed(4)}</p>
-                        <p>⚠️ Severity: {hotspot.severity || 'N/A'}</p>
+                        <p>⚠️ Worst severity: {hotspot.worstSeverity || 'N/A'}</p>
                         <p className={`font-medium ${hotspot.isActive ? 'text-red-600' : 'text-green-600'}`}>
-                          {hotspot.isActive ? '🔴 Active Contamination' : '🟢 Clean'}
+                          {hotspot.isActive ? `🔴 ${hotspot.activeCount} Active Contamination` : '🟢 Clean'}
                         </p>
-                        <p className="text-xs text-gray-500">Status: {hotspot.status || 'unknown'}</p>
                       </div>
                     </div>
                   ))}
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import { useNavigate } from 'react-router-dom'
 import { AlertCircle, Droplet, Copy, MessageSquare, CheckCircle } from 'lucide-react'
 import api from '../api'
@@ -23,6 +23,8 @@ export default function ReportingPage() {
   const [smsSubmitting, setSmsSubmitting] = useState(false)
   const [smsSuccess, setSmsSuccess] = useState(false)
   const [smsError, setSmsError] = useState('')
+  const [localitySuggestions, setLocalitySuggestions] = useState([])
+  const chosenLocality = useRef('')
 
   const assam_districts = [
     'Assam', 'Barpeta', 'Bongaigaon', 'Cachar', 'Darrang',
@@ -57,6 +59,37 @@ export default function ReportingPage() {
     }))
   }
 
+  // Suggest PIN codes while the locality is typed
+  useEffect(() => {
+    const query = formData.localityName.trim()
+    if (query.length < 2 || formData.localityName === chosenLocality.current) {
+      setLocalitySuggestions([])
+      return
+    }
+    const timer = setTimeout(async () => {
+      try {
+        const response = await api.get('/phc/pincode/search/autocomplete', {
+          params: { q: query, limit: 8 }
+        })
+        setLocalitySuggestions(response.data.data || [])
+      } catch (err) {
+        setLocalitySuggestions([])
+      }
+    }, 150)
+    return () => clearTimeout(timer)
+  }, [formData.localityName])
+
+  const selectLocality = (suggestion) => {
+    chosenLocality.current = suggestion.locality
+    setFormData(prev => ({
+      ...prev,
+      pinCode: suggestion.pincode,
+      localityName: suggestion.locality,
+      district: assam_districts.includes(suggestion.district) ? suggestion.district : prev.district
+    }))
+    setLocalitySuggestions([])
+  }
+
   const generateSMSFormat = async () => {
     try {
       const response = await api.post('/reporting/sms/format', formData)
@@ -236,7 +269,7 @@ export default function ReportingPage() {
             </div>
 
             {/* Locality Name */}
-            <div>
+            <div className="relative">
               <label className="block text-sm font-medium text-gray-700 mb-2">
                 Locality Name *
               </label>
@@ -245,10 +278,28 @@ export default function ReportingPage() {
                 name="localityName"
                 value={formData.localityName}
                 onChange={handleInputChange}
+                onBlur={() => setTimeout(() => setLocalitySuggestions([]), 150)}
                 placeholder="Enter locality name"
+                autoComplete="off"
                 className="w-full px-4 py-2 border border-gray-300 rounded-lg focus:outline-none focus:ring-2 focus:ring-blue-500"
                 required
               />
+              {localitySuggestions.length > 0 && (
+                <ul className="absolute z-10 w-full mt-1 bg-white border border-gray-300 rounded-lg shadow-lg max-h-60 overflow-y-auto">
+                  {localitySuggestions.map(suggestion => (
+                    <li key={suggestion.pincode}>
+                      <button
+                        type="button"
+                        onClick={() => selectLocality(suggestion)}
+                        className="w-full text-left px-4 py-2 hover:bg-blue-50"
+                      >
+                        <span className="font-medium">{suggestion.locality}</span>
+                        <span className="text-sm text-gray-500"> · {suggestion.pincode} · {suggestion.district}</span>
+                      </button>
+                    </li>
+                  ))}
+                </ul>
+              )}
             </div>
 
             {/* District */}